@@ -8,9 +8,15 @@ Project: Jugando y Educando WhatsApp Bot Management
 """
 
 import streamlit as st
-from config.firebase import initialize_firebase
-from components.sidebar import render_sidebar
-from components.chat_view import render_chat_view, render_empty_state
+from config.firebase import check_firebase_connection, get_backend
+from config.settings import get_setting, get_bool_setting, get_float_setting
+from components.sidebar import render_sidebar, get_pending_list_filters, CONVERSATIONS_PAGE_SIZE
+from components.chat_view import render_chat_view, render_empty_state, MESSAGES_PAGE_SIZE
+from services.firebase_service import get_read_cache_stats
+from services.firebase_service_async import prefetch_dashboard_data
+from services.realtime_cache import get_realtime_cache
+from services.storage import get_storage
+from services.usage import UsageStats, start_rerun, write_metrics_file
 import utils.styles
 import importlib
 importlib.reload(utils.styles)
@@ -39,8 +45,11 @@ def initialize_app():
     Sets up Firebase connection and session state.
     """
     try:
-        # Initialize Firebase
-        initialize_firebase()
+        # Connect to the database and verify credentials once per session
+        if 'firebase_checked' not in st.session_state:
+            if get_storage() is None:
+                check_firebase_connection()
+            st.session_state.firebase_checked = True
 
         # Initialize session state variables if not exist
         if 'selected_phone' not in st.session_state:
@@ -54,6 +63,109 @@ def initialize_app():
         st.stop()
 
 
+def prefetch_data():
+    """
+    Fetch the sidebar list, bucket counts and open conversation concurrently
+    into the read cache, so the components below render from memory.
+    Skipped when the realtime cache already serves them or the read cache
+    is disabled (ASYNC_PREFETCH setting).
+    """
+    if not get_bool_setting('ASYNC_PREFETCH', True):
+        return
+
+    # The async client only talks to Firestore
+    if get_storage() is not None or get_backend() != 'firestore':
+        return
+
+    cache = get_realtime_cache()
+    if cache is not None and cache.is_connected():
+        return
+
+    stats = get_read_cache_stats()
+    if not (stats['maxsize'] and stats['ttl']):
+        return
+
+    prefetch_dashboard_data(
+        filters=get_pending_list_filters(),
+        phone_number=st.session_state.get('selected_phone'),
+        page_size=CONVERSATIONS_PAGE_SIZE,
+        message_limit=MESSAGES_PAGE_SIZE
+    )
+
+
+def finish_usage(rerun_usage):
+    """
+    Add a rerun's Firestore usage to the session totals and refresh the
+    process metrics file (USAGE_METRICS_PATH setting), if configured.
+
+    Args:
+        rerun_usage (UsageStats): Counters of the rerun
+
+    Returns:
+        UsageStats: Session totals
+    """
+    if 'firestore_usage' not in st.session_state:
+        st.session_state.firestore_usage = UsageStats()
+    session_usage = st.session_state.firestore_usage
+    session_usage.merge(rerun_usage)
+
+    metrics_path = get_setting('USAGE_METRICS_PATH')
+    if metrics_path:
+        write_metrics_file(metrics_path, min_interval=get_float_setting('USAGE_METRICS_INTERVAL', 15))
+
+    return session_usage
+
+
+def render_usage_table(usage):
+    """
+    Render per-operation Firestore counters as a table.
+
+    Args:
+        usage (UsageStats): Counters to show
+    """
+    snapshot = usage.snapshot()
+    if not snapshot:
+        st.caption("Sin llamadas a Firestore")
+        return
+
+    rows = [
+        {
+            'Operación': operation,
+            'Llamadas': counters['calls'],
+            'Caché': counters['cache_hits'],
+            'Lecturas': counters['reads'],
+            'Escrituras': counters['writes'],
+            'Errores': counters['errors'],
+            'Tiempo (ms)': round(counters['seconds'] * 1000, 1),
+            'Máx. (ms)': round(counters['max_seconds'] * 1000, 1)
+        }
+        for operation, counters in sorted(snapshot.items())
+    ]
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+    totals = usage.totals()
+    st.caption(
+        f"Total: {totals['reads']} lecturas, {totals['writes']} escrituras, "
+        f"{totals['calls']} llamadas ({totals['cache_hits']} desde caché), "
+        f"{totals['seconds'] * 1000:.1f} ms"
+    )
+
+
+def render_usage_panel(rerun_usage, session_usage):
+    """
+    Debug panel with the documents read and written and the time spent in
+    Firestore by this rerun and this session (USAGE_PANEL setting).
+    """
+    if not get_bool_setting('USAGE_PANEL', False):
+        return
+
+    with st.expander("🔧 Uso de Firestore"):
+        st.markdown("**Esta ejecución**")
+        render_usage_table(rerun_usage)
+        st.markdown("**Sesión**")
+        render_usage_table(session_usage)
+
+
 def render_header():
     """
     Render the main header of the application.
@@ -76,23 +188,35 @@ def main():
     Main application function.
     Orchestrates the entire dashboard interface.
     """
-    # Initialize the app
-    initialize_app()
+    # Count the Firestore reads and writes of this rerun
+    rerun_usage = start_rerun()
+
+    try:
+        # Initialize the app
+        initialize_app()
+
+        # Load this rerun's data in one round trip
+        prefetch_data()
+
+        # Render sidebar (returns selected phone number)
+        selected_phone = render_sidebar()
 
-    # Render sidebar (returns selected phone number)
-    selected_phone = render_sidebar()
+        # Main content area
+        render_header()
 
-    # Main content area
-    render_header()
+        # Render chat view or empty state based on selection
+        if selected_phone:
+            render_chat_view(selected_phone)
+        else:
+            render_empty_state()
 
-    # Render chat view or empty state based on selection
-    if selected_phone:
-        render_chat_view(selected_phone)
-    else:
-        render_empty_state()
+        # Footer
+        render_footer()
+    finally:
+        # Also runs when st.rerun() interrupts the script
+        session_usage = finish_usage(rerun_usage)
 
-    # Footer
-    render_footer()
+    render_usage_panel(rerun_usage, session_usage)
 
 
 if __name__ == "__main__":
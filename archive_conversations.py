@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Conversation Archiver
+Moves conversations resolved more than N days ago from `conversations` to
+`conversations_archive`, with their message history compressed into
+chunked blobs. Archived conversations stay readable from the dashboard and
+are restored automatically when a new message arrives.
+
+Meant to run periodically (e.g. a daily cron job).
+
+Usage:
+    python3 archive_conversations.py                 # ARCHIVE_AFTER_DAYS (default 90)
+    python3 archive_conversations.py --days 30 --limit 1000
+    python3 archive_conversations.py --dry-run       # report only
+"""
+
+import argparse
+from config.firebase import get_db
+from config.settings import get_float_setting
+from services.archive import archive_resolved_conversations
+from services.storage import get_storage
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old resolved conversations")
+    parser.add_argument('--days', type=float, default=get_float_setting('ARCHIVE_AFTER_DAYS', 90),
+                        help="Archive conversations resolved more than this many days ago")
+    parser.add_argument('--limit', type=int, default=None, help="Maximum conversations to archive")
+    parser.add_argument('--dry-run', action='store_true', help="Report without writing")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("  ARCHIVING RESOLVED CONVERSATIONS")
+    print("="*60)
+
+    try:
+        if get_storage() is not None:
+            raise ValueError("Archiving is only available with STORAGE_BACKEND=firestore")
+
+        totals = archive_resolved_conversations(get_db(), args.days, limit=args.limit, dry_run=args.dry_run)
+
+        if args.dry_run:
+            print(f"\n✓ {totals['archived']} conversations older than {args.days:g} days would be archived")
+        else:
+            print(f"\n✓ Archived {totals['archived']} conversations ({totals['messages']} messages)")
+            if totals['raw_bytes']:
+                ratio = totals['packed_bytes'] / totals['raw_bytes']
+                print(f"   History: {totals['raw_bytes']} bytes -> {totals['packed_bytes']} bytes ({ratio:.0%})")
+            if totals['skipped']:
+                print(f"   {totals['skipped']} conversations changed while archiving and were kept")
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+add_message Benchmark
+Compares the original add_message (read the whole conversation document,
+then update or set it) with the current single-commit add_message against
+the configured Firestore project, or offline against the in-memory
+stand-in with a simulated latency per round trip. Uses a scratch
+conversation, seeded with some history, that is deleted afterwards.
+
+Usage:
+    python3 benchmark_add_message.py
+    python3 benchmark_add_message.py --messages 50 --history 1000
+    python3 benchmark_add_message.py --backend memory --latency-ms 20
+"""
+
+import argparse
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from google.cloud import firestore
+from config.firebase import get_db, use_memory_backend
+from services.firebase_service import add_message, add_messages, delete_conversation
+
+
+def baseline_add_message(phone_number, from_type, text, message_id=None):
+    """
+    add_message as it was before the single-commit rewrite (the original
+    services/firebase_service.py): a read of the whole conversation
+    document, messages array included, then an update or a set.
+    """
+    try:
+        if from_type not in ['user', 'bot', 'human']:
+            print(f"[Firebase Service] Invalid from_type: {from_type}")
+            return False
+
+        db = get_db()
+        doc_ref = db.collection('conversations').document(phone_number)
+
+        # Generate message ID if not provided
+        if not message_id:
+            message_id = str(uuid.uuid4())
+
+        # Create message object
+        message = {
+            'from': from_type,
+            'text': text,
+            'timestamp': datetime.now(),
+            'messageId': message_id
+        }
+
+        # Check if conversation exists
+        doc = doc_ref.get()
+
+        if doc.exists:
+            # Append message to existing conversation
+            doc_ref.update({
+                'messages': firestore.ArrayUnion([message]),
+                'lastMessage': datetime.now()
+            })
+        else:
+            # Create new conversation with first message
+            doc_ref.set({
+                'mode': 'bot',
+                'status': 'active',
+                'lastMessage': datetime.now(),
+                'escalatedAt': None,
+                'messages': [message]
+            })
+
+        return True
+
+    except Exception as e:
+        print(f"[Firebase Service] Error adding message: {e}")
+        return False
+
+
+def build_history(label, count):
+    """
+    Build `count` old messages for a scratch conversation.
+    """
+    start = datetime.now() - timedelta(days=1)
+    return [
+        {
+            'from': 'user' if i % 2 == 0 else 'bot',
+            'text': f'{label} history message {i}',
+            'timestamp': start + timedelta(seconds=i),
+            'messageId': f'{label}-history-{i}'
+        }
+        for i in range(count)
+    ]
+
+
+def seed_baseline(phone_number, history):
+    """
+    Seed the scratch conversation as the original layout stored it: every
+    message in the document's array.
+    """
+    if history:
+        get_db().collection('conversations').document(phone_number).set({
+            'mode': 'bot',
+            'status': 'active',
+            'lastMessage': history[-1]['timestamp'],
+            'escalatedAt': None,
+            'messages': history
+        })
+
+
+def seed_current(phone_number, history):
+    """
+    Seed the scratch conversation with the current write path.
+    """
+    if history:
+        add_messages(phone_number, [
+            {'from': m['from'], 'text': m['text'], 'timestamp': m['timestamp'], 'message_id': m['messageId']}
+            for m in history
+        ])
+
+
+def count_round_trips():
+    """
+    Round trips served so far, if the database counts them (memory backend).
+
+    Returns:
+        int: Round trips, or None
+    """
+    get_stats = getattr(get_db(), 'get_stats', None)
+    return get_stats()['round_trips'] if get_stats else None
+
+
+def time_calls(label, func, seed, phone_number, count, history):
+    """
+    Time `count` appends to a fresh scratch conversation holding `history`
+    older messages.
+
+    Returns:
+        tuple: (latencies in milliseconds, round trips per call or None)
+    """
+    delete_conversation(phone_number)
+    seed(phone_number, build_history(label, history))
+
+    latencies = []
+    round_trips = count_round_trips()
+    for i in range(count):
+        start = time.perf_counter()
+        func(phone_number, 'user', f'{label} benchmark message {i}')
+        latencies.append((time.perf_counter() - start) * 1000)
+    if round_trips is not None:
+        round_trips = (count_round_trips() - round_trips) / count
+
+    delete_conversation(phone_number)
+    return latencies, round_trips
+
+
+def report(label, latencies, round_trips):
+    """
+    Print latency statistics and round trips per call.
+    """
+    ordered = sorted(latencies)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    trips = f"{round_trips:4.1f}" if round_trips is not None else " n/a"
+    print(f"  {label:<32} mean {statistics.mean(ordered):7.1f} ms   "
+          f"p50 {statistics.median(ordered):7.1f} ms   p95 {p95:7.1f} ms   "
+          f"round trips/call {trips}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark add_message latency")
+    parser.add_argument('--messages', type=int, default=20, help="Appends per variant")
+    parser.add_argument('--history', type=int, default=200, help="Older messages in the scratch conversation")
+    parser.add_argument('--phone', default='+000000benchmark', help="Scratch conversation ID")
+    parser.add_argument('--backend', choices=['firestore', 'memory'], default='firestore', help="Database to benchmark")
+    parser.add_argument('--latency-ms', type=float, default=None,
+                        help="Simulated latency per round trip (memory backend; default FIRESTORE_LATENCY_MS)")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("  ADD_MESSAGE BENCHMARK")
+    print("="*60)
+
+    try:
+        if args.backend == 'memory':
+            use_memory_backend(latency=args.latency_ms / 1000 if args.latency_ms is not None else None)
+
+        # Warm up the client and gRPC channel
+        get_db().collection('conversations').limit(1).get()
+
+        baseline = time_calls('baseline', baseline_add_message, seed_baseline, args.phone, args.messages, args.history)
+        current = time_calls('current', add_message, seed_current, args.phone, args.messages, args.history)
+
+        print(f"\n{args.messages} appends each, {args.history} older messages:")
+        report("read whole doc + write (before)", *baseline)
+        report("single commit (now)", *current)
+        if baseline[1] is None:
+            print("  (round trips are counted with --backend memory)")
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
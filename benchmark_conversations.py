@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Conversation Read Benchmark
+Times the sidebar and chat-view reads (full list, first pages, bucket
+counts, phone search, conversation summary, message pages) against the
+in-memory Firestore stand-in seeded with many conversations. Runs offline;
+--latency-ms adds a simulated network round trip to every request. The
+stand-in scans instead of using indexes, so its own time grows with the
+collection size; compare round trips and relative costs, not absolutes.
+
+Usage:
+    python3 benchmark_conversations.py
+    python3 benchmark_conversations.py --conversations 100000 --latency-ms 20
+"""
+
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from config.firebase import use_memory_backend
+from services.firebase_service import (
+    MESSAGE_STORAGE_SUBCOLLECTION,
+    MESSAGES_SUBCOLLECTION,
+    build_conversation_summary,
+    build_search_tokens,
+    clear_read_cache,
+    get_all_conversations,
+    get_conversation,
+    get_conversation_counts,
+    get_conversations_page,
+    get_messages_page,
+    message_doc_id
+)
+
+# Writes per seeding batch (Firestore allows at most 500)
+BATCH_SIZE = 400
+
+ALL_BUCKETS = {'buckets': ['bot', 'human', 'resolved']}
+ACTIVE_BUCKETS = {'buckets': ['bot', 'human']}
+
+
+def seed_conversations(db, count, messages_per_conversation):
+    """
+    Write `count` conversations, each with its messages in the subcollection.
+
+    Returns:
+        list: Phone numbers of the seeded conversations
+    """
+    rng = random.Random(42)
+    start = datetime.now() - timedelta(days=30)
+    phones = []
+
+    batch = db.batch()
+    pending = 0
+
+    for i in range(count):
+        phone = f'+549{i:010d}'
+        phones.append(phone)
+        doc_ref = db.collection('conversations').document(phone)
+
+        last = start + timedelta(seconds=rng.randint(0, 30 * 24 * 3600))
+        messages = []
+        for j in range(messages_per_conversation):
+            messages.append({
+                'from': 'user' if j % 2 == 0 else 'bot',
+                'text': f'Mensaje {j} de la conversación {i}',
+                'timestamp': last - timedelta(minutes=messages_per_conversation - j),
+                'messageId': str(uuid.uuid4())
+            })
+
+        status = 'resolved' if rng.random() < 0.3 else 'active'
+        batch.set(doc_ref, {
+            'mode': 'human' if rng.random() < 0.2 else 'bot',
+            'status': status,
+            'lastMessage': last,
+            'escalatedAt': None,
+            'messages': [],
+            'messageStorage': MESSAGE_STORAGE_SUBCOLLECTION,
+            'searchTokens': build_search_tokens(phone),
+            **build_conversation_summary(messages)
+        })
+        for message in messages:
+            message_ref = doc_ref.collection(MESSAGES_SUBCOLLECTION).document(message_doc_id(message['messageId']))
+            batch.set(message_ref, message)
+        pending += 1 + len(messages)
+
+        if pending >= BATCH_SIZE - messages_per_conversation:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    return phones
+
+
+def time_call(func, repeat):
+    """
+    Time `repeat` uncached calls.
+
+    Returns:
+        list: Latencies in milliseconds
+    """
+    latencies = []
+    for _ in range(repeat):
+        clear_read_cache()
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    """
+    Print latency statistics.
+    """
+    ordered = sorted(latencies)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(f"  {label:<28} mean {statistics.mean(ordered):9.1f} ms   "
+          f"p50 {statistics.median(ordered):9.1f} ms   p95 {p95:9.1f} ms")
+
+
+def third_page():
+    page = get_conversations_page(ACTIVE_BUCKETS, page_size=50)
+    page = get_conversations_page(ACTIVE_BUCKETS, page_size=50, cursor=page['next_cursor'])
+    return get_conversations_page(ACTIVE_BUCKETS, page_size=50, cursor=page['next_cursor'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark conversation reads on the in-memory backend")
+    parser.add_argument('--conversations', type=int, default=10000, help="Conversations to seed")
+    parser.add_argument('--messages', type=int, default=5, help="Messages per conversation")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Simulated latency per round trip")
+    parser.add_argument('--repeat', type=int, default=5, help="Calls per measurement")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("  CONVERSATION READ BENCHMARK (in-memory backend)")
+    print("="*60)
+
+    try:
+        # Seed without latency, then measure with it
+        db = use_memory_backend(latency=0)
+
+        start = time.perf_counter()
+        phones = seed_conversations(db, args.conversations, args.messages)
+        print(f"\n✓ Seeded {len(phones)} conversations in {time.perf_counter() - start:.1f} s")
+
+        db.latency = args.latency_ms / 1000
+        phone = phones[len(phones) // 2]
+        search = phone[-6:]
+
+        print(f"\n{args.repeat} uncached calls each, {args.latency_ms:g} ms per round trip:")
+        report("get_all_conversations", time_call(get_all_conversations, args.repeat))
+        report("list first page", time_call(lambda: get_conversations_page(ACTIVE_BUCKETS, page_size=50), args.repeat))
+        report("list third page", time_call(third_page, args.repeat))
+        report("bucket counts", time_call(get_conversation_counts, args.repeat))
+        report("phone search page", time_call(
+            lambda: get_conversations_page({**ALL_BUCKETS, 'search': search}, page_size=50), args.repeat
+        ))
+        report("conversation summary", time_call(lambda: get_conversation(phone, include_messages=False), args.repeat))
+        report("newest messages page", time_call(lambda: get_messages_page(phone, limit=50), args.repeat))
+        report("full conversation", time_call(lambda: get_conversation(phone), args.repeat))
+
+        stats = db.get_stats()
+        print(f"\n  {stats['documents']} documents, {stats['round_trips']} round trips")
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Message Search Index Builder
+Builds or updates the local full-text index used by the sidebar's message
+search.
+
+Usage:
+    python3 build_search_index.py            # index messages since last sync
+    python3 build_search_index.py --rebuild  # re-index every conversation
+"""
+
+import argparse
+from config.firebase import get_db
+from config.settings import get_setting
+from services.firebase_service import get_all_conversations, get_conversation
+from services.search_index import MessageSearchIndex, DEFAULT_INDEX_PATH
+
+
+def iter_conversations():
+    """
+    Yield every conversation with its full message history (both storage
+    layouts), one at a time.
+    """
+    for summary in get_all_conversations():
+        conversation = get_conversation(summary['phone_number'])
+        if conversation:
+            yield conversation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local message search index")
+    parser.add_argument('--rebuild', action='store_true', help="Re-index every conversation")
+    parser.add_argument('--path', default=get_setting('SEARCH_INDEX_PATH', DEFAULT_INDEX_PATH), help="Index file")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("  BUILDING MESSAGE SEARCH INDEX")
+    print("="*60)
+
+    try:
+        index = MessageSearchIndex(args.path)
+
+        if args.rebuild:
+            count = index.rebuild(iter_conversations(), get_db())
+            print(f"\n✓ Indexed {count} messages")
+        else:
+            count = index.sync(get_db())
+            print(f"\n✓ Indexed {count} new messages")
+
+        stats = index.get_stats()
+        print(f"  {stats['messages']} messages from {stats['conversations']} conversations in {stats['path']}")
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
@@ -3,18 +3,32 @@ Chat View Component
 Displays conversation messages and interaction controls.
 """
 
+import uuid
 import streamlit as st
 from datetime import datetime
+from functools import partial
 from services.firebase_service import (
     get_conversation,
-    update_conversation_mode,
-    add_message,
+    get_messages_page,
     delete_conversation
 )
-from services.whatsapp_service import send_message
+from services.realtime_cache import get_realtime_cache
+from services.write_queue import (
+    get_pending_view,
+    get_write_queue,
+    queue_add_message,
+    queue_mark_conversation_read,
+    queue_update_conversation_mode
+)
+from services.outbound_dispatcher import STATUS_HELD, get_outbound_dispatcher
+from services.whatsapp_service import CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, get_circuit_breaker
 from utils.styles import get_message_html, get_status_badge_html
 
 
+# Messages per page: the newest page is shown first, older pages on demand
+MESSAGES_PAGE_SIZE = 50
+
+
 def format_message_time(timestamp):
     """
     Format message timestamp.
@@ -64,6 +78,176 @@ def format_message_time(timestamp):
         return ""
 
 
+def load_message_pages(phone_number, page_count, page_size=MESSAGES_PAGE_SIZE):
+    """
+    Load the newest `page_count` pages of messages using cursors.
+
+    Args:
+        phone_number (str): Phone number of the conversation
+        page_count (int): Number of pages to load (1 = newest page only)
+        page_size (int): Messages per page
+
+    Returns:
+        tuple: (list of messages oldest first, bool has_more)
+    """
+    pages = []
+    cursor = None
+    has_more = False
+    cache = get_realtime_cache()
+
+    for index in range(page_count):
+        page = None
+
+        # The newest page can come from the shared real-time cache
+        if index == 0 and cache:
+            page = cache.get_recent_messages(phone_number, page_size)
+
+        if page is None:
+            page = get_messages_page(phone_number, limit=page_size, before=cursor)
+        pages.insert(0, page['messages'])
+        cursor = page['cursor']
+        has_more = page['has_more']
+
+        if not has_more:
+            break
+
+    messages = [message for page in pages for message in page]
+    return messages, has_more
+
+
+def save_sent_message(message, result, pause_bot):
+    """
+    Dispatcher callback: save a sent message to the history (queued) and
+    pause the bot. Without WhatsApp credentials the message is saved anyway.
+
+    Args:
+        message (OutboundMessage): The dispatched message
+        result (dict): send_message result
+        pause_bot (bool): Switch the conversation to human mode
+    """
+    # A repeated send: the first one already saved the message
+    if result.get('duplicate'):
+        return
+
+    if result['success']:
+        queue_add_message(message.phone_number, 'human', message.text, result.get('message_id', ''))
+    elif 'not configured' in result.get('error', '').lower():
+        queue_add_message(message.phone_number, 'human', message.text)
+    else:
+        return
+
+    # Auto-pause bot when human sends message
+    if pause_bot:
+        queue_update_conversation_mode(message.phone_number, 'human')
+
+
+def get_outbound_messages(phone_number):
+    """
+    Messages of a conversation still waiting in the send queue, shaped
+    like history messages.
+
+    Args:
+        phone_number (str): Phone number of the conversation
+
+    Returns:
+        list: Message dicts, oldest first
+    """
+    return [
+        {
+            'from': 'human',
+            'text': message.text,
+            'timestamp': message.created_at,
+            'messageId': f"outbound-{message.id}",
+            'outbound': message.status
+        }
+        for message in get_outbound_dispatcher().get_pending(phone_number)
+    ]
+
+
+def get_send_key(phone_number, text):
+    """
+    Get the idempotency key of the message being composed in a conversation.
+
+    The key belongs to the draft: clicking "Enviar" again with the same text
+    (after a slow or ambiguous send) reuses it, so the dispatcher and the
+    WhatsApp client deliver the message once. Editing the text gives it a
+    new key, and clear_draft drops it once the message is submitted.
+
+    Args:
+        phone_number (str): Phone number of the conversation
+        text (str): Text of the draft
+
+    Returns:
+        str: Idempotency key
+    """
+    state_key = f"send_key_{phone_number}"
+    draft = st.session_state.get(state_key)
+    if draft is None or draft[0] != text:
+        draft = (text, uuid.uuid4().hex)
+        st.session_state[state_key] = draft
+    return draft[1]
+
+
+def clear_draft(phone_number):
+    """
+    Empty the message input and forget the draft's idempotency key.
+
+    The text area can't be changed once drawn, so it is emptied on the
+    next run, before it is drawn (see render_chat_view).
+
+    Args:
+        phone_number (str): Phone number of the conversation
+    """
+    st.session_state[f"clear_draft_{phone_number}"] = True
+
+
+def render_circuit_status():
+    """
+    Warn that WhatsApp is not reachable while the circuit breaker is open:
+    messages sent meanwhile wait in the queue.
+    """
+    circuit = get_circuit_breaker().get_state()
+
+    if circuit['state'] == CIRCUIT_OPEN:
+        st.warning(
+            f"🔌 WhatsApp no responde ({circuit['last_error'] or 'errores consecutivos'}). "
+            f"Los mensajes quedan en espera y se enviarán cuando se recupere "
+            f"(próximo intento en {circuit['retry_in']:.0f} s)."
+        )
+    elif circuit['state'] == CIRCUIT_HALF_OPEN:
+        st.info("🔌 Comprobando si WhatsApp se ha recuperado...")
+
+
+def render_send_failures(phone_number):
+    """
+    Show the sends to this conversation that failed, each with a button to
+    dismiss it.
+
+    Args:
+        phone_number (str): Phone number of the conversation
+    """
+    dispatcher = get_outbound_dispatcher()
+
+    for message in dispatcher.get_failures(phone_number):
+        error_msg = message.result.get('error', 'Error desconocido')
+        preview = message.text if len(message.text) <= 60 else f"{message.text[:60]}..."
+
+        col1, col2 = st.columns([7, 1])
+        with col1:
+            # Saved by save_sent_message even though it was not delivered
+            if 'not configured' in error_msg.lower():
+                st.info(f"✓ Mensaje guardado en Firebase (no enviado por WhatsApp): {preview}")
+            elif message.result.get('ambiguous'):
+                st.warning(f"⚠️ WhatsApp no respondió a \"{preview}\": puede que se haya entregado. "
+                           "Comprueba antes de reenviarlo.")
+            else:
+                st.error(f"❌ Error al enviar \"{preview}\": {error_msg}")
+        with col2:
+            if st.button("✕", key=f"dismiss_send_{message.id}", help="Descartar"):
+                dispatcher.dismiss_failure(message.id)
+                st.rerun()
+
+
 def render_message(message, index):
     """
     Render a single message with appropriate styling using custom CSS.
@@ -77,6 +261,16 @@ def render_message(message, index):
     timestamp = message.get('timestamp')
     time_str = format_message_time(timestamp)
 
+    # Queued locally, not saved to the database yet
+    if message.get('pending'):
+        time_str = f"{time_str} · ⏳ pendiente"
+
+    # In the send queue, not delivered to WhatsApp yet
+    if message.get('outbound') == STATUS_HELD:
+        time_str = f"{time_str} · 🔌 en espera"
+    elif message.get('outbound'):
+        time_str = f"{time_str} · 📤 enviando"
+
     # Use the styled HTML from styles module
     message_html = get_message_html(from_type, text, time_str)
     st.markdown(message_html, unsafe_allow_html=True)
@@ -93,13 +287,23 @@ def render_chat_view(phone_number):
         st.info("👈 Selecciona una conversación del sidebar")
         return
 
-    # Get conversation data
-    conversation = get_conversation(phone_number)
+    # Get conversation data (summary only, messages are loaded by page)
+    cache = get_realtime_cache()
+    conversation = cache.get_conversation(phone_number) if cache else None
+    if not conversation:
+        conversation = get_conversation(phone_number, include_messages=False)
 
     if not conversation:
         st.error(f"No se encontró la conversación: {phone_number}")
         return
 
+    # Writes still in the write-behind queue are shown as pending
+    pending = get_pending_view(phone_number)
+
+    # Opening the conversation clears its unread flag
+    if conversation.get('unread') and not conversation.get('archived'):
+        queue_mark_conversation_read(phone_number)
+
     # Header with conversation info
     col1, col2 = st.columns([7, 1])
 
@@ -118,6 +322,11 @@ def render_chat_view(phone_number):
 
         with col1:
             if st.button("✓ Sí, borrar", type="primary", key="confirm_delete"):
+                # Queued writes would recreate the conversation
+                queue = get_write_queue()
+                if queue:
+                    queue.discard(phone_number)
+
                 if delete_conversation(phone_number):
                     st.success("✓ Conversación borrada")
                     st.session_state.selected_phone = None
@@ -134,14 +343,30 @@ def render_chat_view(phone_number):
     st.markdown("---")
 
     # Conversation metadata
-    mode = conversation.get('mode', 'bot')
+    mode = pending['mode'] or conversation.get('mode', 'bot')
     status = conversation.get('status', 'active')
-    messages = conversation.get('messages', [])
+    archived = conversation.get('archived', False)
+
+    if archived:
+        st.info("🗄️ Conversación archivada: se reabrirá al enviar o recibir un mensaje")
+
+    # Start from the newest page whenever another conversation is opened
+    if st.session_state.get('message_pages_phone') != phone_number:
+        st.session_state.message_pages_phone = phone_number
+        st.session_state.message_pages = 1
+
+    messages, has_older = load_message_pages(phone_number, st.session_state.message_pages)
+
+    stored_ids = {message.get('messageId') for message in messages}
+    pending_messages = [message for message in pending['messages'] if message['messageId'] not in stored_ids]
+    pending_messages += get_outbound_messages(phone_number)
+    messages = messages + pending_messages
 
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        st.metric("Mensajes", len(messages))
+        stored_count = conversation.get('messageCount', len(messages) - len(pending_messages))
+        st.metric("Mensajes", stored_count + len(pending_messages))
 
     with col2:
         st.metric("Estado", status.upper())
@@ -166,9 +391,10 @@ def render_chat_view(phone_number):
     col1, col2 = st.columns([1, 3])
 
     with col1:
-        if st.button(toggle_label, type="primary", use_container_width=True, key="toggle_mode"):
+        # A mode change alone would not restore an archived conversation
+        if st.button(toggle_label, type="primary", use_container_width=True, key="toggle_mode", disabled=archived):
             new_mode = 'bot' if mode == 'human' else 'human'
-            if update_conversation_mode(phone_number, new_mode):
+            if queue_update_conversation_mode(phone_number, new_mode):
                 st.success(f"✓ Modo cambiado a: {new_mode.upper()}")
                 st.rerun()
             else:
@@ -179,6 +405,12 @@ def render_chat_view(phone_number):
     # Message history
     st.subheader("📜 Historial de mensajes")
 
+    # Load older messages on demand
+    if has_older:
+        if st.button("⬆️ Mensajes anteriores", key="load_older_messages"):
+            st.session_state.message_pages += 1
+            st.rerun()
+
     if messages:
         # Create a scrollable container for messages
         message_container = st.container()
@@ -193,22 +425,26 @@ def render_chat_view(phone_number):
     else:
         st.info("No hay mensajes en esta conversación")
 
+    render_send_failures(phone_number)
+
     st.markdown("---")
 
     # Message input section
     st.subheader("✍️ Enviar respuesta")
 
-    # Initialize message input in session state
-    message_key = f"message_input_{phone_number}"
-    if message_key not in st.session_state:
-        st.session_state[message_key] = ""
+    render_circuit_status()
+
+    # Empty the input after a send or "Limpiar" (see clear_draft)
+    input_key = f"textarea_{phone_number}"
+    if st.session_state.pop(f"clear_draft_{phone_number}", False):
+        st.session_state[input_key] = ""
+        st.session_state.pop(f"send_key_{phone_number}", None)
 
     # Text area for message
     message_text = st.text_area(
         "Escribe tu respuesta...",
-        value=st.session_state.get(message_key, ""),
         height=100,
-        key=f"textarea_{phone_number}",
+        key=input_key,
         placeholder="Escribe un mensaje para enviar al cliente..."
     )
 
@@ -216,7 +452,12 @@ def render_chat_view(phone_number):
     col1, col2, col3 = st.columns([2, 1, 1])
 
     with col1:
-        send_button = st.button("📤 Enviar", type="primary", use_container_width=True, key="send_btn")
+        send_button = st.button(
+            "📤 Enviar",
+            type="primary",
+            use_container_width=True,
+            key="send_btn"
+        )
     
     with col2:
         if st.button("🔄 Refrescar", use_container_width=True, key="refresh_btn_bottom"):
@@ -227,7 +468,7 @@ def render_chat_view(phone_number):
 
     # Handle clear button
     if clear_button:
-        st.session_state[message_key] = ""
+        clear_draft(phone_number)
         st.rerun()
 
     # Handle send button
@@ -235,41 +476,18 @@ def render_chat_view(phone_number):
         if not message_text or not message_text.strip():
             st.error("⚠️ Por favor escribe un mensaje antes de enviar")
         else:
-            with st.spinner("Enviando mensaje..."):
-                # Send via WhatsApp
-                result = send_message(phone_number, message_text)
-
-                if result['success']:
-                    # Add message to Firebase
-                    message_id = result.get('message_id', '')
-                    add_message(phone_number, 'human', message_text, message_id)
-
-                    # Auto-pause bot when human sends message
-                    if mode == 'bot':
-                        update_conversation_mode(phone_number, 'human')
-
-                    # Clear input
-                    st.session_state[message_key] = ""
-
-                    st.success("✓ Mensaje enviado exitosamente")
-                    st.rerun()
-
-                else:
-                    error_msg = result.get('error', 'Error desconocido')
-                    st.error(f"❌ Error al enviar mensaje: {error_msg}")
-
-                    # If credentials not configured, still save to Firebase
-                    if 'not configured' in error_msg.lower():
-                        st.warning("💡 Credenciales no configuradas. Guardando mensaje solo en Firebase...")
-                        add_message(phone_number, 'human', message_text)
-
-                        # Auto-pause bot
-                        if mode == 'bot':
-                            update_conversation_mode(phone_number, 'human')
-
-                        st.session_state[message_key] = ""
-                        st.info("✓ Mensaje guardado en Firebase (no enviado por WhatsApp)")
-                        st.rerun()
+            # Sent by the outbound dispatcher's workers; save_sent_message
+            # stores it once WhatsApp accepts it
+            get_outbound_dispatcher().submit(
+                phone_number,
+                message_text,
+                on_done=partial(save_sent_message, pause_bot=(mode == 'bot')),
+                idempotency_key=get_send_key(phone_number, message_text)
+            )
+
+            # Clear input (a new draft gets a new key)
+            clear_draft(phone_number)
+            st.rerun()
 
     # Instructions
     with st.expander("ℹ️ Instrucciones"):
@@ -5,7 +5,26 @@ Displays conversation list with filters, search, and status indicators.
 
 import streamlit as st
 from datetime import datetime
-from services.firebase_service import get_all_conversations
+from services.firebase_service import (
+    get_conversations_page_result,
+    get_conversation_counts,
+    normalize_phone_search,
+    RESULT_EMPTY,
+    RESULT_FAILED,
+    RESULT_OK,
+    RESULT_STALE,
+    SEARCH_MIN_LENGTH
+)
+from services.realtime_cache import get_realtime_cache
+from services.search_index import get_search_index, get_sync_interval
+from services.storage import get_storage
+from services.write_queue import get_write_queue
+from services.outbound_dispatcher import get_outbound_dispatcher
+from config.firebase import get_db
+
+
+# Conversations fetched per page ("Cargar más" loads one more page)
+CONVERSATIONS_PAGE_SIZE = 50
 
 
 def format_timestamp(timestamp):
@@ -76,13 +95,19 @@ def get_last_message_preview(conversation, max_length=30):
         str: Message preview
     """
     try:
-        messages = conversation.get('messages', [])
-        if not messages:
-            return "Sin mensajes"
+        # Prefer the denormalized preview kept on the conversation document
+        if 'lastMessagePreview' in conversation:
+            if not conversation.get('messageCount'):
+                return "Sin mensajes"
+            text = conversation.get('lastMessagePreview') or ''
+        else:
+            messages = conversation.get('messages', [])
+            if not messages:
+                return "Sin mensajes"
 
-        # Get last message
-        last_message = messages[-1]
-        text = last_message.get('text', '')
+            # Get last message
+            last_message = messages[-1]
+            text = last_message.get('text', '')
 
         # Truncate if too long
         if len(text) > max_length:
@@ -120,6 +145,230 @@ def get_status_indicator(conversation):
     return "⚪"
 
 
+def load_conversation_pages(filters, page_count, page_size=CONVERSATIONS_PAGE_SIZE):
+    """
+    Load the first `page_count` pages of conversations using cursors.
+
+    Args:
+        filters (dict): Filters passed to get_conversations_page
+        page_count (int): Number of pages to load
+        page_size (int): Conversations per page
+
+    Returns:
+        tuple: (list of conversations, bool has_more, str status). The
+            status is the worst ReadResult status of the loaded pages:
+            RESULT_STALE if some page is the last good copy of a failed read,
+            RESULT_FAILED if a page could not be read at all.
+    """
+    # Serve from the shared real-time cache when it is loaded
+    cache = get_realtime_cache()
+    if cache:
+        cached = cache.list_conversations(filters)
+        if cached is not None:
+            limit = page_count * page_size
+            return cached[:limit], len(cached) > limit, RESULT_OK if cached else RESULT_EMPTY
+
+    conversations = []
+    cursor = None
+    has_more = False
+    status = RESULT_OK
+
+    for _ in range(page_count):
+        result = get_conversations_page_result(filters=filters, page_size=page_size, cursor=cursor)
+        if result.failed:
+            # Keep the pages already loaded; there is no later page to show
+            return conversations, False, RESULT_FAILED
+        if result.stale:
+            status = RESULT_STALE
+
+        page = result.data
+        conversations.extend(page['conversations'])
+        cursor = page['next_cursor']
+        has_more = page['has_more']
+
+        if not has_more:
+            break
+
+    if status == RESULT_OK and not conversations:
+        status = RESULT_EMPTY
+    return conversations, has_more, status
+
+
+def load_conversation_counts(search=None):
+    """
+    Get the number of conversations per bucket without reading documents.
+
+    Args:
+        search (str, optional): Phone number fragment
+
+    Returns:
+        dict: Counts per bucket ("bot", "human", "resolved"), or None
+    """
+    cache = get_realtime_cache()
+    if cache:
+        counts = cache.count_buckets(search)
+        if counts is not None:
+            return counts
+
+    return get_conversation_counts(search)
+
+
+def format_filter_label(label, counts, bucket):
+    """
+    Add the bucket total to a filter checkbox label.
+
+    Args:
+        label (str): Checkbox label
+        counts (dict): Counts per bucket, or None
+        bucket (str): Bucket of the checkbox
+
+    Returns:
+        str: Label, e.g. "Bot activo (12)"
+    """
+    if not counts:
+        return label
+    return f"{label} ({counts.get(bucket, 0)})"
+
+
+def build_list_filters(filter_bot, filter_human, filter_resolved, phone_search=None):
+    """
+    Build the filters dict passed to the conversation list queries.
+
+    Args:
+        filter_bot (bool): Include conversations handled by the bot
+        filter_human (bool): Include conversations handled by a human
+        filter_resolved (bool): Include resolved conversations
+        phone_search (str, optional): Normalized phone-number fragment
+
+    Returns:
+        dict: Filters with 'buckets' and optionally 'search'
+    """
+    buckets = []
+    if filter_bot:
+        buckets.append('bot')
+    if filter_human:
+        buckets.append('human')
+    if filter_resolved:
+        buckets.append('resolved')
+
+    filters = {'buckets': buckets}
+
+    # Apply search filter (indexed phone-number fragments)
+    if phone_search:
+        filters['search'] = phone_search
+
+    return filters
+
+
+def get_pending_list_filters():
+    """
+    Filters the sidebar is about to render with, read from session state
+    (widget values are updated before the rerun starts), so the list can
+    be fetched before the sidebar is drawn.
+
+    Returns:
+        dict: Filters as built by build_list_filters
+    """
+    state = st.session_state
+    return build_list_filters(
+        state.get('cb_filter_bot', state.get('filter_bot', True)),
+        state.get('cb_filter_human', state.get('filter_human', True)),
+        state.get('cb_filter_resolved', state.get('filter_resolved', False)),
+        normalize_phone_search(state.get('phone_search', ''))
+    )
+
+
+def render_cache_status():
+    """
+    Show whether the conversation list is live or stale.
+    """
+    cache = get_realtime_cache()
+    if not cache:
+        return
+
+    status = cache.get_status()
+    if status['connected'] and status['ready']:
+        st.sidebar.caption("🟢 En tiempo real")
+    elif status['stale']:
+        last_event = status['last_event']
+        since = last_event.strftime("%I:%M %p") if last_event else "?"
+        st.sidebar.caption(f"🟠 Sin conexión en tiempo real (datos de las {since})")
+
+
+def render_write_queue_status():
+    """
+    Show how many agent writes are still waiting to be saved.
+    """
+    queue = get_write_queue()
+    if not queue:
+        return
+
+    status = queue.get_status()
+    if status['dead_letters']:
+        st.sidebar.caption(f"❌ {status['dead_letters']} cambios no se pudieron guardar")
+    if not status['pending']:
+        return
+
+    st.sidebar.caption(f"⏳ {status['pending']} cambios pendientes de guardar")
+    if status['last_error']:
+        st.sidebar.caption(f"⚠️ Reintentando: {status['last_error']}")
+
+
+def render_outbound_status():
+    """
+    Show how many WhatsApp sends are still queued and how fast they go out.
+    """
+    stats = get_outbound_dispatcher().get_stats()
+    waiting = stats['queue_depth'] + stats['in_flight'] + stats['held']
+    if not waiting:
+        return
+
+    st.sidebar.caption(
+        f"📤 {waiting} mensajes por enviar "
+        f"(p95 {stats['latency_p95_ms']:.0f} ms, espera media {stats['wait_avg_ms']:.0f} ms)"
+    )
+
+
+def render_message_search_results(query, limit=20):
+    """
+    Search message bodies in the local index and list the matches,
+    newest first. Clicking a match opens its conversation.
+
+    Args:
+        query (str): Text to search (accents optional)
+        limit (int): Maximum number of matches
+    """
+    index = get_search_index()
+    if not index:
+        st.sidebar.caption("Búsqueda en mensajes no disponible")
+        return
+
+    # Catch up with messages written elsewhere (e.g. by the bot) in the
+    # background; the change feed reads Firestore
+    if get_storage() is None:
+        index.sync_if_due(get_db(), get_sync_interval())
+
+    results = index.search(query, limit=limit)
+    if not results:
+        st.sidebar.caption("Sin mensajes que coincidan")
+        return
+
+    st.sidebar.caption(f"🔎 {len(results)} mensajes")
+    for i, result in enumerate(results):
+        phone = result['phone_number']
+        text = result['text'] or ''
+        snippet = text[:60] + "..." if len(text) > 60 else text
+
+        if st.sidebar.button(
+            f"{phone} · {format_timestamp(result['timestamp'])}",
+            key=f"msg_search_{i}_{result['messageId']}",
+            use_container_width=True
+        ):
+            st.session_state.selected_phone = phone
+            st.rerun()
+        st.sidebar.caption(f'"{snippet}"')
+
+
 def render_conversation_item(conversation, is_selected=False):
     """
     Render a single conversation item in the sidebar.
@@ -138,8 +387,8 @@ def render_conversation_item(conversation, is_selected=False):
     mode = conversation.get('mode', 'bot')
     status = conversation.get('status', 'active')
 
-    # Bold text for human mode or unresolved
-    is_bold = mode == 'human' and status == 'active'
+    # Bold text for human mode or unresolved, and for unread customer messages
+    is_bold = (mode == 'human' and status == 'active') or conversation.get('unread', False)
 
     # Format phone number (show full number)
     display_phone = phone
@@ -188,19 +437,24 @@ def render_sidebar():
     if 'filter_resolved' not in st.session_state:
         st.session_state.filter_resolved = False
 
+    # Totals per bucket (aggregation queries, no documents downloaded)
+    # The search box is rendered below; its value is read from session state
+    phone_search = normalize_phone_search(st.session_state.get('phone_search', ''))
+    counts = load_conversation_counts(phone_search)
+
     # Filter checkboxes
     filter_bot = st.sidebar.checkbox(
-        "Bot activo",
+        format_filter_label("Bot activo", counts, 'bot'),
         value=st.session_state.filter_bot,
         key="cb_filter_bot"
     )
     filter_human = st.sidebar.checkbox(
-        "Humano respondiendo",
+        format_filter_label("Humano respondiendo", counts, 'human'),
         value=st.session_state.filter_human,
         key="cb_filter_human"
     )
     filter_resolved = st.sidebar.checkbox(
-        "Resueltas",
+        format_filter_label("Resueltas", counts, 'resolved'),
         value=st.session_state.filter_resolved,
         key="cb_filter_resolved"
     )
@@ -215,45 +469,61 @@ def render_sidebar():
     search_term = st.sidebar.text_input(
         "Número de teléfono",
         placeholder="Buscar...",
-        label_visibility="collapsed"
+        label_visibility="collapsed",
+        key="phone_search"
     )
 
-    st.sidebar.markdown("---")
-
-    # Build filters dict for Firebase query
-    filters = {}
-
-    # Apply search filter
-    if search_term:
-        filters['search'] = search_term
-
-    # Get conversations from Firebase
-    try:
-        all_conversations = get_all_conversations(filters=filters)
+    if search_term and not phone_search:
+        st.sidebar.caption(f"Escribe al menos {SEARCH_MIN_LENGTH} dígitos para buscar")
 
-        # Apply mode/status filters (client-side filtering)
-        filtered_conversations = []
+    # Full-text search across message bodies (local index)
+    message_query = st.sidebar.text_input(
+        "Texto del mensaje",
+        placeholder="Buscar en mensajes...",
+        label_visibility="collapsed",
+        key="message_search"
+    )
 
-        for conv in all_conversations:
-            mode = conv.get('mode', 'bot')
-            status = conv.get('status', 'active')
+    if message_query and message_query.strip():
+        render_message_search_results(message_query)
 
-            # Check if conversation matches filters
-            should_include = False
+    st.sidebar.markdown("---")
 
-            if status == 'resolved' and filter_resolved:
-                should_include = True
-            elif status == 'active':
-                if mode == 'bot' and filter_bot:
-                    should_include = True
-                elif mode == 'human' and filter_human:
-                    should_include = True
+    # Build filters dict for Firebase query (mode/status are filtered server-side)
+    filters = build_list_filters(filter_bot, filter_human, filter_resolved, phone_search)
+    buckets = filters['buckets']
 
-            if should_include:
-                filtered_conversations.append(conv)
+    # Start again from the first page whenever the filters change
+    list_key = (tuple(buckets), phone_search or '')
+    if st.session_state.get('conversation_list_key') != list_key:
+        st.session_state.conversation_list_key = list_key
+        st.session_state.conversation_pages = 1
 
-        # Display conversation count
-        st.sidebar.caption(f"📊 {len(filtered_conversations)} conversaciones")
+    # Get conversations from Firebase
+    try:
+        filtered_conversations, has_more, list_status = load_conversation_pages(
+            filters,
+            st.session_state.conversation_pages
+        )
+
+        # A failed read is not an empty list: say so, and keep what we have
+        if list_status == RESULT_STALE:
+            st.sidebar.warning("⚠️ Sin conexión con la base de datos: mostrando la última lista cargada")
+        elif list_status == RESULT_FAILED:
+            st.sidebar.error("❌ No se pudieron cargar las conversaciones")
+            if st.sidebar.button("🔄 Reintentar", use_container_width=True, key="retry_conversations"):
+                st.rerun()
+
+        # Display conversation count (exact totals from the aggregation queries)
+        if counts:
+            total = sum(counts.get(bucket, 0) for bucket in buckets)
+            st.sidebar.caption(f"📊 {total} conversaciones")
+        else:
+            more_suffix = "+" if has_more else ""
+            st.sidebar.caption(f"📊 {len(filtered_conversations)}{more_suffix} conversaciones")
+        render_cache_status()
+        render_write_queue_status()
+        render_outbound_status()
 
         # Initialize selected conversation in session state
         if 'selected_phone' not in st.session_state:
@@ -293,11 +563,16 @@ def render_sidebar():
 
                     st.sidebar.markdown("---")
 
-            return st.session_state.selected_phone
-
-        else:
+        elif list_status != RESULT_FAILED:
             st.sidebar.info("No hay conversaciones que coincidan con los filtros")
-            return None
+
+        # Load the next page on demand
+        if has_more:
+            if st.sidebar.button("⬇️ Cargar más", use_container_width=True, key="load_more_conversations"):
+                st.session_state.conversation_pages += 1
+                st.rerun()
+
+        return st.session_state.selected_phone if filtered_conversations else None
 
     except Exception as e:
         st.sidebar.error(f"Error cargando conversaciones: {str(e)}")
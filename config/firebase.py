@@ -1,6 +1,17 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 import os
+import threading
+import streamlit as st
+from config.settings import get_setting, get_int_setting, get_float_setting
+
+
+# Process-wide Firestore client (fast path for get_db)
+_client = None
+_client_lock = threading.Lock()
+
+# Stops the keep-alive thread of the Firestore client (see _keep_channel_warm)
+_keepalive_stop = None
 
 
 def get_firebase_credentials():
@@ -70,13 +81,155 @@ def initialize_firebase():
             raise
     return firebase_admin.get_app()
 
+def _keep_channel_warm(client, interval):
+    """
+    Issue a tiny read every `interval` seconds so the gRPC channel is not
+    closed for idleness between agent clicks (one billed read per interval).
+
+    Args:
+        client (firestore.Client): Firestore database client
+        interval (int): Seconds between pings
+
+    Returns:
+        threading.Event: Set it to stop the pings
+    """
+    stop = threading.Event()
+
+    def ping():
+        while not stop.wait(interval):
+            try:
+                client.collection('conversations').limit(1).get(timeout=10)
+            except Exception as e:
+                print(f"[Firebase] Keep-alive ping failed: {e}")
+
+    thread = threading.Thread(target=ping, name="firestore-keepalive", daemon=True)
+    thread.start()
+    return stop
+
+
+def stop_keepalive():
+    """
+    Stop the keep-alive pings of the Firestore client, if running.
+    """
+    global _keepalive_stop
+
+    if _keepalive_stop is not None:
+        _keepalive_stop.set()
+        _keepalive_stop = None
+
+
+def get_backend():
+    """
+    Get the configured database backend (FIRESTORE_BACKEND setting):
+    "firestore" (default) or "memory" for the in-process stand-in used
+    offline and in benchmarks.
+
+    Returns:
+        str: Backend name
+    """
+    return str(get_setting('FIRESTORE_BACKEND', 'firestore')).strip().lower()
+
+
+def create_memory_client(latency=None):
+    """
+    Create an in-memory Firestore stand-in.
+
+    Args:
+        latency (float, optional): Seconds added to every round trip
+            (default: FIRESTORE_LATENCY_MS setting)
+
+    Returns:
+        MemoryFirestore: Empty in-memory database
+    """
+    from config.memory_firestore import MemoryFirestore
+
+    if latency is None:
+        latency = get_float_setting('FIRESTORE_LATENCY_MS', 0) / 1000
+    return MemoryFirestore(latency=latency)
+
+
+def use_memory_backend(latency=None):
+    """
+    Make get_db() return a fresh in-memory database for the rest of the
+    process (scripts and benchmarks).
+
+    Args:
+        latency (float, optional): Seconds added to every round trip
+
+    Returns:
+        MemoryFirestore: The database now returned by get_db()
+    """
+    global _client
+
+    with _client_lock:
+        # The Firestore client, if any, is no longer used
+        stop_keepalive()
+        _client = create_memory_client(latency)
+        return _client
+
+
+@st.cache_resource(show_spinner=False)
+def _create_client():
+    """
+    Create the Firestore client once per process, shared by every Streamlit
+    session. The client is thread-safe.
+
+    Returns:
+        firestore.Client: Firestore database client
+    """
+    global _keepalive_stop
+
+    backend = get_backend()
+    if backend == 'memory':
+        print("[Firebase] Using in-memory Firestore (data is not persisted)")
+        return create_memory_client()
+    if backend != 'firestore':
+        raise ValueError(f"Unknown FIRESTORE_BACKEND: {backend}")
+
+    initialize_firebase()
+    client = firestore.client()
+
+    interval = get_int_setting('FIRESTORE_KEEPALIVE_INTERVAL', 300)
+    if interval > 0:
+        stop_keepalive()
+        _keepalive_stop = _keep_channel_warm(client, interval)
+
+    print("[Firebase] Firestore client created")
+    return client
+
+
 def get_db():
     """
     Get Firestore database instance.
-    Initializes Firebase if not already initialized.
+    The client is created once per process and reused by every call.
 
     Returns:
         firestore.Client: Firestore database client
     """
-    initialize_firebase()
-    return firestore.client()
+    global _client
+
+    client = _client
+    if client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+            client = _client
+    return client
+
+
+def check_firebase_connection(timeout=10):
+    """
+    Fail fast on credential or connectivity problems: create the client and
+    run one small read, which also opens the gRPC channel before the first
+    agent click.
+
+    Args:
+        timeout (float): Seconds to wait for the read
+
+    Raises:
+        RuntimeError: If Firestore cannot be reached with the configured credentials
+    """
+    try:
+        get_db().collection('conversations').limit(1).get(timeout=timeout)
+    except Exception as e:
+        raise RuntimeError(f"No se pudo conectar a Firestore: {e}") from e
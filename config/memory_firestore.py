@@ -0,0 +1,926 @@
+"""
+In-Memory Firestore
+A process-local stand-in for firestore.Client covering the API used by the
+dashboard: collections and subcollections, document get/set/create/update/
+delete, where/order_by/limit/select/start_after queries, count()
+aggregations, collection-group queries, get_all, write batches, field
+transforms (Increment, ArrayUnion, ArrayRemove...) and on_snapshot
+listeners.
+
+Every round trip can be given an artificial latency, so service functions
+can be timed offline against realistic network costs.
+"""
+
+import bisect
+import copy
+import functools
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, InvalidArgument, NotFound
+from google.cloud.firestore_v1 import _helpers
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.base_aggregation import AggregationResult
+from google.cloud.firestore_v1.base_query import BaseCompositeFilter, FieldFilter, Or
+from google.cloud.firestore_v1.watch import ChangeType
+
+
+# Firestore rejects batches with more writes than this
+MAX_BATCH_WRITES = 500
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _normalize(value):
+    """
+    Copy a value the way a Firestore round trip would: naive datetimes are
+    stored as UTC and containers are not shared with the caller.
+    """
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def _type_rank(value):
+    """
+    Rank of a value's type in Firestore's cross-type ordering.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, DocumentReference):
+        return 6
+    if isinstance(value, list):
+        return 8
+    return 9
+
+
+def _sort_key(value):
+    """
+    Sort key implementing Firestore's value ordering (by type, then value).
+    """
+    rank = _type_rank(value)
+    if rank == 0:
+        return (0,)
+    if rank == 6:
+        return (6, value._path)
+    if rank == 8:
+        return (8, tuple(_sort_key(item) for item in value))
+    if rank == 9:
+        return (9, tuple(sorted((key, _sort_key(item)) for key, item in value.items())))
+    return (rank, value)
+
+
+def _compare_values(a, b):
+    """
+    Compare two Firestore values (-1, 0 or 1) using Firestore's ordering.
+    """
+    key_a, key_b = _sort_key(a), _sort_key(b)
+    return (key_a > key_b) - (key_a < key_b)
+
+
+_MISSING = object()
+
+
+def _get_field(data, field_path):
+    """
+    Read a (possibly dotted) field path, or _MISSING.
+    """
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data, field_path, value):
+    parts = field_path.split('.')
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    data[parts[-1]] = value
+
+
+def _delete_field(data, field_path):
+    parts = field_path.split('.')
+    for part in parts[:-1]:
+        data = data.get(part)
+        if not isinstance(data, dict):
+            return
+    data.pop(parts[-1], None)
+
+
+def _apply_value(data, field_path, value):
+    """
+    Write one field, resolving transforms and sentinels against the current
+    value.
+    """
+    if value is transforms.DELETE_FIELD:
+        _delete_field(data, field_path)
+        return
+    if value is transforms.SERVER_TIMESTAMP:
+        _set_field(data, field_path, _now())
+        return
+
+    current = _get_field(data, field_path)
+
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        _set_field(data, field_path, base + value.value)
+    elif isinstance(value, transforms.Maximum):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else None
+        _set_field(data, field_path, value.value if base is None else max(base, value.value))
+    elif isinstance(value, transforms.Minimum):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else None
+        _set_field(data, field_path, value.value if base is None else min(base, value.value))
+    elif isinstance(value, transforms.ArrayUnion):
+        items = list(current) if isinstance(current, list) else []
+        for item in _normalize(list(value.values)):
+            if item not in items:
+                items.append(item)
+        _set_field(data, field_path, items)
+    elif isinstance(value, transforms.ArrayRemove):
+        removed = _normalize(list(value.values))
+        items = list(current) if isinstance(current, list) else []
+        _set_field(data, field_path, [item for item in items if item not in removed])
+    elif isinstance(value, dict):
+        # Nested maps may contain transforms of their own
+        _set_field(data, field_path, {})
+        for key, item in value.items():
+            _apply_value(data, f'{field_path}.{key}', item)
+    else:
+        _set_field(data, field_path, _normalize(value))
+
+
+def _merge_into(data, values, prefix=''):
+    """
+    Deep-merge values into data (set(..., merge=True)).
+    """
+    for key, value in values.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict) and value:
+            if not isinstance(_get_field(data, path), dict):
+                _set_field(data, path, {})
+            _merge_into(data, value, f'{path}.')
+        else:
+            _apply_value(data, path, value)
+
+
+def _project(data, field_paths):
+    """
+    Keep only the requested fields (select() / field_paths).
+    """
+    if field_paths is None:
+        return copy.deepcopy(data)
+
+    projected = {}
+    for field_path in field_paths:
+        value = _get_field(data, field_path)
+        if value is not _MISSING:
+            _set_field(projected, field_path, copy.deepcopy(value))
+    return projected
+
+
+def _matches(data, flt):
+    """
+    Evaluate a FieldFilter / And / Or against document data.
+    """
+    if isinstance(flt, BaseCompositeFilter):
+        results = (_matches(data, sub) for sub in flt.filters)
+        return any(results) if isinstance(flt, Or) else all(results)
+
+    value = _get_field(data, flt.field_path)
+    if value is _MISSING:
+        return False
+
+    op = flt.op_string
+    target = _normalize(flt.value)
+
+    if op == '==':
+        return _compare_values(value, target) == 0
+    if op == '!=':
+        return value is not None and _compare_values(value, target) != 0
+    if op in ('<', '<=', '>', '>='):
+        # Range filters only match values of the same type
+        if _type_rank(value) != _type_rank(target) or value is None:
+            return False
+        result = _compare_values(value, target)
+        return {
+            '<': result < 0,
+            '<=': result <= 0,
+            '>': result > 0,
+            '>=': result >= 0
+        }[op]
+    if op == 'in':
+        return any(_compare_values(value, item) == 0 for item in target)
+    if op == 'not-in':
+        return value is not None and all(_compare_values(value, item) != 0 for item in target)
+    if op == 'array_contains':
+        return isinstance(value, list) and target in value
+    if op == 'array_contains_any':
+        return isinstance(value, list) and any(item in value for item in target)
+
+    raise InvalidArgument(f"Unsupported operator: {op}")
+
+
+class DocumentSnapshot:
+    """
+    Result of reading a document.
+    """
+
+    def __init__(self, reference, data, read_time, create_time=None, update_time=None):
+        self.reference = reference
+        self._data = data
+        self.read_time = read_time
+        self.create_time = create_time
+        self.update_time = update_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        if self._data is None:
+            return None
+        value = _get_field(self._data, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class _ChangeEvent:
+    """
+    One document change delivered to an on_snapshot callback.
+    """
+
+    def __init__(self, change_type, document, old_index, new_index):
+        self.type = change_type
+        self.document = document
+        self.old_index = old_index
+        self.new_index = new_index
+
+
+class Watch:
+    """
+    Handle returned by on_snapshot.
+    """
+
+    def __init__(self, client, query, callback):
+        self._client = client
+        self._query = query
+        self._callback = callback
+        # Documents matching the query (before its limit), in result order,
+        # kept up to date from each commit's changed documents
+        self._entries = []
+        self._keys = []
+        self._matched = {}
+        # path -> (stored data, snapshot) of the last delivered results
+        self._docs = {}
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._client._remove_watch(self)
+
+
+class AggregationQuery:
+    """
+    count() over a query.
+    """
+
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias or 'field_1'
+
+    def get(self, transaction=None, retry=None, timeout=None):
+        client = self._query._client
+        client._round_trip()
+        with client._lock:
+            total = len(self._query._run())
+        return [[AggregationResult(alias=self._alias, value=total, read_time=_now())]]
+
+    def stream(self, transaction=None, retry=None, timeout=None):
+        yield from self.get()
+
+
+class Query:
+    """
+    Immutable query over one collection or a collection group.
+    """
+
+    def __init__(self, client, path, all_descendants=False, filters=(), orders=(),
+                 limit=None, start_after=None, projection=None):
+        self._client = client
+        self._path = path
+        self._all_descendants = all_descendants
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._projection = projection
+
+    ASCENDING = ASCENDING
+    DESCENDING = DESCENDING
+
+    def _copy(self, **changes):
+        params = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit': self._limit,
+            'start_after': self._start_after,
+            'projection': self._projection
+        }
+        params.update(changes)
+        return Query(self._client, self._path, self._all_descendants, **params)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is None:
+            filter = FieldFilter(field_path, op_string, value)
+        return self._copy(filters=self._filters + (filter,))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start_after=document_fields_or_snapshot)
+
+    def count(self, alias=None):
+        return AggregationQuery(self, alias)
+
+    def _compare_docs(self, a, b):
+        """
+        Order two (path, data) entries by the order_by fields, then by
+        document path in the direction of the last order.
+        """
+        result = self._compare_field_values(a, b)
+        if result or a[0] is None or b[0] is None:
+            return result
+        result = (a[0] > b[0]) - (a[0] < b[0])
+        if self._orders and self._orders[-1][1] == DESCENDING:
+            return -result
+        return result
+
+    def _compare_field_values(self, a, b):
+        for field_path, direction in self._orders:
+            result = _compare_values(_get_field(a[1], field_path), _get_field(b[1], field_path))
+            if result:
+                return -result if direction == DESCENDING else result
+        return 0
+
+    def _sort(self, entries):
+        """
+        Sort (path, data) entries in result order (same order as
+        _compare_docs), with stable key sorts from the last key to the first.
+        """
+        descending = bool(self._orders) and self._orders[-1][1] == DESCENDING
+        entries.sort(key=lambda entry: entry[0], reverse=descending)
+        for field_path, direction in reversed(self._orders):
+            entries.sort(
+                key=lambda entry: _sort_key(_get_field(entry[1], field_path)),
+                reverse=direction == DESCENDING
+            )
+
+    def _cursor_entry(self):
+        cursor = self._start_after
+        if isinstance(cursor, DocumentSnapshot):
+            return (cursor.reference._path, cursor._data or {})
+        if isinstance(cursor, dict):
+            return (None, _normalize(cursor))
+        values = list(cursor)
+        data = {}
+        for (field_path, _), value in zip(self._orders, values):
+            _set_field(data, field_path, _normalize(value))
+        return (None, data)
+
+    def _in_scope(self, path):
+        """
+        Tell whether a document path belongs to the queried collection(s).
+        """
+        if self._all_descendants:
+            return len(path) >= 2 and path[-2] == self._path[-1]
+        return path[:-1] == self._path
+
+    def _accepts(self, path, data):
+        """
+        Tell whether a document in scope is part of the results (ignoring
+        the limit).
+        """
+        if not all(_matches(data, flt) for flt in self._filters):
+            return False
+        if not all(_get_field(data, field_path) is not _MISSING for field_path, _ in self._orders):
+            return False
+        return self._start_after is None or self._compare_docs((path, data), self._cursor_entry()) > 0
+
+    def _entry_key(self, entry):
+        return functools.cmp_to_key(self._compare_docs)(entry)
+
+    def _run(self):
+        """
+        Evaluate the query against the current data (no latency).
+
+        Returns:
+            list: (path, data) entries in result order
+        """
+        entries = self._match()
+        if self._limit is not None:
+            entries = entries[:self._limit]
+        return entries
+
+    def _match(self):
+        """
+        Same as _run, without the limit.
+        """
+        entries = [
+            (path, data) for path, data in self._client._iter_collection(self._path, self._all_descendants)
+            if all(_matches(data, flt) for flt in self._filters)
+            and all(_get_field(data, field_path) is not _MISSING for field_path, _ in self._orders)
+        ]
+        self._sort(entries)
+
+        if self._start_after is not None:
+            # Binary search for the first entry after the cursor
+            cursor = self._cursor_entry()
+            low, high = 0, len(entries)
+            while low < high:
+                middle = (low + high) // 2
+                if self._compare_docs(entries[middle], cursor) > 0:
+                    high = middle
+                else:
+                    low = middle + 1
+            entries = entries[low:]
+        return entries
+
+    def _snapshots(self, entries, read_time):
+        return [
+            DocumentSnapshot(
+                self._client._reference(path),
+                _project(data, self._projection),
+                read_time,
+                *self._client._times.get(path, (None, None))
+            )
+            for path, data in entries
+        ]
+
+    def stream(self, transaction=None, retry=None, timeout=None):
+        self._client._round_trip()
+        with self._client._lock:
+            snapshots = self._snapshots(self._run(), _now())
+        yield from snapshots
+
+    def get(self, transaction=None, retry=None, timeout=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._client._add_watch(self, callback)
+
+
+class CollectionReference(Query):
+    """
+    Reference to a collection (or subcollection).
+    """
+
+    def __init__(self, client, path):
+        super().__init__(client, path)
+
+    @property
+    def id(self):
+        return self._path[-1]
+
+    @property
+    def parent(self):
+        if len(self._path) == 1:
+            return None
+        return DocumentReference(self._client, self._path[:-1])
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, self._path + (document_id or uuid.uuid4().hex[:20],))
+
+    def add(self, document_data, document_id=None):
+        doc_ref = self.document(document_id)
+        return _now(), doc_ref, doc_ref.create(document_data)
+
+    def list_documents(self, page_size=None):
+        with self._client._lock:
+            ids = list(self._client._collections.get(self._path, {}))
+        return [self.document(document_id) for document_id in ids]
+
+
+class DocumentReference:
+    """
+    Reference to a document.
+    """
+
+    def __init__(self, client, path):
+        self._client = client
+        self._path = tuple(path)
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other._path == self._path
+
+    def __hash__(self):
+        return hash(self._path)
+
+    @property
+    def id(self):
+        return self._path[-1]
+
+    @property
+    def path(self):
+        return '/'.join(self._path)
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self._path[:-1])
+
+    def collection(self, collection_id):
+        return CollectionReference(self._client, self._path + (collection_id,))
+
+    def get(self, field_paths=None, transaction=None, retry=None, timeout=None):
+        self._client._round_trip()
+        return self._client._snapshot(self._path, field_paths)
+
+    def create(self, document_data, retry=None, timeout=None):
+        batch = self._client.batch()
+        batch.create(self, document_data)
+        return batch.commit()[0]
+
+    def set(self, document_data, merge=False, retry=None, timeout=None):
+        batch = self._client.batch()
+        batch.set(self, document_data, merge=merge)
+        return batch.commit()[0]
+
+    def update(self, field_updates, option=None, retry=None, timeout=None):
+        batch = self._client.batch()
+        batch.update(self, field_updates, option=option)
+        return batch.commit()[0]
+
+    def delete(self, option=None, retry=None, timeout=None):
+        batch = self._client.batch()
+        batch.delete(self, option=option)
+        return batch.commit()[0]
+
+
+class WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class WriteBatch:
+    """
+    Atomic group of writes, applied on commit.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference._path, document_data, False, None))
+        return self
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference._path, document_data, merge, None))
+        return self
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference._path, field_updates, False, option))
+        return self
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference._path, None, False, option))
+        return self
+
+    def commit(self, retry=None, timeout=None):
+        if len(self._writes) > MAX_BATCH_WRITES:
+            raise InvalidArgument(f"A write batch can have at most {MAX_BATCH_WRITES} writes")
+
+        self._client._round_trip()
+        results = self._client._commit(self._writes)
+        self._writes = []
+        return results
+
+
+class MemoryFirestore:
+    """
+    Thread-safe in-memory replacement for firestore.Client.
+    """
+
+    def __init__(self, latency=0.0, project='memory'):
+        """
+        Args:
+            latency (float): Seconds slept on every round trip (reads,
+                queries, aggregations, commits)
+            project (str): Reported project ID
+        """
+        self.project = project
+        self.latency = latency
+        self._lock = threading.RLock()
+        # collection path -> {document ID -> data}
+        self._collections = {}
+        # document path -> (create_time, update_time)
+        self._times = {}
+        self._watches = []
+        self._events = None
+        self._round_trips = 0
+
+    # Public client API
+
+    def collection(self, *path):
+        if len(path) == 1:
+            path = tuple(path[0].split('/'))
+        return CollectionReference(self, tuple(path))
+
+    def collection_group(self, collection_id):
+        return Query(self, (collection_id,), all_descendants=True)
+
+    def document(self, *path):
+        if len(path) == 1:
+            path = tuple(path[0].split('/'))
+        return DocumentReference(self, path)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    @staticmethod
+    def write_option(**kwargs):
+        """
+        Precondition for update/delete (last_update_time or exists), as
+        firestore.Client.write_option.
+        """
+        if 'last_update_time' in kwargs:
+            return _helpers.LastUpdateOption(kwargs['last_update_time'])
+        return _helpers.ExistsOption(kwargs['exists'])
+
+    def get_all(self, references, field_paths=None, transaction=None, retry=None, timeout=None):
+        self._round_trip()
+        with self._lock:
+            snapshots = [self._snapshot(reference._path, field_paths) for reference in references]
+        yield from snapshots
+
+    def collections(self):
+        with self._lock:
+            roots = {path[0] for path in self._collections if len(path) == 1}
+        return [CollectionReference(self, (root,)) for root in sorted(roots)]
+
+    def close(self):
+        with self._lock:
+            for watch in list(self._watches):
+                watch.is_active = False
+            self._watches = []
+
+    # Stats
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Stored documents and round trips served so far
+        """
+        with self._lock:
+            documents = sum(len(docs) for docs in self._collections.values())
+        return {
+            'documents': documents,
+            'round_trips': self._round_trips,
+            'latency': self.latency
+        }
+
+    # Internals
+
+    def _round_trip(self):
+        with self._lock:
+            self._round_trips += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _reference(self, path):
+        return DocumentReference(self, path)
+
+    def _get(self, path):
+        return self._collections.get(path[:-1], {}).get(path[-1])
+
+    def _snapshot(self, path, field_paths=None):
+        with self._lock:
+            data = self._get(path)
+            return DocumentSnapshot(
+                self._reference(path),
+                _project(data, field_paths) if data is not None else None,
+                _now(),
+                *self._times.get(path, (None, None))
+            )
+
+    def _iter_collection(self, path, all_descendants=False):
+        if not all_descendants:
+            for document_id, data in self._collections.get(path, {}).items():
+                yield path + (document_id,), data
+            return
+
+        collection_id = path[-1]
+        for collection_path, docs in self._collections.items():
+            if collection_path[-1] == collection_id:
+                for document_id, data in docs.items():
+                    yield collection_path + (document_id,), data
+
+    def _check_precondition(self, path, existing, option):
+        if option is None:
+            return
+        if isinstance(option, _helpers.LastUpdateOption):
+            if existing is None or self._times.get(path, (None, None))[1] != option._last_update_time:
+                raise FailedPrecondition(f"Document was modified: {'/'.join(path)}")
+        elif isinstance(option, _helpers.ExistsOption) and (existing is not None) != option._exists:
+            raise FailedPrecondition(f"Document existence precondition failed: {'/'.join(path)}")
+
+    def _commit(self, writes):
+        """
+        Validate every write, then apply them all (atomic).
+        """
+        with self._lock:
+            staged = {}
+
+            def current(path):
+                return staged[path] if path in staged else self._get(path)
+
+            for kind, path, values, merge, option in writes:
+                existing = current(path)
+                self._check_precondition(path, existing, option)
+
+                if kind == 'create':
+                    if existing is not None:
+                        raise AlreadyExists(f"Document already exists: {'/'.join(path)}")
+                    data = {}
+                    for key, value in values.items():
+                        _apply_value(data, key, value)
+                elif kind == 'set':
+                    data = copy.deepcopy(existing) if merge and existing is not None else {}
+                    if merge:
+                        _merge_into(data, values)
+                    else:
+                        for key, value in values.items():
+                            _apply_value(data, key, value)
+                elif kind == 'update':
+                    if existing is None:
+                        raise NotFound(f"No document to update: {'/'.join(path)}")
+                    data = copy.deepcopy(existing)
+                    for field_path, value in values.items():
+                        _apply_value(data, field_path, value)
+                else:
+                    data = None
+
+                staged[path] = data
+
+            now = _now()
+            for path, data in staged.items():
+                docs = self._collections.setdefault(path[:-1], {})
+                if data is None:
+                    docs.pop(path[-1], None)
+                    self._times.pop(path, None)
+                    if not docs:
+                        del self._collections[path[:-1]]
+                else:
+                    created = self._times.get(path, (now, now))[0] if path[-1] in docs else now
+                    docs[path[-1]] = data
+                    self._times[path] = (created, now)
+
+            self._notify(staged)
+            return [WriteResult(now) for _ in writes]
+
+    # Listeners
+
+    def _add_watch(self, query, callback):
+        watch = Watch(self, query, callback)
+        with self._lock:
+            watch._entries = query._match()
+            watch._keys = [query._entry_key(entry) for entry in watch._entries]
+            watch._matched = dict(watch._entries)
+            self._watches.append(watch)
+            self._deliver(watch)
+        return watch
+
+    def _remove_watch(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _notify(self, changed):
+        """
+        Update each listener's results from the documents a commit changed
+        (path -> new data, None when deleted), without re-running its query.
+        """
+        for watch in self._watches:
+            query = watch._query
+            updated = False
+
+            for path, data in changed.items():
+                if not query._in_scope(path):
+                    continue
+
+                previous = watch._matched.pop(path, None)
+                if previous is not None:
+                    position = bisect.bisect_left(watch._keys, query._entry_key((path, previous)))
+                    del watch._entries[position]
+                    del watch._keys[position]
+                    updated = True
+
+                if data is not None and query._accepts(path, data):
+                    key = query._entry_key((path, data))
+                    position = bisect.bisect_left(watch._keys, key)
+                    watch._entries.insert(position, (path, data))
+                    watch._keys.insert(position, key)
+                    watch._matched[path] = data
+                    updated = True
+
+            if updated:
+                self._deliver(watch)
+
+    def _deliver(self, watch):
+        """
+        Diff a listener's results against its last snapshot and queue the
+        callback. Callbacks run on a separate thread, as with real listeners.
+        """
+        query = watch._query
+        read_time = _now()
+        entries = watch._entries
+        if query._limit is not None:
+            entries = entries[:query._limit]
+
+        previous = watch._docs
+        old_index = {path: i for i, path in enumerate(previous)}
+        current = {}
+        snapshots = []
+
+        # Removals first, as Firestore reports them
+        kept = {path for path, _ in entries}
+        changes = [
+            _ChangeEvent(ChangeType.REMOVED, snapshot, old_index[path], -1)
+            for path, (_, snapshot) in previous.items()
+            if path not in kept
+        ]
+
+        for new_index, (path, data) in enumerate(entries):
+            before = previous.get(path)
+            if before is not None and before[0] is data:
+                # Unchanged document: reuse its snapshot
+                snapshot = before[1]
+            else:
+                snapshot = query._snapshots([(path, data)], read_time)[0]
+                if before is None:
+                    changes.append(_ChangeEvent(ChangeType.ADDED, snapshot, -1, new_index))
+                elif before[1]._data != snapshot._data:
+                    changes.append(_ChangeEvent(ChangeType.MODIFIED, snapshot, old_index[path], new_index))
+            current[path] = (data, snapshot)
+            snapshots.append(snapshot)
+
+        watch._docs = current
+        if changes or not previous:
+            self._dispatch(watch, snapshots, changes, read_time)
+
+    def _dispatch(self, watch, snapshots, changes, read_time):
+        if self._events is None:
+            self._events = queue.Queue()
+            thread = threading.Thread(target=self._run_callbacks, name="memory-firestore-watch", daemon=True)
+            thread.start()
+        self._events.put((watch, snapshots, changes, read_time))
+
+    def _run_callbacks(self):
+        while True:
+            watch, snapshots, changes, read_time = self._events.get()
+            if not watch.is_active:
+                continue
+            try:
+                watch._callback(snapshots, changes, read_time)
+            except Exception as e:
+                print(f"[Memory Firestore] Listener callback failed: {e}")
@@ -0,0 +1,90 @@
+"""
+Dashboard Settings
+Read tunable options from Streamlit secrets or environment variables.
+"""
+
+import os
+
+
+def get_setting(name, default=None):
+    """
+    Get a dashboard setting.
+    Looks in the `[dashboard]` section of Streamlit secrets first (key in
+    lowercase), then in the environment variable with the same name.
+
+    Args:
+        name (str): Setting name, e.g. "MESSAGE_STORAGE"
+        default: Value returned when the setting is not configured
+
+    Returns:
+        The configured value, or default
+    """
+    try:
+        import streamlit as st
+
+        value = st.secrets.get("dashboard", {}).get(name.lower())
+        if value is not None:
+            return value
+    except Exception:
+        # No secrets.toml (scripts, local dev without streamlit)
+        pass
+
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return value
+
+
+def get_int_setting(name, default):
+    """
+    Get an integer dashboard setting.
+
+    Args:
+        name (str): Setting name
+        default (int): Value used when missing or invalid
+
+    Returns:
+        int: Setting value
+    """
+    try:
+        return int(get_setting(name, default))
+    except (TypeError, ValueError):
+        print(f"[Settings] Invalid integer for {name}, using {default}")
+        return default
+
+
+def get_float_setting(name, default):
+    """
+    Get a float dashboard setting.
+
+    Args:
+        name (str): Setting name
+        default (float): Value used when missing or invalid
+
+    Returns:
+        float: Setting value
+    """
+    try:
+        return float(get_setting(name, default))
+    except (TypeError, ValueError):
+        print(f"[Settings] Invalid number for {name}, using {default}")
+        return default
+
+
+def get_bool_setting(name, default=False):
+    """
+    Get a boolean dashboard setting ("1", "true", "yes", "on" are true).
+
+    Args:
+        name (str): Setting name
+        default (bool): Value used when missing
+
+    Returns:
+        bool: Setting value
+    """
+    value = get_setting(name, None)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
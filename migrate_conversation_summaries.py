@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Conversation Summary Backfill Script
+Adds the denormalized summary fields (last message preview, sender, count,
+unread flag) to conversation documents created before they existed.
+
+Usage:
+    python3 migrate_conversation_summaries.py            # only missing fields
+    python3 migrate_conversation_summaries.py --force    # recompute all
+    python3 migrate_conversation_summaries.py --dry-run  # report only
+"""
+
+import argparse
+from config.firebase import get_db
+from services.firebase_service import build_conversation_summary
+
+# Firestore allows at most 500 operations per batch
+BATCH_SIZE = 400
+
+
+def backfill_conversation_summaries(force=False, dry_run=False):
+    """
+    Write summary fields on every conversation that lacks them.
+
+    Args:
+        force (bool): Recompute the summary even if it already exists
+        dry_run (bool): Only count the documents that would be updated
+
+    Returns:
+        int: Number of documents updated (or that would be updated)
+    """
+    db = get_db()
+    batch = db.batch()
+    pending = 0
+    updated = 0
+
+    for doc in db.collection('conversations').stream():
+        data = doc.to_dict()
+
+        if not force and 'lastMessagePreview' in data and 'messageCount' in data:
+            continue
+
+        summary = build_conversation_summary(data.get('messages', []))
+        updated += 1
+
+        if dry_run:
+            print(f"   · {doc.id}: {summary['messageCount']} mensajes")
+            continue
+
+        batch.update(doc.reference, summary)
+        pending += 1
+
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            print(f"   ✓ Committed {updated} documents")
+            batch = db.batch()
+            pending = 0
+
+    if pending and not dry_run:
+        batch.commit()
+
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill conversation summary fields")
+    parser.add_argument('--force', action='store_true', help="Recompute summaries for every document")
+    parser.add_argument('--dry-run', action='store_true', help="Report without writing")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("  BACKFILLING CONVERSATION SUMMARIES")
+    print("="*60)
+
+    try:
+        count = backfill_conversation_summaries(force=args.force, dry_run=args.dry_run)
+        action = "would be updated" if args.dry_run else "updated"
+        print(f"\n✓ {count} conversations {action}")
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
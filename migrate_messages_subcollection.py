@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Message Storage Migration Script
+Moves embedded `messages` arrays into the conversations/{phone}/messages
+subcollection (one document per message, keyed by messageId).
+
+The migration runs without downtime:
+    1. The conversation is flagged with messageStorage = "subcollection", so
+       reads start merging the array and the subcollection.
+    2. Messages are copied in batches. Writes are keyed by messageId (for
+       legacy messages without one, a hash of their content), so copying
+       the same message twice is harmless.
+    3. Only the copied messages are removed from the array (ArrayRemove).
+       Messages appended concurrently stay in the array and are picked up
+       by the next run.
+
+Progress is saved to a checkpoint file after every conversation, so an
+interrupted run resumes where it stopped. The checkpoint is removed when a
+pass completes.
+
+Usage:
+    python3 migrate_messages_subcollection.py
+    python3 migrate_messages_subcollection.py --dry-run
+    python3 migrate_messages_subcollection.py --reset   # ignore checkpoint
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+from config.firebase import get_db
+from services.firebase_service import (
+    MESSAGE_STORAGE_SUBCOLLECTION,
+    MESSAGES_SUBCOLLECTION,
+    message_doc_id,
+    message_document,
+    write_options
+)
+
+# Firestore allows at most 500 operations per batch
+BATCH_SIZE = 400
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(__file__), '.migrate_messages_checkpoint.json')
+
+
+def load_checkpoint(path):
+    """
+    Load migration progress.
+
+    Args:
+        path (str): Checkpoint file path
+
+    Returns:
+        dict: Checkpoint with last_phone, conversations and messages counters
+    """
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'last_phone': None, 'conversations': 0, 'messages': 0}
+
+
+def save_checkpoint(path, checkpoint):
+    """
+    Save migration progress atomically.
+
+    Args:
+        path (str): Checkpoint file path
+        checkpoint (dict): Checkpoint data
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def stable_message_id(message):
+    """
+    Message ID for a legacy message stored without one, derived from its
+    content, so a rerun after an interrupted copy writes the same document
+    instead of a duplicate.
+
+    Args:
+        message (dict): Embedded message
+
+    Returns:
+        str: Message ID
+    """
+    timestamp = message.get('timestamp')
+    if hasattr(timestamp, 'isoformat'):
+        timestamp = timestamp.isoformat()
+    content = f"{timestamp}|{message.get('from')}|{message.get('text')}"
+    return f"legacy-{hashlib.sha1(content.encode('utf-8')).hexdigest()[:20]}"
+
+
+def migrate_conversation(db, doc):
+    """
+    Move the embedded messages of one conversation to the subcollection.
+
+    Args:
+        db (firestore.Client): Firestore database client
+        doc (DocumentSnapshot): Conversation document
+
+    Returns:
+        int: Number of messages moved
+    """
+    data = doc.to_dict()
+    messages = data.get('messages') or []
+
+    if not messages:
+        return 0
+
+    doc_ref = doc.reference
+    messages_ref = doc_ref.collection(MESSAGES_SUBCOLLECTION)
+
+    # Every write below can be applied twice (keyed sets, ArrayRemove)
+    options = write_options(idempotent=True)
+
+    # Flag first: from now on reads merge both layouts
+    batch = db.batch()
+    batch.update(doc_ref, {'messageStorage': MESSAGE_STORAGE_SUBCOLLECTION})
+    pending = 1
+
+    for message in messages:
+        stored = dict(message)
+        if not stored.get('messageId'):
+            stored['messageId'] = stable_message_id(message)
+
+        batch.set(messages_ref.document(message_doc_id(stored['messageId'])), message_document(stored))
+        pending += 1
+
+        if pending >= BATCH_SIZE:
+            batch.commit(**options)
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit(**options)
+
+    # Remove exactly the copied elements; concurrent appends are kept
+    for start in range(0, len(messages), BATCH_SIZE):
+        doc_ref.update({
+            'messages': firestore.ArrayRemove(messages[start:start + BATCH_SIZE])
+        }, **options)
+
+    return len(messages)
+
+
+def migrate_messages(checkpoint_path=DEFAULT_CHECKPOINT, dry_run=False, reset=False):
+    """
+    Migrate every conversation, resuming from the checkpoint.
+
+    Args:
+        checkpoint_path (str): Checkpoint file path
+        dry_run (bool): Only report what would be migrated
+        reset (bool): Ignore an existing checkpoint
+
+    Returns:
+        dict: Final checkpoint counters
+    """
+    db = get_db()
+    checkpoint = {'last_phone': None, 'conversations': 0, 'messages': 0}
+    if not reset:
+        checkpoint = load_checkpoint(checkpoint_path)
+
+    if checkpoint['last_phone']:
+        print(f"   ↻ Resuming after {checkpoint['last_phone']}")
+
+    query = db.collection('conversations').order_by(FieldPath.document_id())
+    if checkpoint['last_phone']:
+        query = query.start_after({'__name__': checkpoint['last_phone']})
+
+    for doc in query.stream():
+        if dry_run:
+            count = len(doc.to_dict().get('messages') or [])
+            if count:
+                print(f"   · {doc.id}: {count} mensajes")
+                checkpoint['conversations'] += 1
+                checkpoint['messages'] += count
+            continue
+
+        count = migrate_conversation(db, doc)
+        if count:
+            print(f"   ✓ {doc.id}: {count} mensajes")
+            checkpoint['conversations'] += 1
+            checkpoint['messages'] += count
+
+        checkpoint['last_phone'] = doc.id
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    # Completed: the next run starts a fresh pass
+    if not dry_run and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    return checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move embedded messages to the messages subcollection")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="Checkpoint file path")
+    parser.add_argument('--dry-run', action='store_true', help="Report without writing")
+    parser.add_argument('--reset', action='store_true', help="Start from the beginning")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("  MIGRATING MESSAGES TO SUBCOLLECTIONS")
+    print("="*60)
+
+    try:
+        result = migrate_messages(args.checkpoint, dry_run=args.dry_run, reset=args.reset)
+        print(f"\n✓ {result['conversations']} conversations, {result['messages']} messages")
+        if not args.dry_run:
+            print("Run again to pick up messages appended to arrays during the migration.")
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
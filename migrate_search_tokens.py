@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Search Token Backfill Script
+Adds the `searchTokens` array (phone-number digit substrings) used by the
+indexed phone search to conversations created before it existed.
+
+Usage:
+    python3 migrate_search_tokens.py            # only missing tokens
+    python3 migrate_search_tokens.py --force    # rebuild all
+    python3 migrate_search_tokens.py --dry-run  # report only
+"""
+
+import argparse
+from config.firebase import get_db
+from services.firebase_service import build_search_tokens
+
+# Firestore allows at most 500 operations per batch
+BATCH_SIZE = 400
+
+
+def backfill_search_tokens(force=False, dry_run=False):
+    """
+    Write searchTokens on every conversation that lacks them.
+
+    Args:
+        force (bool): Rebuild the tokens even if they already exist
+        dry_run (bool): Only count the documents that would be updated
+
+    Returns:
+        int: Number of documents updated (or that would be updated)
+    """
+    db = get_db()
+    batch = db.batch()
+    pending = 0
+    updated = 0
+
+    # Only the token field is downloaded
+    for doc in db.collection('conversations').select(['searchTokens']).stream():
+        tokens = build_search_tokens(doc.id)
+
+        if not force and (doc.to_dict() or {}).get('searchTokens') == tokens:
+            continue
+
+        updated += 1
+
+        if dry_run:
+            print(f"   · {doc.id}: {len(tokens)} tokens")
+            continue
+
+        batch.update(doc.reference, {'searchTokens': tokens})
+        pending += 1
+
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            print(f"   ✓ Committed {updated} documents")
+            batch = db.batch()
+            pending = 0
+
+    if pending and not dry_run:
+        batch.commit()
+
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill conversation search tokens")
+    parser.add_argument('--force', action='store_true', help="Rebuild tokens for every document")
+    parser.add_argument('--dry-run', action='store_true', help="Report without writing")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("  BACKFILLING SEARCH TOKENS")
+    print("="*60)
+
+    try:
+        count = backfill_search_tokens(force=args.force, dry_run=args.dry_run)
+        action = "would be updated" if args.dry_run else "updated"
+        print(f"\n✓ {count} conversations {action}")
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Broadcast Sender
+Sends one WhatsApp message to a list of numbers or to every conversation
+matching a filter, under the WHATSAPP_RATE_LIMIT. Progress is checkpointed:
+if the run stops, run the same command with the printed --id to resume.
+
+Usage:
+    python3 send_broadcast.py --text "Tu pedido ya salió" --status active
+    python3 send_broadcast.py --text "..." --mode human --status active
+    python3 send_broadcast.py --text "..." --recipients numbers.txt   # one number per line
+    python3 send_broadcast.py --text "..." --status active --id <id>  # resume
+"""
+
+import argparse
+from services.whatsapp_service import send_broadcast
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a message to many recipients")
+    parser.add_argument('--text', required=True, help="Message text")
+    parser.add_argument('--recipients', help="File with one phone number per line")
+    parser.add_argument('--status', choices=['active', 'resolved'], help="Conversations with this status")
+    parser.add_argument('--mode', choices=['bot', 'human'], help="Conversations in this mode")
+    parser.add_argument('--id', dest='broadcast_id', help="Broadcast to resume")
+    parser.add_argument('--retry-failed', action='store_true', help="On resume, retry failed recipients")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("  SENDING BROADCAST")
+    print("="*60)
+
+    try:
+        recipients = None
+        filters = None
+        if args.recipients:
+            with open(args.recipients) as f:
+                recipients = [line.strip() for line in f if line.strip()]
+        elif args.status or args.mode:
+            filters = {'status': args.status, 'mode': args.mode}
+        elif not args.broadcast_id:
+            raise ValueError("Use --recipients, --status or --mode to choose the recipients")
+
+        result = send_broadcast(
+            args.text,
+            recipients=recipients,
+            filters=filters,
+            broadcast_id=args.broadcast_id,
+            retry_failed=args.retry_failed
+        )
+
+        print(f"\n✓ Broadcast {result['broadcast_id']}: {result['recipients']} recipients")
+        print(f"   Sent: {result['sent']}  Failed: {result['failed']}  Saved to conversations: {result['saved']}")
+        if result['pending']:
+            print(f"   Not sent yet: {result['pending']}")
+        if result['failed'] or result['unsaved'] or result['pending']:
+            print(f"   Resume with: --id {result['broadcast_id']}"
+                  f"{' --retry-failed' if result['failed'] else ''}")
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,538 @@
+"""
+Conversation Archive
+Moves conversations resolved long ago out of the hot `conversations`
+collection, so list queries, counts and real-time listeners only see
+recent threads.
+
+An archived conversation is one document in `conversations_archive` (its
+summary fields) plus its whole message history, serialized to JSON,
+compressed with zlib and split into `chunks` documents (Firestore caps a
+document at 1 MiB). Archived conversations are still readable through
+get_conversation / get_messages_page, and are restored to the hot
+collection when a new message arrives (see restore_conversation).
+
+Chunks belong to a generation named in the archive document: archiving a
+conversation that already has an archive (e.g. the bot recreated it
+without restoring) writes the merged history as a new generation, and the
+old chunks are only deleted once the archive document points to it. A
+conversation created while its archive could not be restored gets the
+`archivedHistory` marker; reads only look up the archive of a hot
+conversation that has it.
+
+Firestore only: other storage backends keep every conversation in place.
+"""
+
+import json
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from google.cloud import firestore
+from google.cloud.firestore_v1 import FieldFilter
+from services.firebase_service import (
+    MESSAGE_STORAGE_SUBCOLLECTION,
+    MESSAGES_SUBCOLLECTION,
+    build_search_tokens,
+    load_messages,
+    merge_messages,
+    message_doc_id,
+    message_document,
+    read_options,
+    write_options
+)
+from services.usage import add_reads, add_writes, query_reads, track
+
+
+ARCHIVE_COLLECTION = 'conversations_archive'
+CHUNKS_SUBCOLLECTION = 'chunks'
+
+# Format of the packed message history
+ARCHIVE_ENCODING = 'json+zlib'
+
+# Bytes of compressed history per chunk document (Firestore limit: 1 MiB)
+CHUNK_BYTES = 900_000
+
+# Chunk documents per commit (a commit request is limited to 10 MiB)
+CHUNKS_PER_BATCH = 8
+
+# Writes per batch (Firestore allows at most 500)
+BATCH_SIZE = 400
+
+# An archive still marked `archiving` after this long was left by a crashed
+# run (its message deletes may be incomplete) and can be archived again
+ARCHIVING_TIMEOUT = timedelta(hours=1)
+
+# Conversation fields kept in the archive document
+ARCHIVED_FIELDS = [
+    'mode',
+    'status',
+    'lastMessage',
+    'escalatedAt',
+    'lastMessagePreview',
+    'lastMessageFrom',
+    'messageCount',
+    'unread'
+]
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    raise TypeError(f"Cannot archive value of type {type(value).__name__}")
+
+
+def _decode_object(obj):
+    if len(obj) == 1 and '$datetime' in obj:
+        return datetime.fromisoformat(obj['$datetime'])
+    return obj
+
+
+def pack_messages(messages):
+    """
+    Serialize and compress a message history.
+
+    Args:
+        messages (list): Message dictionaries, oldest first
+
+    Returns:
+        bytes: Compressed history
+    """
+    raw = json.dumps(messages, default=_encode_value, ensure_ascii=False, separators=(',', ':'))
+    return zlib.compress(raw.encode('utf-8'), 9)
+
+
+def unpack_messages(blob):
+    """
+    Inverse of pack_messages.
+
+    Returns:
+        list: Message dictionaries (timestamps as aware datetimes)
+    """
+    return json.loads(zlib.decompress(blob).decode('utf-8'), object_hook=_decode_object)
+
+
+def _archive_ref(db, phone_number):
+    return db.collection(ARCHIVE_COLLECTION).document(phone_number)
+
+
+def _chunk_refs(archive_ref, chunk_count, generation=None):
+    """
+    References to the chunks of one archive generation, in order (archives
+    written before generations existed use bare indexes as IDs).
+    """
+    prefix = f'{generation}-' if generation else ''
+    chunks_ref = archive_ref.collection(CHUNKS_SUBCOLLECTION)
+    return [chunks_ref.document(f'{prefix}{index:05d}') for index in range(chunk_count)]
+
+
+def _archive_chunk_refs(archive_ref, data):
+    return _chunk_refs(archive_ref, data.get('chunkCount', 0), data.get('generation'))
+
+
+def _is_archiving(data):
+    """
+    True if an archive run is still deleting this conversation's messages.
+    """
+    archived_at = data.get('archivedAt')
+    return bool(data.get('archiving')) and (
+        archived_at is None or archived_at > datetime.now(timezone.utc) - ARCHIVING_TIMEOUT
+    )
+
+
+def _load_archived_messages(db, archive_ref, data):
+    """
+    Read and unpack the chunks of an archived conversation.
+
+    Args:
+        db (firestore.Client): Firestore database client
+        archive_ref (DocumentReference): Archive document reference
+        data (dict): Archive document data
+
+    Returns:
+        list: Messages, oldest first
+    """
+    refs = _archive_chunk_refs(archive_ref, data)
+    if not refs:
+        return []
+
+    chunks = [snapshot.to_dict() for snapshot in db.get_all(refs, **read_options()) if snapshot.exists]
+    add_reads(len(refs))
+    if len(chunks) != len(refs):
+        raise RuntimeError(f"Archive of {archive_ref.id} is missing chunks")
+
+    chunks.sort(key=lambda chunk: chunk['index'])
+    return unpack_messages(b''.join(chunk['data'] for chunk in chunks))
+
+
+def _delete_refs(db, refs):
+    """
+    Delete documents in batches.
+    """
+    for first in range(0, len(refs), BATCH_SIZE):
+        batch = db.batch()
+        for ref in refs[first:first + BATCH_SIZE]:
+            batch.delete(ref)
+        batch.commit(**write_options(idempotent=True))
+        add_writes(len(refs[first:first + BATCH_SIZE]))
+
+
+def _delete_archive(db, archive_ref, data):
+    """
+    Delete an archive document and its chunks in one batch.
+    """
+    refs = _archive_chunk_refs(archive_ref, data)
+    batch = db.batch()
+    for ref in refs:
+        batch.delete(ref)
+    batch.delete(archive_ref)
+    batch.commit(**write_options(idempotent=True))
+    add_writes(len(refs) + 1)
+
+
+def get_archived_conversation(db, phone_number, include_messages=True):
+    """
+    Read an archived conversation.
+
+    Args:
+        db (firestore.Client): Firestore database client
+        phone_number (str): Phone number (document ID)
+        include_messages (bool): Unpack the message history
+
+    Returns:
+        dict: Conversation with `archived` = True (and messages if
+            requested), or None if it is not archived
+    """
+    archive_ref = _archive_ref(db, phone_number)
+    snapshot = archive_ref.get(**read_options())
+    add_reads()
+    if not snapshot.exists:
+        return None
+
+    data = snapshot.to_dict()
+    conversation = {field: data.get(field) for field in ARCHIVED_FIELDS}
+    conversation['archivedAt'] = data.get('archivedAt')
+    conversation['archived'] = True
+    conversation['phone_number'] = phone_number
+    if include_messages:
+        conversation['messages'] = _load_archived_messages(db, archive_ref, data)
+    return conversation
+
+
+def get_archived_messages_page(db, phone_number, limit=50, before=None):
+    """
+    Window of an archived conversation's history, shaped like
+    firebase_service.get_messages_page.
+
+    Returns:
+        dict: messages, cursor and has_more, or None if it is not archived
+    """
+    conversation = get_archived_conversation(db, phone_number)
+    if conversation is None:
+        return None
+
+    messages = [
+        message for message in conversation['messages']
+        if before is None or (message.get('timestamp') and message['timestamp'] < before)
+    ]
+    has_more = len(messages) > limit
+    window = messages[-limit:] if limit else []
+
+    return {
+        'messages': window,
+        'cursor': window[0].get('timestamp') if has_more and window else None,
+        'has_more': has_more
+    }
+
+
+def archive_conversation(db, snapshot):
+    """
+    Move one conversation to the archive.
+
+    The history is written as a new chunk generation, then the archive
+    document is created (or, if the conversation was archived before,
+    updated with a precondition to the merged history), so a complete copy
+    exists before anything is deleted. The conversation is then deleted
+    with a last-update-time precondition: if it changed in the meantime (a
+    new message), it stays in place. While its remaining message documents
+    are deleted, the archive is marked `archiving`, and restore_conversation
+    leaves it alone.
+
+    Args:
+        db (firestore.Client): Firestore database client
+        snapshot (DocumentSnapshot): Conversation document
+
+    Returns:
+        dict: messages, raw_bytes and packed_bytes, or None if the
+            conversation (or its archive) changed while being archived
+    """
+    with track('archive_conversation'):
+        doc_ref = snapshot.reference
+        data = snapshot.to_dict() or {}
+        messages = load_messages(doc_ref, data)
+
+        # Restored messages are keyed by messageId (legacy ones may lack it)
+        for message in messages:
+            if not message.get('messageId'):
+                message['messageId'] = str(uuid.uuid4())
+
+        archive_ref = _archive_ref(db, doc_ref.id)
+        existing = archive_ref.get(**read_options())
+        add_reads()
+        previous = existing.to_dict() if existing.exists else None
+
+        if previous is not None:
+            if _is_archiving(previous):
+                print(f"[Archive] {doc_ref.id} is being archived by another run, skipped")
+                return None
+            # Archived before and recreated since: keep both histories
+            messages = merge_messages(_load_archived_messages(db, archive_ref, previous), messages)
+
+        raw_size = len(json.dumps(messages, default=_encode_value, ensure_ascii=False).encode('utf-8'))
+        blob = pack_messages(messages)
+        chunks = [blob[start:start + CHUNK_BYTES] for start in range(0, len(blob), CHUNK_BYTES)]
+
+        generation = uuid.uuid4().hex[:12]
+        chunk_refs = _chunk_refs(archive_ref, len(chunks), generation)
+
+        for first in range(0, len(chunks), CHUNKS_PER_BATCH):
+            batch = db.batch()
+            for index in range(first, min(first + CHUNKS_PER_BATCH, len(chunks))):
+                batch.create(chunk_refs[index], {'index': index, 'generation': generation, 'data': chunks[index]})
+            batch.commit(**write_options(idempotent=True))
+            add_writes(min(CHUNKS_PER_BATCH, len(chunks) - first))
+
+        archive_data = {
+            **{field: data.get(field) for field in ARCHIVED_FIELDS},
+            'messageCount': len(messages),
+            'archivedAt': datetime.now(timezone.utc),
+            'encoding': ARCHIVE_ENCODING,
+            'generation': generation,
+            'chunkCount': len(chunks),
+            'packedBytes': len(blob),
+            'archiving': True
+        }
+
+        try:
+            if previous is None:
+                archive_ref.create(archive_data, **write_options())
+            else:
+                archive_ref.update(
+                    archive_data,
+                    option=db.write_option(last_update_time=existing.update_time),
+                    **write_options()
+                )
+        except (AlreadyExists, FailedPrecondition):
+            print(f"[Archive] Archive of {doc_ref.id} changed while archiving, skipped")
+            _delete_refs(db, chunk_refs)
+            return None
+        add_writes()
+
+        # The archive document no longer points to the previous chunks
+        if previous is not None:
+            _delete_refs(db, _archive_chunk_refs(archive_ref, previous))
+
+        # Message documents are listed, not taken from `messages`, so
+        # legacy embedded messages are not looked up as documents
+        message_refs = []
+        if data.get('messageStorage') == MESSAGE_STORAGE_SUBCOLLECTION:
+            message_refs = [
+                message.reference
+                for message in doc_ref.collection(MESSAGES_SUBCOLLECTION).select([]).stream(**read_options())
+            ]
+            add_reads(query_reads(len(message_refs)))
+
+        # The conversation and its first messages go in one atomic batch
+        batch = db.batch()
+        batch.delete(doc_ref, option=db.write_option(last_update_time=snapshot.update_time))
+        for message_ref in message_refs[:BATCH_SIZE - 1]:
+            batch.delete(message_ref)
+        try:
+            batch.commit(**write_options())
+        except FailedPrecondition:
+            print(f"[Archive] {doc_ref.id} changed while archiving, kept in place")
+            if previous is None:
+                _delete_archive(db, archive_ref, archive_data)
+            else:
+                # The merged copy is a superset of the old archive; reads
+                # merge it with the hot conversation
+                archive_ref.update({'archiving': False}, **write_options(idempotent=True))
+                add_writes()
+                try:
+                    doc_ref.update({'archivedHistory': True}, **write_options(idempotent=True))
+                    add_writes()
+                except NotFound:
+                    pass
+            return None
+        add_writes(1 + len(message_refs[:BATCH_SIZE - 1]))
+
+        # Still marked `archiving`: a restore now could write back messages
+        # that these deletes would then remove
+        _delete_refs(db, message_refs[BATCH_SIZE - 1:])
+
+        archive_ref.update({'archiving': False}, **write_options(idempotent=True))
+        add_writes()
+
+    return {
+        'messages': len(messages),
+        'raw_bytes': raw_size,
+        'packed_bytes': len(blob)
+    }
+
+
+def archive_resolved_conversations(db, days, limit=None, dry_run=False, page_size=100):
+    """
+    Archive conversations resolved more than `days` days ago.
+    Resolution time is taken from lastMessage (mark_resolved sets it, and
+    any later message moves it forward).
+
+    Args:
+        db (firestore.Client): Firestore database client
+        days (float): Minimum age in days
+        limit (int, optional): Maximum conversations to archive
+        dry_run (bool): Only count the conversations that would be archived
+        page_size (int): Conversations read per query
+
+    Returns:
+        dict: archived, skipped, messages, raw_bytes and packed_bytes
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    query = (
+        db.collection('conversations')
+        .where(filter=FieldFilter('status', '==', 'resolved'))
+        .where(filter=FieldFilter('lastMessage', '<', cutoff))
+        .order_by('lastMessage', direction=firestore.Query.DESCENDING)
+    )
+
+    totals = {'archived': 0, 'skipped': 0, 'messages': 0, 'raw_bytes': 0, 'packed_bytes': 0}
+    cursor = None
+
+    while limit is None or totals['archived'] < limit:
+        page = query.start_after(cursor) if cursor is not None else query
+        docs = list(page.limit(page_size).stream(**read_options()))
+        if not docs:
+            break
+
+        for snapshot in docs:
+            if limit is not None and totals['archived'] >= limit:
+                break
+
+            if dry_run:
+                totals['archived'] += 1
+                continue
+
+            result = archive_conversation(db, snapshot)
+            if result is None:
+                totals['skipped'] += 1
+                continue
+
+            totals['archived'] += 1
+            for key in ('messages', 'raw_bytes', 'packed_bytes'):
+                totals[key] += result[key]
+
+        if len(docs) < page_size:
+            break
+        cursor = docs[-1]
+
+    return totals
+
+
+def restore_conversation(db, phone_number):
+    """
+    Move an archived conversation back to the hot collection, reopened
+    (status "active"). Messages are written first and the conversation
+    document last, together with the deletion of the archive, so readers
+    never see a conversation without its history.
+
+    Args:
+        db (firestore.Client): Firestore database client
+        phone_number (str): Phone number (document ID)
+
+    Returns:
+        bool: True if the conversation is back in the hot collection
+            (restored here or by a concurrent writer), False if the
+            archive is still being archived or changed meanwhile (the
+            caller then starts a new conversation with the
+            `archivedHistory` marker, and reads merge it with the
+            archive), None if it was not archived
+    """
+    with track('restore_conversation'):
+        archive_ref = _archive_ref(db, phone_number)
+        snapshot = archive_ref.get(**read_options())
+        add_reads()
+        if not snapshot.exists:
+            return None
+
+        data = snapshot.to_dict()
+        if _is_archiving(data):
+            print(f"[Archive] {phone_number} is still being archived, not restored")
+            return False
+
+        messages = _load_archived_messages(db, archive_ref, data)
+        doc_ref = db.collection('conversations').document(phone_number)
+        messages_ref = doc_ref.collection(MESSAGES_SUBCOLLECTION)
+
+        for first in range(0, len(messages), BATCH_SIZE):
+            batch = db.batch()
+            for message in messages[first:first + BATCH_SIZE]:
+                batch.set(messages_ref.document(message_doc_id(message['messageId'])), message_document(message))
+            batch.commit(**write_options(idempotent=True))
+            add_writes(len(messages[first:first + BATCH_SIZE]))
+
+        batch = db.batch()
+        batch.create(doc_ref, {
+            **{field: data.get(field) for field in ARCHIVED_FIELDS},
+            'status': 'active',
+            'messages': [],
+            'messageCount': len(messages),
+            'messageStorage': MESSAGE_STORAGE_SUBCOLLECTION,
+            'searchTokens': build_search_tokens(phone_number)
+        })
+        chunk_refs = _archive_chunk_refs(archive_ref, data)
+        for ref in chunk_refs:
+            batch.delete(ref)
+        # Not if it was archived again meanwhile (new generation)
+        batch.delete(archive_ref, option=db.write_option(last_update_time=snapshot.update_time))
+
+        try:
+            batch.commit(**write_options(idempotent=True))
+        except AlreadyExists:
+            # Another writer restored it first
+            return True
+        except FailedPrecondition:
+            print(f"[Archive] Archive of {phone_number} changed while restoring, not restored")
+            return False
+        add_writes(len(chunk_refs) + 2)
+
+    print(f"[Archive] Restored {phone_number} ({len(messages)} messages)")
+    return True
+
+
+def delete_archived_conversation(db, phone_number):
+    """
+    Delete an archived conversation.
+
+    Returns:
+        bool: True if it was archived
+    """
+    with track('delete_archived_conversation'):
+        archive_ref = _archive_ref(db, phone_number)
+        snapshot = archive_ref.get(field_paths=['chunkCount', 'generation'], **read_options())
+        add_reads()
+        if not snapshot.exists:
+            return False
+        _delete_archive(db, archive_ref, snapshot.to_dict() or {})
+    return True
+
+
+def find_archived(db, phone_numbers):
+    """
+    Which of the given phone numbers are archived (one get_all call).
+
+    Returns:
+        set: Archived phone numbers
+    """
+    refs = [_archive_ref(db, phone) for phone in phone_numbers]
+    if not refs:
+        return set()
+    add_reads(len(refs))
+    return {doc.id for doc in db.get_all(refs, field_paths=['chunkCount'], **read_options()) if doc.exists}
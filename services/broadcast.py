@@ -0,0 +1,398 @@
+"""
+Broadcasts
+Send one message to many recipients: an explicit list or every
+conversation matching a filter (e.g. all active conversations waiting on a
+shipping update).
+
+Sends go through the outbound dispatcher, so they share the WhatsApp rate
+limit with agent replies and keep per-recipient order. Progress is
+checkpointed per recipient in a local SQLite file: running a broadcast
+again with the same ID resumes it, skipping recipients already sent.
+Sent messages are written back to their conversations with
+add_messages_bulk, in batches.
+"""
+
+import os
+import queue
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+from config.settings import get_setting, get_float_setting
+
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'broadcasts.db')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS recipients (
+    broadcast_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    phone_number TEXT NOT NULL,
+    state TEXT NOT NULL,
+    message_id TEXT,
+    sent_at REAL,
+    error TEXT,
+    PRIMARY KEY (broadcast_id, phone_number)
+);
+CREATE INDEX IF NOT EXISTS recipients_state ON recipients (broadcast_id, state, position);
+"""
+
+# Recipient states: not sent yet -> sent (delivered to WhatsApp) -> saved
+# (written to the conversation), or failed
+STATE_PENDING = 'pending'
+STATE_SENT = 'sent'
+STATE_SAVED = 'saved'
+STATE_FAILED = 'failed'
+
+# Conversations read per page when resolving a filter
+RECIPIENTS_PAGE_SIZE = 500
+
+# Sent messages written back per add_messages_bulk call
+SAVE_BATCH_SIZE = 400
+
+# Progress is logged every this many recipients
+_LOG_EVERY = 500
+
+
+class BroadcastCheckpoint:
+    """
+    Per-recipient progress of broadcasts, stored in SQLite. Used from the
+    thread running the broadcast only.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): SQLite file (":memory:" for a non-durable checkpoint)
+        """
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+
+    def get_broadcast(self, broadcast_id):
+        """
+        Returns:
+            dict: id, text, created_at and finished_at, or None if unknown
+        """
+        row = self._conn.execute(
+            'SELECT id, text, created_at, finished_at FROM broadcasts WHERE id = ?',
+            (broadcast_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'text', 'created_at', 'finished_at'), row))
+
+    def create(self, broadcast_id, text, phone_numbers):
+        """
+        Record a new broadcast and its recipients (all pending), atomically.
+        """
+        with self._conn:
+            self._conn.execute(
+                'INSERT INTO broadcasts (id, text, created_at) VALUES (?, ?, ?)',
+                (broadcast_id, text, time.time())
+            )
+            self._conn.executemany(
+                'INSERT INTO recipients (broadcast_id, position, phone_number, state) VALUES (?, ?, ?, ?)',
+                [(broadcast_id, position, phone, STATE_PENDING) for position, phone in enumerate(phone_numbers)]
+            )
+
+    def get_recipients(self, broadcast_id, state):
+        """
+        Returns:
+            list: (phone_number, message_id, sent_at) tuples in the given
+                state, in recipient order
+        """
+        return self._conn.execute(
+            'SELECT phone_number, message_id, sent_at FROM recipients '
+            'WHERE broadcast_id = ? AND state = ? ORDER BY position',
+            (broadcast_id, state)
+        ).fetchall()
+
+    def mark_sent(self, broadcast_id, phone_number, message_id):
+        with self._conn:
+            self._conn.execute(
+                'UPDATE recipients SET state = ?, message_id = ?, sent_at = ?, error = NULL '
+                'WHERE broadcast_id = ? AND phone_number = ?',
+                (STATE_SENT, message_id, time.time(), broadcast_id, phone_number)
+            )
+
+    def mark_failed(self, broadcast_id, phone_number, error):
+        with self._conn:
+            self._conn.execute(
+                'UPDATE recipients SET state = ?, error = ? WHERE broadcast_id = ? AND phone_number = ?',
+                (STATE_FAILED, error, broadcast_id, phone_number)
+            )
+
+    def mark_saved(self, broadcast_id, phone_numbers):
+        with self._conn:
+            self._conn.executemany(
+                'UPDATE recipients SET state = ? WHERE broadcast_id = ? AND phone_number = ?',
+                [(STATE_SAVED, broadcast_id, phone) for phone in phone_numbers]
+            )
+
+    def retry_failed(self, broadcast_id):
+        """
+        Move failed recipients back to pending.
+
+        Returns:
+            int: Number of recipients reset
+        """
+        with self._conn:
+            cursor = self._conn.execute(
+                'UPDATE recipients SET state = ?, error = NULL WHERE broadcast_id = ? AND state = ?',
+                (STATE_PENDING, broadcast_id, STATE_FAILED)
+            )
+        return cursor.rowcount
+
+    def finish(self, broadcast_id):
+        with self._conn:
+            self._conn.execute(
+                'UPDATE broadcasts SET finished_at = ? WHERE id = ?',
+                (time.time(), broadcast_id)
+            )
+
+    def get_progress(self, broadcast_id):
+        """
+        Returns:
+            dict: Number of recipients per state (pending, sent, saved, failed)
+        """
+        progress = dict.fromkeys((STATE_PENDING, STATE_SENT, STATE_SAVED, STATE_FAILED), 0)
+        rows = self._conn.execute(
+            'SELECT state, COUNT(*) FROM recipients WHERE broadcast_id = ? GROUP BY state',
+            (broadcast_id,)
+        ).fetchall()
+        progress.update(rows)
+        return progress
+
+    def close(self):
+        self._conn.close()
+
+
+def resolve_recipients(filters):
+    """
+    Phone numbers of every conversation matching a filter, newest first.
+
+    Args:
+        filters (dict): Same filter options as get_conversations_page
+
+    Returns:
+        list: Phone numbers
+
+    Raises:
+        RuntimeError: If a page could not be read (a stale page could send
+            to the wrong audience)
+    """
+    from services.firebase_service import get_conversations_page_result
+
+    phone_numbers = []
+    cursor = None
+
+    while True:
+        result = get_conversations_page_result(filters, page_size=RECIPIENTS_PAGE_SIZE, cursor=cursor)
+        if result.failed or result.stale:
+            raise RuntimeError(f"Could not read conversations: {result.error}")
+
+        page = result.data
+        phone_numbers.extend(conversation['phone_number'] for conversation in page['conversations'])
+        if not page['has_more']:
+            return phone_numbers
+        cursor = page['next_cursor']
+
+
+def _save_sent(checkpoint, broadcast_id, text, sent):
+    """
+    Write sent messages to their conversations and mark the ones written
+    as saved (the others stay sent and are written on the next call).
+    """
+    from services.firebase_service import add_messages_bulk
+
+    if not sent:
+        return 0
+
+    items = [
+        {
+            'phone_number': phone,
+            'from': 'human',
+            'text': text,
+            'message_id': message_id or None,
+            'timestamp': datetime.fromtimestamp(sent_at) if sent_at else None
+        }
+        for phone, message_id, sent_at in sent
+    ]
+
+    result = add_messages_bulk(items)
+    failed = {failure['index'] for failure in result['failed']}
+    saved = [phone for index, (phone, _, _) in enumerate(sent) if index not in failed]
+    checkpoint.mark_saved(broadcast_id, saved)
+
+    if failed:
+        print(f"[Broadcast] {len(failed)} sent messages could not be saved yet (kept for the next write)")
+    return len(saved)
+
+
+def run_broadcast(text, recipients=None, filters=None, broadcast_id=None, retry_failed=False,
+                  dispatcher=None, checkpoint_path=None, max_in_flight=None, save_batch=SAVE_BATCH_SIZE,
+                  result_timeout=None):
+    """
+    Send a message to many recipients, resuming a broadcast with the same ID.
+
+    The recipient list is fixed when the broadcast is created (a filter is
+    resolved once), so a resumed run targets the same audience. Recipients
+    are delivered at least once: one whose send finished but was not
+    checkpointed before a crash is sent again on resume.
+
+    Args:
+        text (str): Message text
+        recipients (list, optional): Phone numbers (duplicates are ignored)
+        filters (dict, optional): Conversation filter, used when recipients
+            is not given (same options as get_conversations_page)
+        broadcast_id (str, optional): ID to create or resume (generated if
+            not provided)
+        retry_failed (bool): On resume, send again to failed recipients
+        dispatcher (OutboundDispatcher, optional): Defaults to the shared one
+        checkpoint_path (str, optional): SQLite checkpoint file
+            (BROADCAST_CHECKPOINT_PATH setting)
+        max_in_flight (int, optional): Sends queued in the dispatcher at
+            once (default: one second of the rate limit), so agent replies
+            are not stuck behind the whole broadcast
+        save_batch (int): Sent messages written back per batch
+        result_timeout (float, optional): Seconds to wait for the next send
+            to finish before giving up; the recipients still in flight stay
+            pending for a resumed run (BROADCAST_RESULT_TIMEOUT setting)
+
+    Returns:
+        dict: Result
+            - broadcast_id (str): ID to resume the broadcast with
+            - recipients (int): Total recipients
+            - sent (int): Messages sent by this run
+            - failed (int): Recipients that failed (in total)
+            - saved (int): Messages written to conversations by this run
+            - unsaved (int): Sent messages not written to their conversation yet
+            - pending (int): Recipients not sent yet (the run gave up waiting)
+
+    Raises:
+        ValueError: If the text is empty, no recipients are given for a new
+            broadcast, or the ID belongs to a broadcast with another text
+    """
+    if not text:
+        raise ValueError("Broadcast text is required")
+
+    if dispatcher is None:
+        from services.outbound_dispatcher import get_outbound_dispatcher
+        dispatcher = get_outbound_dispatcher()
+
+    checkpoint = BroadcastCheckpoint(
+        checkpoint_path or get_setting('BROADCAST_CHECKPOINT_PATH', DEFAULT_CHECKPOINT_PATH)
+    )
+
+    try:
+        broadcast_id = broadcast_id or str(uuid.uuid4())
+        existing = checkpoint.get_broadcast(broadcast_id)
+
+        if existing is None:
+            if recipients is None:
+                if filters is None:
+                    raise ValueError("Either recipients or filters is required")
+                recipients = resolve_recipients(filters)
+            phone_numbers = list(dict.fromkeys(phone for phone in recipients if phone))
+            checkpoint.create(broadcast_id, text, phone_numbers)
+            print(f"[Broadcast] Created {broadcast_id} for {len(phone_numbers)} recipients")
+        else:
+            if existing['text'] != text:
+                raise ValueError(f"Broadcast {broadcast_id} was created with a different text")
+            if retry_failed:
+                checkpoint.retry_failed(broadcast_id)
+            print(f"[Broadcast] Resuming {broadcast_id}: {checkpoint.get_progress(broadcast_id)}")
+
+        result = {
+            'broadcast_id': broadcast_id,
+            'recipients': sum(checkpoint.get_progress(broadcast_id).values()),
+            'sent': 0,
+            'failed': 0,
+            'saved': 0,
+            'unsaved': 0,
+            'pending': 0
+        }
+
+        # Sent before a crash but not written back yet
+        unsaved = checkpoint.get_recipients(broadcast_id, STATE_SENT)
+        for start in range(0, len(unsaved), save_batch):
+            result['saved'] += _save_sent(checkpoint, broadcast_id, text, unsaved[start:start + save_batch])
+
+        if result_timeout is None:
+            result_timeout = get_float_setting('BROADCAST_RESULT_TIMEOUT', 600)
+
+        stats = dispatcher.get_stats()
+        window = max_in_flight or max(stats['workers'] * 2, int(stats['rate']) or 100)
+
+        # Workers report back here; the checkpoint is only used from this thread
+        done = queue.Queue()
+        pending = iter(checkpoint.get_recipients(broadcast_id, STATE_PENDING))
+        in_flight = 0
+        sent = []
+        handled = 0
+
+        while True:
+            while in_flight < window:
+                recipient = next(pending, None)
+                if recipient is None:
+                    break
+                dispatcher.submit(
+                    recipient[0],
+                    text,
+                    on_done=lambda message, outcome: done.put((message, outcome)),
+                    # A resumed run never delivers twice what this process already sent
+                    idempotency_key=f"{broadcast_id}:{recipient[0]}"
+                )
+                in_flight += 1
+
+            if not in_flight:
+                break
+
+            try:
+                message, outcome = done.get(timeout=result_timeout)
+            except queue.Empty:
+                print(f"[Broadcast] {broadcast_id}: no send finished in {result_timeout:.0f}s, "
+                      f"stopping with {in_flight} in flight (resume to retry them)")
+                break
+            in_flight -= 1
+            handled += 1
+
+            if outcome.get('success'):
+                checkpoint.mark_sent(broadcast_id, message.phone_number, outcome.get('message_id', ''))
+                sent.append((message.phone_number, outcome.get('message_id', ''), time.time()))
+                result['sent'] += 1
+            else:
+                checkpoint.mark_failed(broadcast_id, message.phone_number, outcome.get('error', 'Unknown error'))
+
+            if len(sent) >= save_batch:
+                result['saved'] += _save_sent(checkpoint, broadcast_id, text, sent)
+                sent = []
+
+            if handled % _LOG_EVERY == 0:
+                print(f"[Broadcast] {broadcast_id}: {handled} recipients processed")
+
+        result['saved'] += _save_sent(checkpoint, broadcast_id, text, sent)
+
+        progress = checkpoint.get_progress(broadcast_id)
+        result['failed'] = progress[STATE_FAILED]
+        result['unsaved'] = progress[STATE_SENT]
+        result['pending'] = progress[STATE_PENDING]
+        if not progress[STATE_PENDING] and not progress[STATE_SENT]:
+            checkpoint.finish(broadcast_id)
+
+        print(f"[Broadcast] {broadcast_id}: sent {result['sent']}, failed {result['failed']}, saved {result['saved']}")
+        return result
+
+    finally:
+        checkpoint.close()
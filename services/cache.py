@@ -0,0 +1,132 @@
+"""
+Read Cache
+Bounded, thread-safe TTL cache with LRU eviction and hit/miss counters.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Size-capped cache. Entries expire `ttl` seconds after being stored and
+    the least recently used entry is evicted when the cache is full.
+
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, maxsize=256, ttl=30):
+        """
+        Args:
+            maxsize (int): Maximum number of entries (0 disables the cache)
+            ttl (float): Seconds an entry stays valid (0 disables the cache)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key, default=None):
+        """
+        Get a cached value.
+
+        Args:
+            key: Hashable cache key
+            default: Value returned on a miss
+
+        Returns:
+            The cached value, or default
+        """
+        if not self.enabled:
+            return default
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Store a value, evicting the least recently used entries if full.
+
+        Args:
+            key: Hashable cache key
+            value: Value to cache
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, predicate):
+        """
+        Remove every entry whose key matches a predicate.
+
+        Args:
+            predicate (callable): Function key -> bool
+
+        Returns:
+            int: Number of removed entries
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            self._stats['invalidations'] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def get_stats(self):
+        """
+        Get cache counters for tuning.
+
+        Returns:
+            dict: hits, misses, evictions, expirations, invalidations,
+                size, maxsize, ttl and hit_rate
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+
+        lookups = stats['hits'] + stats['misses']
+        stats['maxsize'] = self.maxsize
+        stats['ttl'] = self.ttl
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -1,110 +1,1008 @@
 """
 Firebase Service Layer
-CRUD operations for conversations and messages in Firestore.
+CRUD operations for conversations and messages in Firestore, or in the
+storage backend selected with STORAGE_BACKEND (see services/storage.py).
 """
 
 from config.firebase import get_db
-from datetime import datetime
+from config.settings import get_setting, get_int_setting, get_float_setting
+from datetime import datetime, timedelta
+from google.api_core.exceptions import (
+    Aborted,
+    AlreadyExists,
+    DeadlineExceeded,
+    InternalServerError,
+    NotFound,
+    ResourceExhausted,
+    ServiceUnavailable
+)
+from google.api_core.retry import AsyncRetry, Retry, if_exception_type
 from google.cloud.firestore_v1 import FieldFilter
+from google.cloud.firestore_v1.base_query import And, Or
+from services.cache import TTLCache
+from services.storage import get_storage
+from services.usage import add_reads, add_writes, count_reads, query_reads, record, track
 import uuid
 
 
+# Message storage layouts:
+#   - "array": messages embedded in the conversation document (legacy)
+#   - "subcollection": one document per message in conversations/{phone}/messages
+# Reads always merge both layouts, so conversations can be migrated while
+# the dashboard (and the bot) keep writing.
+MESSAGE_STORAGE_ARRAY = 'array'
+MESSAGE_STORAGE_SUBCOLLECTION = 'subcollection'
+MESSAGES_SUBCOLLECTION = 'messages'
+
+# Array layout: one empty document per stored messageId, created in the
+# same commit as the message, so a replayed message fails with AlreadyExists
+# instead of being counted again (the subcollection layout creates the
+# message document itself)
+MESSAGE_IDS_SUBCOLLECTION = 'messageIds'
+
+
+# Denormalized fields kept on every conversation document so the sidebar list
+# can be served with a field-mask projection (no `messages` array download).
+SUMMARY_FIELDS = [
+    'mode',
+    'status',
+    'lastMessage',
+    'escalatedAt',
+    'lastMessagePreview',
+    'lastMessageFrom',
+    'messageCount',
+    'unread'
+]
+
+# Maximum length of the stored last-message preview
+PREVIEW_MAX_LENGTH = 100
+
+# Firestore allows at most 500 operations per WriteBatch
+MAX_BATCH_OPS = 500
+
+# Shortest phone-number fragment that can be searched. Every digit substring
+# of at least this length is stored in `searchTokens` (55 tokens for a
+# 12-digit number), so searches are a single array_contains query.
+SEARCH_MIN_LENGTH = 3
+
+# Process-wide read cache. Writes made through this module update it right
+# away; changes made elsewhere (the bot, other servers) show up after the TTL.
+_read_cache = TTLCache(
+    maxsize=get_int_setting('READ_CACHE_SIZE', 256),
+    ttl=get_float_setting('READ_CACHE_TTL', 15)
+)
+
+
+# Firestore errors worth retrying: the same request may succeed a moment later
+RETRYABLE_ERRORS = (
+    Aborted,
+    DeadlineExceeded,
+    InternalServerError,
+    ResourceExhausted,
+    ServiceUnavailable
+)
+
+# Per-attempt timeout of every Firestore call, and total time a read may
+# spend retrying, so a slow or failing backend cannot hang a rerun
+RPC_TIMEOUT = get_float_setting('FIRESTORE_RPC_TIMEOUT', 5)
+READ_DEADLINE = get_float_setting('FIRESTORE_READ_DEADLINE', 15)
+
+# Exponential backoff with jitter (google.api_core.retry)
+_retry = Retry(
+    predicate=if_exception_type(*RETRYABLE_ERRORS),
+    initial=0.25,
+    maximum=4.0,
+    multiplier=2.0,
+    timeout=READ_DEADLINE
+)
+
+# Same policy for the AsyncClient (services/firebase_service_async.py)
+_async_retry = AsyncRetry(
+    predicate=if_exception_type(*RETRYABLE_ERRORS),
+    initial=0.25,
+    maximum=4.0,
+    multiplier=2.0,
+    timeout=READ_DEADLINE
+)
+
+# Last successful result of each read, served (marked stale) when the same
+# read fails later
+_last_good = TTLCache(
+    maxsize=get_int_setting('STALE_CACHE_SIZE', 256),
+    ttl=get_float_setting('STALE_CACHE_TTL', 3600)
+)
+
+
+def read_options():
+    """
+    Retry and timeout arguments for Firestore reads.
+    """
+    return {'retry': _retry, 'timeout': RPC_TIMEOUT}
+
+
+def async_read_options():
+    """
+    Retry and timeout arguments for AsyncClient reads.
+    """
+    return {'retry': _async_retry, 'timeout': RPC_TIMEOUT}
+
+
+def write_options(idempotent=False):
+    """
+    Retry and timeout arguments for Firestore writes. Only writes that can
+    be safely applied twice are retried here; the rest keep the client's
+    default policy (the write-behind queue retries them from the journal).
+    """
+    if idempotent:
+        return {'retry': _retry, 'timeout': RPC_TIMEOUT}
+    return {'timeout': RPC_TIMEOUT}
+
+
+def async_write_options(idempotent=False):
+    """
+    Retry and timeout arguments for AsyncClient writes (same policy as
+    write_options).
+    """
+    if idempotent:
+        return {'retry': _async_retry, 'timeout': RPC_TIMEOUT}
+    return {'timeout': RPC_TIMEOUT}
+
+
+# ReadResult statuses
+RESULT_OK = 'ok'
+RESULT_EMPTY = 'empty'
+RESULT_STALE = 'stale'
+RESULT_FAILED = 'failed'
+
+
+class ReadResult:
+    """
+    Outcome of a read, so callers can tell "nothing there" from "could not
+    ask":
+        - ok: fresh data
+        - empty: fresh, but nothing matched (no conversations, no messages)
+        - stale: the read failed; data is the last good result
+        - failed: the read failed and there is no previous result (data None)
+    """
+
+    __slots__ = ('status', 'data', 'error')
+
+    def __init__(self, status, data=None, error=None):
+        self.status = status
+        self.data = data
+        self.error = error
+
+    @property
+    def stale(self):
+        return self.status == RESULT_STALE
+
+    @property
+    def failed(self):
+        return self.status == RESULT_FAILED
+
+    def __repr__(self):
+        return f"ReadResult({self.status!r}, error={self.error!r})"
+
+
+def get_read_cache_stats():
+    """
+    Get hit/miss/eviction counters of the read cache.
+
+    Returns:
+        dict: Cache counters (see TTLCache.get_stats)
+    """
+    return _read_cache.get_stats()
+
+
+def clear_read_cache():
+    """
+    Drop every cached read (benchmarks measuring uncached latency).
+    """
+    _read_cache.clear()
+
+
+def filters_key(filters):
+    """
+    Build a hashable cache key from a filters dict.
+    """
+    if not filters:
+        return ()
+    return tuple(sorted(
+        (key, tuple(sorted(value)) if isinstance(value, list) else value)
+        for key, value in filters.items()
+    ))
+
+
+def invalidate_conversation(phone_number):
+    """
+    Drop cached reads affected by a write to one conversation: its own
+    entries, every list page and the bucket counts.
+    """
+    _read_cache.invalidate(
+        lambda key: key[0] in ('list', 'page', 'counts') or key[1] == phone_number
+    )
+
+
+def get_message_storage():
+    """
+    Get the configured message storage layout for new messages.
+
+    Returns:
+        str: MESSAGE_STORAGE_ARRAY or MESSAGE_STORAGE_SUBCOLLECTION
+    """
+    storage = get_setting('MESSAGE_STORAGE', MESSAGE_STORAGE_SUBCOLLECTION)
+    if storage not in [MESSAGE_STORAGE_ARRAY, MESSAGE_STORAGE_SUBCOLLECTION]:
+        print(f"[Firebase Service] Invalid MESSAGE_STORAGE: {storage}. Using '{MESSAGE_STORAGE_SUBCOLLECTION}'")
+        return MESSAGE_STORAGE_SUBCOLLECTION
+    return storage
+
+
+def message_doc_id(message_id):
+    """
+    Convert a message ID into a valid Firestore document ID.
+    WhatsApp IDs are base64-like and may contain '/', which Firestore
+    does not allow in document IDs.
+
+    Args:
+        message_id (str): Message ID
+
+    Returns:
+        str: Document ID for the messages subcollection
+    """
+    return str(message_id).replace('/', '_')
+
+
+def message_document(message):
+    """
+    Data of a message document in the messages subcollection: the message
+    plus `updatedAt`, set by the server at commit time. The search index's
+    change feed (services/search_index.py) follows `updatedAt`, which, unlike
+    the client-set `timestamp`, never goes back in time.
+
+    Args:
+        message (dict): Message object
+
+    Returns:
+        dict: Document data
+    """
+    return {**message, 'updatedAt': firestore.SERVER_TIMESTAMP}
+
+
+def merge_messages(embedded, stored):
+    """
+    Merge embedded (array) and subcollection messages into one timeline.
+    Messages present in both layouts (mid-migration) appear once.
+
+    Args:
+        embedded (list): Messages from the legacy `messages` array
+        stored (list): Messages from the messages subcollection
+
+    Returns:
+        list: Messages sorted by timestamp, oldest first
+    """
+    merged = {}
+    for message in (embedded or []) + (stored or []):
+        key = message.get('messageId') or id(message)
+        merged[key] = message
+
+    return sorted(
+        merged.values(),
+        key=lambda m: m.get('timestamp') or datetime.min
+    )
+
+
+def load_messages(doc_ref, data):
+    """
+    Load every message of a conversation from both storage layouts.
+
+    Args:
+        doc_ref (DocumentReference): Conversation document reference
+        data (dict): Conversation document data
+
+    Returns:
+        list: Messages sorted by timestamp, oldest first
+    """
+    embedded = data.get('messages', [])
+
+    # Only conversations that have written to the subcollection need the query
+    if data.get('messageStorage') != MESSAGE_STORAGE_SUBCOLLECTION:
+        return embedded
+
+    stored = [
+        doc.to_dict()
+        for doc in doc_ref.collection(MESSAGES_SUBCOLLECTION).order_by('timestamp').stream(**read_options())
+    ]
+    add_reads(query_reads(len(stored)))
+    return merge_messages(embedded, stored)
+
+
+def _delete_messages_subcollection(db, doc_ref, batch_size=400, collection_id=MESSAGES_SUBCOLLECTION):
+    """
+    Delete every document in a conversation's messages subcollection.
+
+    Args:
+        db (firestore.Client): Firestore database client
+        doc_ref (DocumentReference): Conversation document reference
+        batch_size (int): Deletes per batch (Firestore limit is 500)
+        collection_id (str): Subcollection to empty (MESSAGE_IDS_SUBCOLLECTION
+            for the array layout's markers)
+
+    Returns:
+        int: Number of deleted message documents
+    """
+    deleted = 0
+    messages_ref = doc_ref.collection(collection_id)
+
+    while True:
+        docs = list(messages_ref.limit(batch_size).stream(**read_options()))
+        add_reads(query_reads(len(docs)))
+        if not docs:
+            return deleted
+
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit(**write_options(idempotent=True))
+        add_writes(len(docs))
+        deleted += len(docs)
+
+
+def normalize_phone_search(search):
+    """
+    Normalize a phone-number search string to its digits.
+
+    Args:
+        search (str): Search text typed by the agent
+
+    Returns:
+        str: Digits of the search, or None if shorter than SEARCH_MIN_LENGTH
+    """
+    digits = ''.join(ch for ch in (search or '') if ch.isdigit())
+    if len(digits) < SEARCH_MIN_LENGTH:
+        return None
+    return digits
+
+
+def build_search_tokens(phone_number):
+    """
+    Build the search tokens of a conversation: every substring of the
+    phone number digits with at least SEARCH_MIN_LENGTH digits.
+
+    Args:
+        phone_number (str): Phone number (document ID)
+
+    Returns:
+        list: Sorted unique tokens
+    """
+    digits = ''.join(ch for ch in (phone_number or '') if ch.isdigit())
+    tokens = {
+        digits[start:end]
+        for start in range(len(digits))
+        for end in range(start + SEARCH_MIN_LENGTH, len(digits) + 1)
+    }
+    return sorted(tokens)
+
+
+def build_message_preview(text):
+    """
+    Build the stored preview for a message text.
+
+    Args:
+        text (str): Message text
+
+    Returns:
+        str: Text truncated to PREVIEW_MAX_LENGTH characters
+    """
+    text = text or ''
+    if len(text) > PREVIEW_MAX_LENGTH:
+        return text[:PREVIEW_MAX_LENGTH]
+    return text
+
+
+def build_conversation_summary(messages):
+    """
+    Compute the denormalized summary fields from a full message list.
+    Used by the backfill migration for documents created before the
+    summary fields existed.
+
+    Args:
+        messages (list): Conversation messages, oldest first
+
+    Returns:
+        dict: lastMessagePreview, lastMessageFrom, messageCount and unread
+    """
+    messages = messages or []
+    if not messages:
+        return {
+            'lastMessagePreview': '',
+            'lastMessageFrom': None,
+            'messageCount': 0,
+            'unread': False
+        }
+
+    last_message = messages[-1]
+    return {
+        'lastMessagePreview': build_message_preview(last_message.get('text', '')),
+        'lastMessageFrom': last_message.get('from'),
+        'messageCount': len(messages),
+        'unread': last_message.get('from') == 'user'
+    }
+
+
+# Sidebar buckets: active conversations split by mode, plus resolved ones
+CONVERSATION_BUCKETS = ['bot', 'human', 'resolved']
+
+
+def get_conversation_bucket(conversation):
+    """
+    Get the sidebar bucket of a conversation.
+
+    Args:
+        conversation (dict): Conversation data
+
+    Returns:
+        str: "resolved" for resolved conversations, otherwise the mode
+    """
+    if conversation.get('status', 'active') == 'resolved':
+        return 'resolved'
+    return conversation.get('mode', 'bot')
+
+
+def build_bucket_filter(buckets):
+    """
+    Translate a set of sidebar buckets into a server-side Firestore filter.
+    Only equality and OR filters are used: inequality filters (!=, not-in)
+    would force ordering by that field before lastMessage.
+    Each variant is backed by a composite index in firestore.indexes.json.
+
+    Args:
+        buckets (iterable): Selected buckets ("bot", "human", "resolved")
+
+    Returns:
+        Filter: Firestore filter, or None if every bucket is selected
+    """
+    selected = set(buckets)
+    active_modes = selected & {'bot', 'human'}
+    with_resolved = 'resolved' in selected
+
+    if selected >= set(CONVERSATION_BUCKETS):
+        return None
+
+    if not active_modes:
+        return FieldFilter('status', '==', 'resolved')
+
+    if active_modes == {'bot', 'human'}:
+        return FieldFilter('status', '==', 'active')
+
+    mode = active_modes.pop()
+    if with_resolved:
+        # (active and mode) or resolved == mode or resolved
+        return Or(filters=[
+            FieldFilter('mode', '==', mode),
+            FieldFilter('status', '==', 'resolved')
+        ])
+
+    return And(filters=[
+        FieldFilter('status', '==', 'active'),
+        FieldFilter('mode', '==', mode)
+    ])
+
+
+def selects_nothing(filters):
+    """
+    Check whether the filters exclude every conversation (no bucket selected).
+    """
+    return bool(filters) and 'buckets' in filters and not filters['buckets']
+
+
+def conversation_matches_filters(conversation, filters):
+    """
+    Apply list filter options to an in-memory conversation (used by caches
+    that serve lists without querying Firestore).
+
+    Args:
+        conversation (dict): Conversation summary with phone_number
+        filters (dict, optional): Same filter options as get_all_conversations
+
+    Returns:
+        bool: True if the conversation matches
+    """
+    if not filters:
+        return True
+    if 'buckets' in filters and get_conversation_bucket(conversation) not in filters['buckets']:
+        return False
+    if filters.get('mode') and conversation.get('mode', 'bot') != filters['mode']:
+        return False
+    if filters.get('status') and conversation.get('status', 'active') != filters['status']:
+        return False
+    return _matches_search(conversation.get('phone_number', ''), filters)
+
+
+def build_conversations_query(db, filters=None):
+    """
+    Build the conversation list query: summary projection, equality filters
+    and server-side ordering by lastMessage (newest first).
+
+    Args:
+        db (firestore.Client): Firestore database client
+        filters (dict, optional): Same filter options as get_all_conversations
+
+    Returns:
+        Query: Firestore query
+    """
+    # Only fetch the denormalized summary fields
+    query = db.collection('conversations').select(SUMMARY_FIELDS)
+
+    if filters:
+        if filters.get('buckets') is not None:
+            bucket_filter = build_bucket_filter(filters['buckets'])
+            if bucket_filter is not None:
+                query = query.where(filter=bucket_filter)
+        if filters.get('mode'):
+            query = query.where(filter=FieldFilter('mode', '==', filters['mode']))
+        if filters.get('status'):
+            query = query.where(filter=FieldFilter('status', '==', filters['status']))
+
+        search = normalize_phone_search(filters.get('search'))
+        if search:
+            query = query.where(filter=FieldFilter('searchTokens', 'array_contains', search))
+
+    return query.order_by('lastMessage', direction=firestore.Query.DESCENDING)
+
+
+def _matches_search(phone_number, filters):
+    """
+    Check a phone number against the optional search filter, in memory.
+    Firestore queries use the `searchTokens` index instead.
+
+    Args:
+        phone_number (str): Phone number (document ID)
+        filters (dict, optional): Filter options
+
+    Returns:
+        bool: True if there is no search filter or the phone number matches
+    """
+    search = normalize_phone_search(filters.get('search')) if filters else None
+    if not search:
+        return True
+    return search in ''.join(ch for ch in phone_number if ch.isdigit())
+
+
+def get_cached_read(operation, cache_key):
+    """
+    Serve a read from the read cache, counting the hit for `operation`.
+
+    Returns:
+        The cached data, or None on a miss
+    """
+    cached = _read_cache.get(cache_key)
+    if cached is not None:
+        record(operation, cache_hit=True)
+    return cached
+
+
+def remember_read(cache_key, data, use_cache=True):
+    """
+    Store a successful read in the read cache and as the last good value.
+    """
+    if use_cache:
+        _read_cache.set(cache_key, data)
+    _last_good.set(cache_key, data)
+
+
+def _read(operation, cache_key, fetch, is_empty, description, use_cache=True):
+    """
+    Run a read through the read cache, with a stale fallback.
+
+    A successful read is remembered as the last good value for its key. If
+    a later read fails (after the retries of read_options), the last good
+    value is returned marked as stale instead of nothing.
+
+    Args:
+        operation (str): Operation name for usage accounting
+        cache_key (tuple): Cache key (see _read_cache)
+        fetch (callable): Performs the read; raises on failure
+        is_empty (callable): Tells whether fetched data is empty
+        description (str): What is read, for error messages
+        use_cache (bool): Serve and store through the read cache
+
+    Returns:
+        ReadResult: Result of the read
+    """
+    if use_cache:
+        cached = get_cached_read(operation, cache_key)
+        if cached is not None:
+            return ReadResult(RESULT_EMPTY if is_empty(cached) else RESULT_OK, cached)
+
+    try:
+        with track(operation):
+            data = fetch()
+    except Exception as e:
+        print(f"[Firebase Service] Error {description}: {e}")
+        stale = _last_good.get(cache_key)
+        if stale is not None:
+            return ReadResult(RESULT_STALE, stale, str(e))
+        return ReadResult(RESULT_FAILED, None, str(e))
+
+    if data is not None:
+        remember_read(cache_key, data, use_cache)
+    return ReadResult(RESULT_EMPTY if is_empty(data) else RESULT_OK, data)
+
+
+def _empty_conversations_page():
+    return {
+        'conversations': [],
+        'next_cursor': None,
+        'has_more': False
+    }
+
+
+def _empty_messages_page():
+    return {
+        'messages': [],
+        'cursor': None,
+        'has_more': False
+    }
+
+
+def get_all_conversations_result(filters=None):
+    """
+    Same as get_all_conversations, returning a ReadResult.
+
+    Returns:
+        ReadResult: data is the list of conversation summaries
+    """
+    if selects_nothing(filters):
+        return ReadResult(RESULT_EMPTY, [])
+
+    backend = get_storage()
+
+    def fetch():
+        if backend is not None:
+            return backend.list_conversations(filters)
+
+        query = build_conversations_query(get_db(), filters)
+
+        conversations = []
+        for doc in query.stream(**read_options()):
+            data = doc.to_dict()
+            data['phone_number'] = doc.id
+            conversations.append(data)
+        add_reads(query_reads(len(conversations)))
+        return conversations
+
+    return _read(
+        'get_all_conversations',
+        ('list', filters_key(filters)),
+        fetch,
+        lambda conversations: not conversations,
+        "getting conversations",
+        use_cache=backend is None
+    )
+
+
 def get_all_conversations(filters=None):
     """
-    Get all conversations from Firestore.
+    Get all conversations from Firestore, newest first.
+    Only the summary fields are fetched (field-mask projection), so the
+    returned dictionaries do not include the `messages` array.
+
+    Prefer get_conversations_page for UI lists: this function reads the
+    whole (filtered) collection.
+
+    Args:
+        filters (dict, optional): Filter options
+            - buckets: list of "bot" | "human" | "resolved" (sidebar checkboxes)
+            - mode: "bot" | "human" | None
+            - status: "active" | "resolved" | None
+            - search: phone number fragment (at least SEARCH_MIN_LENGTH
+              digits, answered with the `searchTokens` index; shorter
+              searches are ignored)
+
+    Returns:
+        list: List of conversation summary dictionaries with phone_number as key
+            (the last good list if the read failed, [] if there is none)
+    """
+    return get_all_conversations_result(filters).data or []
+
+
+def get_conversations_page_result(filters=None, page_size=50, cursor=None):
+    """
+    Same as get_conversations_page, returning a ReadResult.
+
+    Returns:
+        ReadResult: data is the page dict
+    """
+    if selects_nothing(filters):
+        return ReadResult(RESULT_EMPTY, _empty_conversations_page())
+
+    backend = get_storage()
+
+    def fetch():
+        if backend is not None:
+            return backend.list_conversations_page(filters, page_size, cursor)
+
+        query = build_conversations_query(get_db(), filters)
+        if cursor is not None:
+            query = query.start_after(cursor)
+
+        # Read one extra document to know whether another page exists
+        docs = list(query.limit(page_size + 1).stream(**read_options()))
+        add_reads(query_reads(len(docs)))
+        has_more = len(docs) > page_size
+        docs = docs[:page_size]
+
+        conversations = []
+        for doc in docs:
+            data = doc.to_dict()
+            data['phone_number'] = doc.id
+            conversations.append(data)
+
+        next_cursor = docs[-1] if docs else None
+
+        return {
+            'conversations': conversations,
+            'next_cursor': next_cursor if has_more else None,
+            'has_more': has_more
+        }
+
+    # Firestore cursors are snapshots (keyed by document ID), others are values
+    cursor_key = getattr(cursor, 'id', cursor)
+
+    return _read(
+        'get_conversations_page',
+        ('page', filters_key(filters), page_size, cursor_key),
+        fetch,
+        lambda page: not page['conversations'],
+        "getting conversations page",
+        use_cache=backend is None
+    )
+
+
+def get_conversations_page(filters=None, page_size=50, cursor=None):
+    """
+    Get one page of conversations ordered by lastMessage (newest first).
 
     Args:
-        filters (dict, optional): Filter options
-            - mode: "bot" | "human" | None
-            - status: "active" | "resolved" | None
-            - search: phone number search string
+        filters (dict, optional): Same filter options as get_all_conversations
+        page_size (int): Maximum number of conversations to return
+        cursor (DocumentSnapshot, optional): `next_cursor` of the previous page
 
     Returns:
-        list: List of conversation dictionaries with phone_number as key
+        dict: Page of results (the last good page if the read failed)
+            - conversations (list): Conversation summary dictionaries
+            - next_cursor (DocumentSnapshot): Cursor for the next page, or None
+            - has_more (bool): True if more conversations are available
     """
-    try:
+    return get_conversations_page_result(filters, page_size, cursor).data or _empty_conversations_page()
+
+
+def get_conversation_counts_result(search=None):
+    """
+    Same as get_conversation_counts, returning a ReadResult.
+
+    Returns:
+        ReadResult: data is the counts dict
+    """
+    search = normalize_phone_search(search)
+    backend = get_storage()
+
+    def fetch():
+        if backend is not None:
+            return backend.count_conversations(search)
+
         db = get_db()
-        conversations_ref = db.collection('conversations')
+        counts = {}
 
-        # Apply filters if provided
-        query = conversations_ref
+        for bucket in CONVERSATION_BUCKETS:
+            query = db.collection('conversations').where(filter=build_bucket_filter([bucket]))
+            if search:
+                query = query.where(filter=FieldFilter('searchTokens', 'array_contains', search))
+            result = query.count(alias='total').get(**read_options())
+            counts[bucket] = int(result[0][0].value)
+            add_reads(count_reads(counts[bucket]))
+        return counts
 
-        if filters:
-            if filters.get('mode'):
-                query = query.where(filter=FieldFilter('mode', '==', filters['mode']))
-            if filters.get('status'):
-                query = query.where(filter=FieldFilter('status', '==', filters['status']))
+    return _read(
+        'get_conversation_counts',
+        ('counts', None, search),
+        fetch,
+        lambda counts: not any(counts.values()),
+        "counting conversations",
+        use_cache=backend is None
+    )
 
-        # Get all documents
-        docs = query.stream()
 
-        conversations = []
-        for doc in docs:
-            data = doc.to_dict()
-            data['phone_number'] = doc.id
+def get_conversation_counts(search=None):
+    """
+    Count conversations per sidebar bucket with aggregation queries.
+    Documents are not downloaded: each count is billed as one read per
+    1,000 index entries. Results go through the read cache.
 
-            # Apply search filter (phone number)
-            if filters and filters.get('search'):
-                if filters['search'].lower() not in doc.id.lower():
-                    continue
+    Args:
+        search (str, optional): Phone number fragment to count matches for
 
-            conversations.append(data)
+    Returns:
+        dict: Number of conversations per bucket ("bot", "human", "resolved"),
+            or None if the counts could not be fetched
+    """
+    return get_conversation_counts_result(search).data
 
-        # Sort by lastMessage (newest first)
-        conversations.sort(key=lambda x: x.get('lastMessage', datetime.min), reverse=True)
 
-        return conversations
+def get_conversation_result(phone_number, include_messages=True):
+    """
+    Same as get_conversation, returning a ReadResult.
 
-    except Exception as e:
-        print(f"[Firebase Service] Error getting conversations: {e}")
-        return []
+    Returns:
+        ReadResult: data is the conversation dict (None and RESULT_EMPTY if
+            it does not exist)
+    """
+    backend = get_storage()
+
+    def fetch():
+        if backend is not None:
+            return backend.get_conversation(phone_number, include_messages)
+
+        doc_ref = get_db().collection('conversations').document(phone_number)
+
+        if not include_messages:
+            doc = doc_ref.get(field_paths=SUMMARY_FIELDS, **read_options())
+        else:
+            doc = doc_ref.get(**read_options())
+        add_reads()
+
+        from services.archive import get_archived_conversation
+        if not doc.exists:
+            return get_archived_conversation(get_db(), phone_number, include_messages)
+
+        data = doc.to_dict()
+        if include_messages:
+            data['messages'] = load_messages(doc_ref, data)
+
+            # Recreated after being archived: older history is in the archive
+            archived = get_archived_conversation(get_db(), phone_number) if data.get('archivedHistory') else None
+            if archived is not None:
+                data['messages'] = merge_messages(archived['messages'], data['messages'])
+                data['messageCount'] = len(data['messages'])
+        data['phone_number'] = phone_number
+        return data
 
+    return _read(
+        'get_conversation',
+        ('conversation', phone_number, include_messages),
+        fetch,
+        lambda conversation: conversation is None,
+        f"getting conversation {phone_number}",
+        use_cache=backend is None
+    )
 
-def get_conversation(phone_number):
+
+def get_conversation(phone_number, include_messages=True):
     """
     Get a single conversation with all messages.
 
     Args:
         phone_number (str): Phone number (document ID)
+        include_messages (bool): Load the full message history. When False,
+            only the summary fields are read; use get_messages_page to load
+            a window of messages.
 
     Returns:
         dict: Conversation data with messages, or None if not found
     """
-    try:
-        db = get_db()
-        doc_ref = db.collection('conversations').document(phone_number)
-        doc = doc_ref.get()
+    return get_conversation_result(phone_number, include_messages).data
 
-        if doc.exists:
-            data = doc.to_dict()
-            data['phone_number'] = phone_number
-            return data
-        else:
-            return None
 
-    except Exception as e:
-        print(f"[Firebase Service] Error getting conversation {phone_number}: {e}")
-        return None
+def get_messages_page_result(phone_number, limit=50, before=None):
+    """
+    Same as get_messages_page, returning a ReadResult.
+
+    Returns:
+        ReadResult: data is the message window dict
+    """
+    backend = get_storage()
+
+    def fetch():
+        if backend is not None:
+            return backend.get_messages_page(phone_number, limit, before)
+
+        doc_ref = get_db().collection('conversations').document(phone_number)
+
+        # Embedded messages (legacy layout); empty once migrated
+        doc = doc_ref.get(field_paths=['messages', 'messageStorage', 'archivedHistory'], **read_options())
+        add_reads()
+        from services.archive import get_archived_messages_page
+        if not doc.exists:
+            return get_archived_messages_page(get_db(), phone_number, limit, before) or _empty_messages_page()
+
+        data = doc.to_dict() or {}
+        embedded = [
+            message for message in data.get('messages', [])
+            if before is None or (message.get('timestamp') and message['timestamp'] < before)
+        ]
+
+        stored = []
+        stored_has_more = False
+
+        if data.get('messageStorage') == MESSAGE_STORAGE_SUBCOLLECTION:
+            query = doc_ref.collection(MESSAGES_SUBCOLLECTION)
+            if before is not None:
+                query = query.where(filter=FieldFilter('timestamp', '<', before))
+            query = query.order_by('timestamp', direction=firestore.Query.DESCENDING)
+
+            # Read one extra document to know whether older messages exist
+            docs = list(query.limit(limit + 1).stream(**read_options()))
+            add_reads(query_reads(len(docs)))
+            stored_has_more = len(docs) > limit
+            stored = [doc.to_dict() for doc in docs[:limit]]
+
+        merged = merge_messages(embedded, stored)
+        has_more = stored_has_more or len(merged) > limit
+
+        # Past the oldest hot message: continue into the archive, if the
+        # conversation was recreated after being archived
+        if not has_more and data.get('archivedHistory'):
+            oldest = merged[0].get('timestamp') if merged else before
+            archived = get_archived_messages_page(get_db(), phone_number, limit, oldest)
+            if archived and archived['messages']:
+                merged = merge_messages(archived['messages'], merged)
+                has_more = archived['has_more'] or len(merged) > limit
+
+        window = merged[-limit:] if limit else []
+
+        return {
+            'messages': window,
+            'cursor': window[0].get('timestamp') if has_more and window else None,
+            'has_more': has_more
+        }
+
+    return _read(
+        'get_messages_page',
+        ('messages', phone_number, limit, before),
+        fetch,
+        lambda page: not page['messages'],
+        f"getting messages for {phone_number}",
+        use_cache=backend is None
+    )
+
+
+def get_messages_page(phone_number, limit=50, before=None):
+    """
+    Get the newest messages of a conversation older than a cursor.
+    With the subcollection layout only `limit` message documents are read,
+    however long the conversation is.
+
+    Args:
+        phone_number (str): Phone number (document ID)
+        limit (int): Maximum number of messages to return
+        before (datetime, optional): `cursor` of the previous page; only
+            messages older than it are returned
+
+    Returns:
+        dict: Message window (the last good window if the read failed)
+            - messages (list): Messages sorted by timestamp, oldest first
+            - cursor (datetime): Cursor for the previous (older) page, or None
+            - has_more (bool): True if older messages are available
+    """
+    return get_messages_page_result(phone_number, limit, before).data or _empty_messages_page()
 
 
-def update_conversation_mode(phone_number, mode):
+def update_conversation_mode(phone_number, mode, raise_errors=False):
     """
     Update conversation mode (bot or human).
 
     Args:
         phone_number (str): Phone number (document ID)
         mode (str): "bot" or "human"
+        raise_errors (bool): Raise instead of returning False (used by
+            the write-behind queue to tell transient errors apart)
 
     Returns:
         bool: True if successful, False otherwise
     """
     try:
         if mode not in ['bot', 'human']:
-            print(f"[Firebase Service] Invalid mode: {mode}. Must be 'bot' or 'human'")
-            return False
-
-        db = get_db()
-        doc_ref = db.collection('conversations').document(phone_number)
+            raise ValueError(f"Invalid mode: {mode}. Must be 'bot' or 'human'")
 
         update_data = {
             'mode': mode,
@@ -115,16 +1013,177 @@ def update_conversation_mode(phone_number, mode):
         if mode == 'human':
             update_data['escalatedAt'] = datetime.now()
 
-        doc_ref.set(update_data, merge=True)
+        backend = get_storage()
+        with track('update_conversation_mode'):
+            if backend is not None:
+                backend.update_conversation(phone_number, update_data)
+            else:
+                doc_ref = get_db().collection('conversations').document(phone_number)
+                doc_ref.set(update_data, merge=True, **write_options(idempotent=True))
+                add_writes()
+        invalidate_conversation(phone_number)
         print(f"[Firebase Service] Updated mode to '{mode}' for {phone_number}")
         return True
 
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"[Firebase Service] Error updating conversation mode: {e}")
         return False
 
 
-def add_message(phone_number, from_type, text, message_id=None):
+def _message_summary(message, storage):
+    """
+    Build the conversation summary fields updated by a new message.
+
+    Args:
+        message (dict): Message object
+        storage (str): Message storage layout
+
+    Returns:
+        dict: Summary fields shown in the sidebar list
+    """
+    summary = {
+        'lastMessage': message['timestamp'],
+        'lastMessagePreview': build_message_preview(message.get('text', '')),
+        'lastMessageFrom': message['from'],
+        'unread': message['from'] == 'user'
+    }
+    if storage == MESSAGE_STORAGE_SUBCOLLECTION:
+        summary['messageStorage'] = MESSAGE_STORAGE_SUBCOLLECTION
+    return summary
+
+
+def build_message_update(doc_ref, message, storage):
+    """
+    Writes that append a message to an existing conversation (shared with
+    services/firebase_service_async.py).
+
+    The message is recorded with a `create` committed together with the
+    messageCount increment: its message document, or its messageIds marker
+    with the array layout. Replaying the message fails with AlreadyExists,
+    so the count only moves when the message is new.
+
+    Args:
+        doc_ref (DocumentReference): Conversation document reference
+        message (dict): Message object (from, text, timestamp, messageId)
+        storage (str): Message storage layout
+
+    Returns:
+        tuple: (create_ref, create_data, update_data): the document to
+            create and the conversation update
+    """
+    doc_id = message_doc_id(message['messageId'])
+    update_data = {
+        'messageCount': firestore.Increment(1),
+        **_message_summary(message, storage)
+    }
+    if storage == MESSAGE_STORAGE_SUBCOLLECTION:
+        return doc_ref.collection(MESSAGES_SUBCOLLECTION).document(doc_id), message_document(message), update_data
+
+    update_data['messages'] = firestore.ArrayUnion([message])
+    return doc_ref.collection(MESSAGE_IDS_SUBCOLLECTION).document(doc_id), {}, update_data
+
+
+def build_new_conversation(doc_ref, message, storage, archived_history=False):
+    """
+    Document of a conversation created by its first message, with the
+    create-only defaults (mode, status).
+
+    Args:
+        doc_ref (DocumentReference): Conversation document reference
+        message (dict): First message
+        storage (str): Message storage layout
+        archived_history (bool): The conversation is created while an
+            archive of it exists (it could not be restored), so reads
+            merge the archived history (`archivedHistory` marker)
+
+    Returns:
+        dict: Conversation document
+    """
+    data = {
+        'mode': 'bot',
+        'status': 'active',
+        'escalatedAt': None,
+        'messages': [message] if storage != MESSAGE_STORAGE_SUBCOLLECTION else [],
+        'messageCount': 1,
+        'searchTokens': build_search_tokens(doc_ref.id),
+        **_message_summary(message, storage)
+    }
+    if archived_history:
+        data['archivedHistory'] = True
+    return data
+
+
+def _commit_message(db, doc_ref, message, storage, max_attempts=3):
+    """
+    Append a message and update the conversation summary in one commit.
+
+    The common case (existing conversation) is a single blind update. If the
+    conversation does not exist the update fails with NotFound and the
+    conversation is created with its create-only defaults (mode, status).
+    If two first messages race, the loser's create fails with AlreadyExists
+    and it retries as an update.
+
+    The message document (with the array layout, its messageIds marker) is
+    written with `create` in the same commit, so replaying the same
+    messageId is detected (AlreadyExists) and not counted twice.
+
+    Args:
+        db (firestore.Client): Firestore database client
+        doc_ref (DocumentReference): Conversation document reference
+        message (dict): Message object (from, text, timestamp, messageId)
+        storage (str): Message storage layout
+        max_attempts (int): Update/create rounds before giving up
+
+    Returns:
+        bool: True if the message was written, False if it already existed
+    """
+    create_ref, create_data, update_data = build_message_update(doc_ref, message, storage)
+    # A resent commit fails with AlreadyExists instead of counting the
+    # message twice, so it is safe to retry
+    options = write_options(idempotent=True)
+
+    for _ in range(max_attempts):
+        # Append to an existing conversation
+        batch = db.batch()
+        batch.create(create_ref, create_data)
+        batch.update(doc_ref, update_data)
+
+        try:
+            batch.commit(**options)
+            add_writes(2)
+            return True
+        except NotFound:
+            pass
+        except AlreadyExists:
+            # The message document exists: this write was already applied
+            return False
+
+        # An archived conversation is reopened with its history
+        from services.archive import restore_conversation
+        restored = restore_conversation(db, doc_ref.id)
+        if restored:
+            continue
+
+        # Create new conversation with first message (over the archive if
+        # it could not be restored)
+        batch = db.batch()
+        batch.create(create_ref, create_data)
+        batch.create(doc_ref, build_new_conversation(doc_ref, message, storage, archived_history=restored is False))
+
+        try:
+            batch.commit(**options)
+            add_writes(2)
+            return True
+        except AlreadyExists:
+            # Another writer created the conversation first: append instead
+            continue
+
+    raise RuntimeError(f"Could not append message to {doc_ref.id} after {max_attempts} attempts")
+
+
+def add_message(phone_number, from_type, text, message_id=None, timestamp=None, raise_errors=False):
     """
     Add a message to conversation history.
 
@@ -133,17 +1192,16 @@ def add_message(phone_number, from_type, text, message_id=None):
         from_type (str): "user" | "bot" | "human"
         text (str): Message text
         message_id (str, optional): WhatsApp message ID (auto-generated if not provided)
+        timestamp (datetime, optional): Message time (default: now)
+        raise_errors (bool): Raise instead of returning False (used by
+            the write-behind queue to tell transient errors apart)
 
     Returns:
         bool: True if successful, False otherwise
     """
     try:
         if from_type not in ['user', 'bot', 'human']:
-            print(f"[Firebase Service] Invalid from_type: {from_type}")
-            return False
-
-        db = get_db()
-        doc_ref = db.collection('conversations').document(phone_number)
+            raise ValueError(f"Invalid from_type: {from_type}")
 
         # Generate message ID if not provided
         if not message_id:
@@ -153,35 +1211,379 @@ def add_message(phone_number, from_type, text, message_id=None):
         message = {
             'from': from_type,
             'text': text,
-            'timestamp': datetime.now(),
+            'timestamp': timestamp or datetime.now(),
             'messageId': message_id
         }
 
-        # Check if conversation exists
-        doc = doc_ref.get()
+        backend = get_storage()
+        with track('add_message'):
+            if backend is not None:
+                written = bool(backend.append_messages(phone_number, [message]))
+            else:
+                # Single commit: no existence check, no billed read
+                db = get_db()
+                doc_ref = db.collection('conversations').document(phone_number)
+                written = _commit_message(db, doc_ref, message, get_message_storage())
+
+        # Also for a message already stored: the commit that stored it may
+        # have landed without a response, before these steps ran (both are
+        # idempotent)
+        invalidate_conversation(phone_number)
+        index_messages(phone_number, [message])
+
+        if written:
+            print(f"[Firebase Service] Added message from '{from_type}' to {phone_number}")
+        else:
+            print(f"[Firebase Service] Message {message_id} already stored for {phone_number}")
+        return True
+
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"[Firebase Service] Error adding message: {e}")
+        return False
+
+
+def index_messages(phone_number, messages):
+    """
+    Feed new messages to the local full-text search index (best effort:
+    the index also catches up from Firestore on its own).
+
+    Args:
+        phone_number (str): Phone number (document ID)
+        messages (list): Written message objects
+    """
+    try:
+        from services.search_index import get_search_index
+
+        index = get_search_index()
+        if index:
+            index.add_messages(phone_number, messages)
+    except Exception as e:
+        print(f"[Firebase Service] Could not index messages: {e}")
+
+
+def remove_from_search_index(phone_number):
+    """
+    Drop a deleted conversation from the local search index (best effort).
+
+    Args:
+        phone_number (str): Phone number (document ID)
+    """
+    try:
+        from services.search_index import get_search_index
+
+        index = get_search_index()
+        if index:
+            index.remove_conversation(phone_number)
+    except Exception as e:
+        print(f"[Firebase Service] Could not update search index: {e}")
+
+
+def _existing_conversations(db, phone_numbers):
+    """
+    Check which conversations exist with a single batched read.
+
+    Args:
+        db (firestore.Client): Firestore database client
+        phone_numbers (iterable): Phone numbers (document IDs)
+
+    Returns:
+        set: Phone numbers whose conversation document exists
+    """
+    refs = [db.collection('conversations').document(phone) for phone in phone_numbers]
+    if not refs:
+        return set()
+    add_reads(len(refs))
+    return {doc.id for doc in db.get_all(refs, field_paths=['mode'], **read_options()) if doc.exists}
+
+
+def _plan_message_batches(groups):
+    """
+    Split grouped messages into batches of at most MAX_BATCH_OPS operations.
+    Each conversation chunk costs one operation per message (its document,
+    or its messageIds marker with the array layout) plus one for the
+    conversation summary.
+
+    Args:
+        groups (dict): phone -> list of (index, message), in write order
+
+    Returns:
+        list: Batches, each a list of (phone, [(index, message), ...])
+    """
+    batches = []
+    current = []
+    ops = 0
+
+    for phone, entries in groups.items():
+        position = 0
+        while position < len(entries):
+            # Room left for message creates after the summary operation
+            room = MAX_BATCH_OPS - ops - 1
+            if room < 1:
+                batches.append(current)
+                current = []
+                ops = 0
+                continue
+
+            remaining = len(entries) - position
+            take = min(room, remaining)
+            current.append((phone, entries[position:position + take]))
+            ops += take + 1
+            position += take
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _drop_stored_messages(db, chunks, storage):
+    """
+    Remove the messages already stored (replays) from planned chunks.
+
+    Args:
+        db (firestore.Client): Firestore database client
+        chunks (list): (phone, [(index, message), ...]) entries of a batch
+        storage (str): Message storage layout
+
+    Returns:
+        list: The chunks without stored messages (empty chunks removed)
+    """
+    collection_id = MESSAGES_SUBCOLLECTION if storage == MESSAGE_STORAGE_SUBCOLLECTION else MESSAGE_IDS_SUBCOLLECTION
+    refs = [
+        db.collection('conversations').document(phone)
+        .collection(collection_id).document(message_doc_id(message['messageId']))
+        for phone, entries in chunks
+        for _, message in entries
+    ]
+    add_reads(len(refs))
+    stored = {doc.reference.path for doc in db.get_all(refs, field_paths=[], **read_options()) if doc.exists}
+
+    remaining = []
+    for phone, entries in chunks:
+        doc_ref = db.collection('conversations').document(phone)
+        entries = [
+            (index, message) for index, message in entries
+            if doc_ref.collection(collection_id).document(message_doc_id(message['messageId'])).path not in stored
+        ]
+        if entries:
+            remaining.append((phone, entries))
+    return remaining
 
-        if doc.exists:
-            # Append message to existing conversation
-            doc_ref.update({
-                'messages': firestore.ArrayUnion([message]),
-                'lastMessage': datetime.now()
-            })
+
+def _commit_message_batch(db, chunks, existing, storage, archived=()):
+    """
+    Write one planned batch atomically.
+
+    Args:
+        db (firestore.Client): Firestore database client
+        chunks (list): (phone, [(index, message), ...]) entries of the batch
+        existing (set): Phone numbers whose conversation exists (updated
+            in place once the batch is committed)
+        storage (str): Message storage layout
+        archived (set): Phone numbers with an archive that could not be
+            restored (new conversations get the `archivedHistory` marker)
+    """
+    batch = db.batch()
+
+    for phone, entries in chunks:
+        doc_ref = db.collection('conversations').document(phone)
+        messages = [message for _, message in entries]
+        summary = _message_summary(messages[-1], storage)
+
+        # A message already stored fails the batch (AlreadyExists) instead
+        # of being counted twice (see _drop_stored_messages)
+        for message in messages:
+            doc_id = message_doc_id(message['messageId'])
+            if storage == MESSAGE_STORAGE_SUBCOLLECTION:
+                batch.create(doc_ref.collection(MESSAGES_SUBCOLLECTION).document(doc_id), message_document(message))
+            else:
+                batch.create(doc_ref.collection(MESSAGE_IDS_SUBCOLLECTION).document(doc_id), {})
+
+        if phone in existing:
+            update_data = {
+                'messageCount': firestore.Increment(len(messages)),
+                **summary
+            }
+            if storage == MESSAGE_STORAGE_ARRAY:
+                update_data['messages'] = firestore.ArrayUnion(messages)
+            batch.update(doc_ref, update_data)
         else:
-            # Create new conversation with first message
-            doc_ref.set({
+            conversation = {
                 'mode': 'bot',
                 'status': 'active',
-                'lastMessage': datetime.now(),
                 'escalatedAt': None,
-                'messages': [message]
-            })
+                'messages': messages if storage == MESSAGE_STORAGE_ARRAY else [],
+                'messageCount': len(messages),
+                'searchTokens': build_search_tokens(phone),
+                **summary
+            }
+            if phone in archived:
+                conversation['archivedHistory'] = True
+            batch.create(doc_ref, conversation)
 
-        print(f"[Firebase Service] Added message from '{from_type}' to {phone_number}")
-        return True
+    # Increments are not idempotent: a failed batch is reported, not resent
+    batch.commit(**write_options())
+    add_writes(sum(1 + len(entries) for _, entries in chunks))
+    existing.update(phone for phone, _ in chunks)
+
+
+def add_messages_bulk(items):
+    """
+    Write many messages, possibly to many conversations, with batched writes.
+
+    Messages are grouped per conversation and packed into WriteBatches of at
+    most 500 operations, committed one after another, so each conversation
+    receives its messages in input order. Timestamps not provided are
+    assigned increasing values in input order. When a batch fails, its
+    messages and every later message of the same conversations are reported
+    as failed (so a conversation never gets a gap followed by newer messages).
+
+    Args:
+        items (list): Message dictionaries
+            - phone_number (str): Phone number (document ID)
+            - from (str): "user" | "bot" | "human"
+            - text (str): Message text
+            - message_id (str, optional): Message ID (auto-generated if not provided)
+            - timestamp (datetime, optional): Message time
+
+    Returns:
+        dict: Result
+            - success (bool): True if every message was written
+            - written (int): Number of messages written
+            - failed (list): {'index', 'phone_number', 'error'} per failed item
+    """
+    result = {
+        'success': True,
+        'written': 0,
+        'failed': []
+    }
+
+    def fail(entries, phone, error):
+        for index, _ in entries:
+            result['failed'].append({'index': index, 'phone_number': phone, 'error': error})
+
+    # Validate and group per conversation, keeping input order
+    base_time = datetime.now()
+    groups = {}
+
+    for index, item in enumerate(items):
+        phone = item.get('phone_number')
+        from_type = item.get('from')
+        text = item.get('text')
+
+        if not phone or from_type not in ['user', 'bot', 'human'] or text is None:
+            fail([(index, None)], phone, 'Invalid message: phone_number, from and text are required')
+            continue
+
+        message = {
+            'from': from_type,
+            'text': text,
+            'timestamp': item.get('timestamp') or base_time + timedelta(milliseconds=index),
+            'messageId': item.get('message_id') or str(uuid.uuid4())
+        }
+        groups.setdefault(phone, []).append((index, message))
+
+    def finish():
+        for phone in groups:
+            invalidate_conversation(phone)
+
+        result['failed'].sort(key=lambda failure: failure['index'])
+        result['success'] = not result['failed']
+        print(f"[Firebase Service] Bulk wrote {result['written']} messages to {len(groups)} conversations")
+        return result
+
+    backend = get_storage()
+    if backend is not None:
+        for phone, entries in groups.items():
+            try:
+                with track('add_messages_bulk'):
+                    written = backend.append_messages(phone, [message for _, message in entries])
+                result['written'] += len(written)
+                index_messages(phone, written)
+            except Exception as e:
+                print(f"[Firebase Service] Error writing messages for {phone}: {e}")
+                fail(entries, phone, str(e))
+        return finish()
+
+    try:
+        db = get_db()
+        storage = get_message_storage()
+        with track('add_messages_bulk'):
+            existing = _existing_conversations(db, groups.keys())
 
+        # Archived conversations are reopened with their history
+        from services.archive import find_archived, restore_conversation
+        archived = set()
+        for phone in find_archived(db, groups.keys() - existing):
+            if restore_conversation(db, phone):
+                existing.add(phone)
+            else:
+                archived.add(phone)
     except Exception as e:
-        print(f"[Firebase Service] Error adding message: {e}")
-        return False
+        print(f"[Firebase Service] Error preparing bulk write: {e}")
+        for phone, entries in groups.items():
+            fail(entries, phone, str(e))
+        result['success'] = False
+        return result
+
+    failed_phones = {}
+
+    for chunks in _plan_message_batches(groups):
+        # Never write after a failed chunk of the same conversation
+        pending = []
+        for phone, entries in chunks:
+            if phone in failed_phones:
+                fail(entries, phone, f"Skipped: earlier batch failed ({failed_phones[phone]})")
+            else:
+                pending.append((phone, entries))
+
+        if not pending:
+            continue
+
+        try:
+            with track('add_messages_bulk'):
+                try:
+                    _commit_message_batch(db, pending, existing, storage, archived)
+                except (AlreadyExists, NotFound):
+                    # A message was already stored (a replay), or a conversation
+                    # was created or deleted concurrently: re-check once
+                    existing = _existing_conversations(db, groups.keys())
+                    remaining = _drop_stored_messages(db, pending, storage)
+                    if remaining:
+                        _commit_message_batch(db, remaining, existing, storage, archived)
+
+            # Replayed messages count as written, and are indexed, as in add_message
+            result['written'] += sum(len(entries) for _, entries in pending)
+            for phone, entries in pending:
+                index_messages(phone, [message for _, message in entries])
+
+        except Exception as e:
+            print(f"[Firebase Service] Error committing message batch: {e}")
+            for phone, entries in pending:
+                failed_phones[phone] = str(e)
+                fail(entries, phone, str(e))
+
+    return finish()
+
+
+def add_messages(phone_number, messages):
+    """
+    Add several messages to one conversation with batched writes.
+
+    Args:
+        phone_number (str): Phone number (document ID)
+        messages (list): Message dictionaries, oldest first
+            - from (str): "user" | "bot" | "human"
+            - text (str): Message text
+            - message_id (str, optional): Message ID
+            - timestamp (datetime, optional): Message time
+
+    Returns:
+        dict: Same result as add_messages_bulk (indexes refer to `messages`)
+    """
+    items = [dict(message, phone_number=phone_number) for message in messages]
+    return add_messages_bulk(items)
 
 
 def delete_conversation(phone_number):
@@ -195,12 +1597,35 @@ def delete_conversation(phone_number):
         bool: True if successful, False otherwise
     """
     try:
-        db = get_db()
-        doc_ref = db.collection('conversations').document(phone_number)
+        backend = get_storage()
+        with track('delete_conversation'):
+            if backend is not None:
+                existed = backend.delete_conversation(phone_number)
+            else:
+                db = get_db()
+                doc_ref = db.collection('conversations').document(phone_number)
 
-        # Check if conversation exists
-        if doc_ref.get().exists:
-            doc_ref.delete()
+                # Check if conversation exists
+                existed = doc_ref.get(field_paths=['status'], **read_options()).exists
+                add_reads()
+                if existed:
+                    # Subcollections are not removed with their parent document
+                    _delete_messages_subcollection(db, doc_ref)
+                    doc_ref.delete(**write_options(idempotent=True))
+                    add_writes()
+
+                # The array layout's message ID markers are kept when the
+                # conversation is archived
+                _delete_messages_subcollection(db, doc_ref, collection_id=MESSAGE_IDS_SUBCOLLECTION)
+
+                # Older history may also be archived (the conversation was
+                # recreated after archiving)
+                from services.archive import delete_archived_conversation
+                existed = delete_archived_conversation(db, phone_number) or existed
+
+        if existed:
+            invalidate_conversation(phone_number)
+            remove_from_search_index(phone_number)
             print(f"[Firebase Service] Deleted conversation: {phone_number}")
             return True
         else:
@@ -212,6 +1637,43 @@ def delete_conversation(phone_number):
         return False
 
 
+def mark_conversation_read(phone_number, raise_errors=False):
+    """
+    Clear the unread flag of a conversation.
+
+    Args:
+        phone_number (str): Phone number (document ID)
+        raise_errors (bool): Raise instead of returning False (used by
+            the write-behind queue to tell transient errors apart)
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        backend = get_storage()
+        with track('mark_conversation_read'):
+            if backend is not None:
+                updated = backend.update_conversation(phone_number, {'unread': False}, create=False)
+            else:
+                doc_ref = get_db().collection('conversations').document(phone_number)
+                doc_ref.update({'unread': False}, **write_options(idempotent=True))
+                add_writes()
+                updated = True
+
+        if not updated:
+            print(f"[Firebase Service] Conversation not found: {phone_number}")
+            return False
+
+        invalidate_conversation(phone_number)
+        return True
+
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"[Firebase Service] Error marking conversation as read: {e}")
+        return False
+
+
 def mark_resolved(phone_number):
     """
     Mark a conversation as resolved.
@@ -223,13 +1685,21 @@ def mark_resolved(phone_number):
         bool: True if successful, False otherwise
     """
     try:
-        db = get_db()
-        doc_ref = db.collection('conversations').document(phone_number)
-
-        doc_ref.set({
+        update_data = {
             'status': 'resolved',
             'lastMessage': datetime.now()
-        }, merge=True)
+        }
+
+        backend = get_storage()
+        with track('mark_resolved'):
+            if backend is not None:
+                backend.update_conversation(phone_number, update_data)
+            else:
+                doc_ref = get_db().collection('conversations').document(phone_number)
+                doc_ref.set(update_data, merge=True, **write_options(idempotent=True))
+                add_writes()
+
+        invalidate_conversation(phone_number)
 
         print(f"[Firebase Service] Marked conversation as resolved: {phone_number}")
         return True
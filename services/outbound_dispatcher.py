@@ -0,0 +1,369 @@
+"""
+Outbound Dispatcher
+Queue and worker pool for WhatsApp sends. Callers submit a message and
+return at once; workers send it through whatsapp_service under a shared
+token-bucket rate limit matching the account's throughput tier.
+
+Recipients are sharded over the workers (one queue per worker, picked by
+hashing the phone number), so messages to the same recipient are sent one
+at a time and in submission order, while different recipients go out in
+parallel. While the WhatsApp circuit breaker is open, messages are held in
+their queues and sent when it recovers.
+"""
+
+import itertools
+import queue
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+from functools import partial
+import streamlit as st
+from config.settings import get_int_setting, get_float_setting
+
+
+STATUS_QUEUED = 'queued'
+STATUS_SENDING = 'sending'
+STATUS_HELD = 'held'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+# Send latencies kept for the percentiles in get_stats
+_LATENCY_WINDOW = 1000
+
+# Failed sends kept for the chat view
+_MAX_FAILURES = 200
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `capacity`
+    saved up for bursts.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate (float): Tokens added per second (0 disables the limit)
+            capacity (float, optional): Bucket size (default: one second of tokens)
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, waiting until it is available.
+
+        Returns:
+            float: Seconds waited
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+
+class OutboundMessage:
+    """
+    A submitted send. `future` resolves to the send_message result dict.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, phone_number, text, on_done=None, idempotency_key=None):
+        self.id = next(self._ids)
+        self.phone_number = phone_number
+        self.text = text
+        self.idempotency_key = idempotency_key or uuid.uuid4().hex
+        self.on_done = on_done
+        self.status = STATUS_QUEUED
+        self.result = None
+        self.created_at = datetime.now()
+        self.future = Future()
+        self._enqueued = time.perf_counter()
+
+
+class OutboundDispatcher:
+    """
+    Per-recipient ordered send queues drained by a pool of worker threads.
+    """
+
+    def __init__(self, send, workers=4, rate=80, burst=None, max_hold=300):
+        """
+        Args:
+            send (callable): send(phone_number, text, idempotency_key=...)
+                -> result dict (whatsapp_service.send_message)
+            workers (int): Worker threads (and recipient shards)
+            rate (float): Messages per second for all workers together
+                (0 disables the limit)
+            burst (float, optional): Messages that may go out at once
+                after an idle period (default: one second's worth)
+            max_hold (float): Seconds a message is held while the WhatsApp
+                circuit breaker is open before it fails
+        """
+        self._send = send
+        self._max_hold = max_hold
+        self._bucket = TokenBucket(rate, burst)
+        self._queues = [queue.Queue() for _ in range(max(1, workers))]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._failures = deque(maxlen=_MAX_FAILURES)
+        self._latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._sent = 0
+        self._failed = 0
+        self._wait_seconds = 0.0
+        self._throttle_seconds = 0.0
+
+    def start(self):
+        """
+        Start the worker threads.
+        """
+        with self._lock:
+            if self._threads:
+                return
+            for shard, shard_queue in enumerate(self._queues):
+                thread = threading.Thread(
+                    target=self._run,
+                    args=(shard_queue,),
+                    name=f"outbound-{shard}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        """
+        Stop the workers after the messages already queued.
+        """
+        for shard_queue in self._queues:
+            shard_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._lock:
+            self._threads = []
+
+    def submit(self, phone_number, text, on_done=None, idempotency_key=None):
+        """
+        Queue a message. A message whose idempotency key is already queued
+        is not queued again: the queued one is returned, and on_done is
+        called with it when its send finishes.
+
+        Args:
+            phone_number (str): Recipient
+            text (str): Message text
+            on_done (callable, optional): on_done(message, result), called
+                from the worker after the send (success or failure)
+            idempotency_key (str, optional): Key passed to send (generated
+                if not provided)
+
+        Returns:
+            OutboundMessage: The queued message
+        """
+        message = OutboundMessage(phone_number, text, on_done, idempotency_key)
+        with self._lock:
+            queued = next(
+                (queued for queued in self._pending.values() if queued.idempotency_key == message.idempotency_key),
+                None
+            )
+            if queued is None:
+                self._pending[message.id] = message
+
+        if queued is not None:
+            # The future is resolved after the message leaves the pending
+            # list, so the callback runs even if the send just finished
+            if on_done is not None:
+                queued.future.add_done_callback(partial(self._call_on_done, on_done, queued))
+            return queued
+
+        self._queues[self._shard(phone_number)].put(message)
+        return message
+
+    @staticmethod
+    def _call_on_done(on_done, message, future):
+        try:
+            on_done(message, future.result())
+        except Exception as e:
+            print(f"[Outbound] Callback failed for {message.phone_number}: {e}")
+
+    def _shard(self, phone_number):
+        # Stable across processes (unlike hash()), so a shard's order is reproducible
+        return zlib.crc32(phone_number.encode('utf-8')) % len(self._queues)
+
+    def _run(self, shard_queue):
+        while True:
+            message = shard_queue.get()
+            if message is None:
+                return
+
+            self._throttle(self._bucket.acquire())
+
+            held = 0.0
+            while True:
+                started = time.perf_counter()
+                message.status = STATUS_SENDING
+                try:
+                    result = self._send(message.phone_number, message.text, idempotency_key=message.idempotency_key)
+                except Exception as e:
+                    result = {'success': False, 'error': f'Unexpected error: {e}'}
+                finished = time.perf_counter()
+
+                # WhatsApp is down (circuit breaker open): hold the message, and
+                # the ones queued behind it in this shard, until it recovers
+                if not result.get('circuit_open') or held >= self._max_hold:
+                    break
+                message.status = STATUS_HELD
+                delay = min(max(result.get('retry_in', 0), 0.5), self._max_hold - held)
+                time.sleep(delay)
+                held += delay
+
+            message.result = result
+
+            # Before the message leaves the pending list, so the chat view
+            # never shows it as neither sending nor saved
+            if message.on_done is not None:
+                try:
+                    message.on_done(message, result)
+                except Exception as e:
+                    print(f"[Outbound] Callback failed for {message.phone_number}: {e}")
+
+            message.status = STATUS_SENT if result.get('success') else STATUS_FAILED
+
+            with self._lock:
+                self._pending.pop(message.id, None)
+                self._latencies.append(finished - started)
+                self._wait_seconds += started - message._enqueued
+                if result.get('success'):
+                    self._sent += 1
+                else:
+                    self._failed += 1
+                    self._failures.append(message)
+
+            message.future.set_result(result)
+
+    def _throttle(self, seconds):
+        if seconds:
+            with self._lock:
+                self._throttle_seconds += seconds
+
+    def get_pending(self, phone_number=None):
+        """
+        Messages queued or being sent, oldest first.
+
+        Args:
+            phone_number (str, optional): Only messages to this recipient
+
+        Returns:
+            list: OutboundMessage objects
+        """
+        with self._lock:
+            messages = list(self._pending.values())
+        if phone_number is not None:
+            messages = [message for message in messages if message.phone_number == phone_number]
+        return sorted(messages, key=lambda message: message.id)
+
+    def get_failures(self, phone_number=None):
+        """
+        Recent failed sends, oldest first.
+
+        Returns:
+            list: OutboundMessage objects (result holds the error)
+        """
+        with self._lock:
+            failures = list(self._failures)
+        if phone_number is not None:
+            failures = [message for message in failures if message.phone_number == phone_number]
+        return failures
+
+    def dismiss_failure(self, message_id):
+        """
+        Forget a failed send (after the agent has seen it).
+        """
+        with self._lock:
+            self._failures = deque(
+                (message for message in self._failures if message.id != message_id),
+                maxlen=_MAX_FAILURES
+            )
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: queue_depth, in_flight, held, sent, failed, latency_avg_ms,
+                latency_p50_ms, latency_p95_ms, wait_avg_ms, throttled_s,
+                workers and rate
+        """
+        with self._lock:
+            pending = list(self._pending.values())
+            latencies = sorted(self._latencies)
+            sent = self._sent
+            failed = self._failed
+            wait_seconds = self._wait_seconds
+            throttle_seconds = self._throttle_seconds
+
+        def percentile(fraction):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+        done = sent + failed
+        return {
+            'queue_depth': sum(1 for message in pending if message.status == STATUS_QUEUED),
+            'in_flight': sum(1 for message in pending if message.status == STATUS_SENDING),
+            'held': sum(1 for message in pending if message.status == STATUS_HELD),
+            'sent': sent,
+            'failed': failed,
+            'latency_avg_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            'latency_p50_ms': percentile(0.5),
+            'latency_p95_ms': percentile(0.95),
+            'wait_avg_ms': wait_seconds / done * 1000 if done else 0.0,
+            'throttled_s': throttle_seconds,
+            'workers': len(self._queues),
+            'rate': self._bucket.rate
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def _create_outbound_dispatcher(workers, rate, burst, max_hold):
+    """
+    Create the process-wide dispatcher and start its workers once per server.
+    """
+    from services.whatsapp_service import send_message
+
+    dispatcher = OutboundDispatcher(send_message, workers=workers, rate=rate, burst=burst, max_hold=max_hold)
+    dispatcher.start()
+    return dispatcher
+
+
+def get_outbound_dispatcher():
+    """
+    Get the shared dispatcher (WHATSAPP_WORKERS, WHATSAPP_RATE_LIMIT,
+    WHATSAPP_BURST and WHATSAPP_BREAKER_HOLD settings).
+
+    Returns:
+        OutboundDispatcher: The shared dispatcher
+    """
+    return _create_outbound_dispatcher(
+        get_int_setting('WHATSAPP_WORKERS', 4),
+        get_float_setting('WHATSAPP_RATE_LIMIT', 80),
+        get_float_setting('WHATSAPP_BURST', 0) or None,
+        get_float_setting('WHATSAPP_BREAKER_HOLD', 300)
+    )
@@ -0,0 +1,390 @@
+"""
+Real-time Conversation Cache
+Process-wide in-memory copy of the conversations collection, kept current
+by Firestore snapshot listeners and shared by every Streamlit session.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+import streamlit as st
+from google.cloud import firestore
+from config.firebase import get_db
+from config.settings import get_bool_setting, get_int_setting
+from services.storage import STORAGE_FIRESTORE, get_storage_backend
+from services.firebase_service import (
+    SUMMARY_FIELDS,
+    CONVERSATION_BUCKETS,
+    get_conversation_bucket,
+    conversation_matches_filters,
+    MESSAGE_STORAGE_SUBCOLLECTION,
+    MESSAGES_SUBCOLLECTION
+)
+from services.usage import record
+
+
+# Oldest possible lastMessage, used to sort conversations without one
+_MIN_TIMESTAMP = datetime.min.replace(tzinfo=timezone.utc)
+
+
+class ConversationCache:
+    """
+    In-memory conversation summaries fed by an on_snapshot listener on the
+    `conversations` collection, plus tail-window listeners on the messages
+    subcollection of recently opened conversations.
+
+    The collection listener receives full documents (listeners do not support
+    field masks); only the summary fields are kept in memory.
+    """
+
+    def __init__(self, db, message_listeners=20, message_window=50, restart_interval=5):
+        """
+        Args:
+            db (firestore.Client): Firestore database client
+            message_listeners (int): Maximum number of open conversations
+                whose newest messages are kept in memory
+            message_window (int): Newest messages kept per conversation
+            restart_interval (int): Seconds between listener restart attempts
+        """
+        self._db = db
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._conversations = {}
+        self._embedded_counts = {}
+        self._watch = None
+        self._last_event = None
+        self._last_restart = 0
+        self._restart_interval = restart_interval
+
+        self._message_listeners = message_listeners
+        self._message_window = message_window
+        self._message_watches = {}
+        self._messages = {}
+        self._messages_ready = {}
+
+    def start(self):
+        """
+        Start (or restart) the collection listener.
+        """
+        with self._lock:
+            self._last_restart = time.monotonic()
+            old_watch = self._watch
+            self._watch = None
+
+        # Closing a watch joins its thread: never do it while holding the lock
+        _close_watches([old_watch])
+
+        watch = self._db.collection('conversations').on_snapshot(self._on_conversations)
+        with self._lock:
+            self._watch = watch
+        print("[Realtime Cache] Listening to conversations")
+
+    def _on_conversations(self, docs, changes, read_time):
+        """
+        Snapshot callback for the conversations collection.
+        """
+        # Listeners are billed one read per added or changed document
+        record('realtime_conversations', reads=len(changes))
+
+        with self._lock:
+            for change in changes:
+                phone = change.document.id
+                if change.type.name == 'REMOVED':
+                    self._conversations.pop(phone, None)
+                    self._embedded_counts.pop(phone, None)
+                    continue
+
+                data = change.document.to_dict() or {}
+                summary = {field: data[field] for field in SUMMARY_FIELDS if field in data}
+                summary['phone_number'] = phone
+                summary['messageStorage'] = data.get('messageStorage')
+                self._conversations[phone] = summary
+                self._embedded_counts[phone] = len(data.get('messages') or [])
+
+            self._last_event = datetime.now()
+        self._ready.set()
+
+    def _ensure_running(self):
+        """
+        Restart the collection listener if it dropped.
+        """
+        if self.is_connected():
+            return
+        if time.monotonic() - self._last_restart < self._restart_interval:
+            return
+        try:
+            self.start()
+        except Exception as e:
+            print(f"[Realtime Cache] Error restarting listener: {e}")
+
+    def is_connected(self):
+        """
+        Returns:
+            bool: True if the collection listener is active
+        """
+        watch = self._watch
+        return watch is not None and getattr(watch, 'is_active', True)
+
+    @property
+    def ready(self):
+        """
+        bool: True once the first snapshot arrived
+        """
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout=5):
+        """
+        Wait for the first snapshot.
+
+        Args:
+            timeout (float): Seconds to wait
+
+        Returns:
+            bool: True if the cache holds a snapshot
+        """
+        return self._ready.wait(timeout)
+
+    def get_status(self):
+        """
+        Get listener health for the staleness indicator.
+
+        Returns:
+            dict: Cache status
+                - ready (bool): True once the first snapshot arrived
+                - connected (bool): True if the listener is active
+                - stale (bool): True if the listener dropped after loading
+                - last_event (datetime): Time of the last snapshot, or None
+                - conversations (int): Number of cached conversations
+        """
+        connected = self.is_connected()
+        ready = self._ready.is_set()
+        return {
+            'ready': ready,
+            'connected': connected,
+            'stale': ready and not connected,
+            'last_event': self._last_event,
+            'conversations': len(self._conversations)
+        }
+
+    def list_conversations(self, filters=None):
+        """
+        List cached conversations, newest first.
+
+        Args:
+            filters (dict, optional): Same filter options as
+                firebase_service.get_all_conversations
+
+        Returns:
+            list: Conversation summary dictionaries, or None if not loaded
+        """
+        self._ensure_running()
+        if not self._ready.is_set():
+            return None
+
+        with self._lock:
+            conversations = [
+                dict(conv) for conv in self._conversations.values()
+                if conversation_matches_filters(conv, filters)
+            ]
+
+        conversations.sort(key=lambda c: c.get('lastMessage') or _MIN_TIMESTAMP, reverse=True)
+        return conversations
+
+    def count_buckets(self, search=None):
+        """
+        Count cached conversations per sidebar bucket.
+
+        Args:
+            search (str, optional): Phone number fragment to count matches for
+
+        Returns:
+            dict: Number of conversations per bucket, or None if not loaded
+        """
+        self._ensure_running()
+        if not self._ready.is_set():
+            return None
+
+        filters = {'search': search} if search else None
+        counts = {bucket: 0 for bucket in CONVERSATION_BUCKETS}
+        with self._lock:
+            for conv in self._conversations.values():
+                if not conversation_matches_filters(conv, filters):
+                    continue
+                bucket = get_conversation_bucket(conv)
+                counts[bucket] = counts.get(bucket, 0) + 1
+        return counts
+
+    def get_conversation(self, phone_number):
+        """
+        Get a cached conversation summary.
+
+        Args:
+            phone_number (str): Phone number (document ID)
+
+        Returns:
+            dict: Conversation summary, or None if unknown or not loaded
+        """
+        self._ensure_running()
+        if not self._ready.is_set():
+            return None
+
+        with self._lock:
+            conv = self._conversations.get(phone_number)
+            return dict(conv) if conv else None
+
+    def get_recent_messages(self, phone_number, limit):
+        """
+        Get the newest messages of a conversation from memory.
+        Only conversations fully stored in the messages subcollection are
+        served; the first call subscribes a tail-window listener.
+
+        Args:
+            phone_number (str): Phone number (document ID)
+            limit (int): Number of messages wanted
+
+        Returns:
+            dict: Same shape as firebase_service.get_messages_page, or None
+                if the window cannot be served from memory
+        """
+        if limit > self._message_window:
+            return None
+
+        with self._lock:
+            conv = self._conversations.get(phone_number)
+            if not conv or conv.get('messageStorage') != MESSAGE_STORAGE_SUBCOLLECTION:
+                return None
+            if self._embedded_counts.get(phone_number):
+                return None
+
+            evicted = []
+            if phone_number not in self._message_watches:
+                evicted = self._subscribe_messages(phone_number)
+
+            ready = self._messages_ready[phone_number]
+
+        _close_watches(evicted)
+
+        # Wait briefly for the first snapshot of a new listener
+        if not ready.wait(2):
+            return None
+
+        with self._lock:
+            messages = sorted(
+                self._messages.get(phone_number, {}).values(),
+                key=lambda m: m.get('timestamp') or _MIN_TIMESTAMP
+            )
+            total = conv.get('messageCount', len(messages))
+
+        window = messages[-limit:]
+        has_more = total > len(window)
+        return {
+            'messages': window,
+            'cursor': window[0].get('timestamp') if has_more and window else None,
+            'has_more': has_more
+        }
+
+    def _subscribe_messages(self, phone_number):
+        """
+        Start a tail-window listener for a conversation. Caller holds the lock.
+
+        Returns:
+            list: Evicted watches, to be closed once the lock is released
+        """
+        # Bounded: drop the oldest subscription first
+        evicted = []
+        while len(self._message_watches) >= self._message_listeners:
+            oldest = next(iter(self._message_watches))
+            evicted.append(self._message_watches.pop(oldest))
+            self._messages.pop(oldest, None)
+            self._messages_ready.pop(oldest, None)
+
+        ready = threading.Event()
+        self._messages[phone_number] = {}
+        self._messages_ready[phone_number] = ready
+
+        def on_messages(docs, changes, read_time):
+            record('realtime_messages', reads=len(changes))
+            with self._lock:
+                # Ignore late snapshots of an evicted listener
+                if self._messages_ready.get(phone_number) is not ready:
+                    return
+                self._messages[phone_number] = {doc.id: doc.to_dict() for doc in docs}
+            ready.set()
+
+        query = (
+            self._db.collection('conversations')
+            .document(phone_number)
+            .collection(MESSAGES_SUBCOLLECTION)
+            .order_by('timestamp', direction=firestore.Query.DESCENDING)
+            .limit(self._message_window)
+        )
+        self._message_watches[phone_number] = query.on_snapshot(on_messages)
+        return evicted
+
+    def stop(self):
+        """
+        Unsubscribe every listener.
+        """
+        with self._lock:
+            watches = list(self._message_watches.values())
+            if self._watch is not None:
+                watches.append(self._watch)
+            self._watch = None
+            self._message_watches = {}
+
+        _close_watches(watches)
+
+
+def _close_watches(watches):
+    """
+    Unsubscribe snapshot listeners, ignoring already closed ones.
+    """
+    for watch in watches:
+        if watch is None:
+            continue
+        try:
+            watch.unsubscribe()
+        except Exception:
+            pass
+
+
+@st.cache_resource
+def _create_realtime_cache():
+    """
+    Create the process-wide cache once per server, waiting (once) for its
+    first snapshot.
+
+    Returns:
+        ConversationCache: Started cache
+    """
+    cache = ConversationCache(
+        get_db(),
+        message_listeners=get_int_setting('REALTIME_MESSAGE_LISTENERS', 20)
+    )
+    cache.start()
+    cache.wait_until_ready(timeout=5)
+    return cache
+
+
+def get_realtime_cache():
+    """
+    Get the shared real-time cache, if enabled (REALTIME_CACHE setting).
+
+    Returns:
+        ConversationCache: The shared cache, or None if disabled, unavailable
+            or still waiting for its first snapshot (callers then query
+            Firestore)
+    """
+    if not get_bool_setting('REALTIME_CACHE', True):
+        return None
+
+    # Listeners need Firestore; other storage backends are read directly
+    if get_storage_backend() != STORAGE_FIRESTORE:
+        return None
+
+    try:
+        cache = _create_realtime_cache()
+        return cache if cache.ready else None
+    except Exception as e:
+        print(f"[Realtime Cache] Unavailable: {e}")
+        return None
@@ -0,0 +1,422 @@
+"""
+Message Search Index
+Local full-text index of message bodies (SQLite FTS5) with accent folding
+for Spanish text. Built incrementally from message writes and from a change
+feed over the messages subcollections, persisted to local disk.
+
+The change feed follows the server-set `updatedAt` of message documents, so
+it only sees the subcollection layout: messages stored in the legacy array
+(MESSAGE_STORAGE=array, or conversations not migrated yet) written outside
+the dashboard, and messages written before `updatedAt` existed, are indexed
+by `python3 build_search_index.py --rebuild`.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from datetime import datetime, timezone
+import streamlit as st
+from google.cloud import firestore
+from google.cloud.firestore_v1 import FieldFilter
+from config.settings import get_setting, get_bool_setting, get_int_setting
+from services.usage import add_reads, query_reads, track
+
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'search_index.db')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    message_id TEXT UNIQUE NOT NULL,
+    phone_number TEXT NOT NULL,
+    sender TEXT,
+    text TEXT,
+    timestamp REAL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_phone ON messages(phone_number);
+CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    body,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def fold_text(text):
+    """
+    Lowercase and strip accents ("Facturación" -> "facturacion"), so queries
+    match with or without tildes.
+
+    Args:
+        text (str): Text to fold
+
+    Returns:
+        str: Folded text
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def build_match_query(query):
+    """
+    Build an FTS5 MATCH expression: every term must appear, the last one
+    as a prefix (search-as-you-type).
+
+    Args:
+        query (str): Text typed by the agent
+
+    Returns:
+        str: MATCH expression, or None if the query has no terms
+    """
+    terms = [
+        ''.join(ch for ch in term if ch.isalnum())
+        for term in fold_text(query).split()
+    ]
+    terms = [term for term in terms if term]
+    if not terms:
+        return None
+
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _to_epoch(timestamp):
+    """
+    Convert a message timestamp to epoch seconds.
+    """
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, datetime):
+        # Firestore stores naive datetimes as UTC
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+    return float(timestamp)
+
+
+def _feed_head(db):
+    """
+    Newest entry of the change feed, read from the server, so a watermark
+    started from it does not depend on the local clock.
+
+    Returns:
+        tuple: (updatedAt in epoch seconds, document path), or (0.0, None)
+            if no message has `updatedAt` yet
+    """
+    query = db.collection_group('messages').order_by('updatedAt', direction=firestore.Query.DESCENDING)
+    with track('search_index_sync'):
+        docs = list(query.limit(1).stream())
+        add_reads(query_reads(len(docs)))
+    if not docs:
+        return 0.0, None
+    return _to_epoch(docs[0].get('updatedAt')), docs[0].reference.path
+
+
+class MessageSearchIndex:
+    """
+    Inverted index of message bodies. One SQLite connection shared by every
+    Streamlit session, serialized with a lock.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): SQLite database file (":memory:" for a temporary index)
+        """
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._last_sync_attempt = 0
+        self._syncing = False
+
+    def add_messages(self, phone_number, messages):
+        """
+        Index messages of one conversation. Already indexed message IDs are
+        skipped, so replays and overlapping syncs are harmless.
+
+        Args:
+            phone_number (str): Phone number (document ID)
+            messages (list): Message dictionaries (from, text, timestamp, messageId)
+
+        Returns:
+            int: Number of newly indexed messages
+        """
+        added = 0
+        with self._lock, self._conn:
+            for message in messages:
+                message_id = message.get('messageId')
+                text = message.get('text') or ''
+                if not message_id or not text:
+                    continue
+
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO messages (message_id, phone_number, sender, text, timestamp) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (message_id, phone_number, message.get('from'), text, _to_epoch(message.get('timestamp')))
+                )
+                if cursor.rowcount:
+                    self._conn.execute(
+                        'INSERT INTO messages_fts (rowid, body) VALUES (?, ?)',
+                        (cursor.lastrowid, fold_text(text))
+                    )
+                    added += 1
+        return added
+
+    def remove_conversation(self, phone_number):
+        """
+        Remove every indexed message of a conversation.
+
+        Args:
+            phone_number (str): Phone number (document ID)
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM messages_fts WHERE rowid IN (SELECT id FROM messages WHERE phone_number = ?)',
+                (phone_number,)
+            )
+            self._conn.execute('DELETE FROM messages WHERE phone_number = ?', (phone_number,))
+
+    def search(self, query, limit=20):
+        """
+        Find messages containing every term of the query, newest first.
+
+        Args:
+            query (str): Text typed by the agent (accents optional)
+            limit (int): Maximum number of results
+
+        Returns:
+            list: Matches with phone_number, from, text, timestamp (datetime)
+                and messageId
+        """
+        match = build_match_query(query)
+        if not match:
+            return []
+
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT m.phone_number, m.sender, m.text, m.timestamp, m.message_id '
+                'FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid '
+                'WHERE messages_fts MATCH ? '
+                'ORDER BY m.timestamp DESC LIMIT ?',
+                (match, limit)
+            ).fetchall()
+
+        return [
+            {
+                'phone_number': phone,
+                'from': sender,
+                'text': text,
+                'timestamp': datetime.fromtimestamp(ts, tz=timezone.utc) if ts is not None else None,
+                'messageId': message_id
+            }
+            for phone, sender, text, ts, message_id in rows
+        ]
+
+    def _get_meta(self, key, default=None):
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def sync(self, db, page_size=500, backfill=True):
+        """
+        Index messages written since the last sync, including those written
+        by the bot, with a collection-group query over every messages
+        subcollection (change feed ordered by the server-set `updatedAt`).
+
+        The watermark is the newest `updatedAt` seen. The next sync starts
+        at it inclusively (`>=`), so documents committed in the same instant
+        are not skipped; the ones already seen are ignored by document ID.
+
+        Args:
+            db (firestore.Client): Firestore database client
+            page_size (int): Documents per query page
+            backfill (bool): Without a watermark (never synced, never
+                rebuilt), read the whole feed. When False, the watermark
+                starts at the newest message on the server instead and
+                older messages are left to build_search_index.py.
+
+        Returns:
+            int: Number of newly indexed messages
+        """
+        with self._lock:
+            last_sync = self._get_meta('last_sync')
+            seen = set(filter(None, (self._get_meta('last_sync_ids') or '').split('\n')))
+
+        if last_sync is None and not backfill:
+            self._start_feed(db)
+            print("[Search Index] No previous sync: indexing new messages only "
+                  "(run build_search_index.py --rebuild for older ones)")
+            return 0
+
+        last_sync = float(last_sync or 0)
+        query = (
+            db.collection_group('messages')
+            .where(filter=FieldFilter('updatedAt', '>=', datetime.fromtimestamp(last_sync, tz=timezone.utc)))
+            .order_by('updatedAt', direction=firestore.Query.ASCENDING)
+        )
+
+        added = 0
+        last_doc = None
+        while True:
+            page = query.start_after(last_doc) if last_doc is not None else query
+            with track('search_index_sync'):
+                docs = list(page.limit(page_size).stream())
+                add_reads(query_reads(len(docs)))
+            if not docs:
+                break
+            last_doc = docs[-1]
+
+            by_phone = {}
+            for doc in docs:
+                data = doc.to_dict()
+                updated = _to_epoch(data.get('updatedAt'))
+                if updated is None:
+                    continue
+
+                # Same instant as the watermark: may have been indexed already
+                if updated == last_sync and doc.reference.path in seen:
+                    continue
+                if updated > last_sync:
+                    last_sync = updated
+                    seen = set()
+                seen.add(doc.reference.path)
+
+                phone = doc.reference.parent.parent.id
+                by_phone.setdefault(phone, []).append(data)
+
+            for phone, messages in by_phone.items():
+                added += self.add_messages(phone, messages)
+
+            with self._lock, self._conn:
+                self._set_meta('last_sync', last_sync)
+                self._set_meta('last_sync_ids', '\n'.join(sorted(seen)))
+
+            if len(docs) < page_size:
+                break
+
+        return added
+
+    def sync_if_due(self, db, interval):
+        """
+        Start a sync in a background thread, at most once every `interval`
+        seconds and never while another one runs, so a rerun never waits for
+        the change feed. The UI never backfills: an index that has never
+        synced starts following the feed from now (see sync).
+
+        Returns:
+            bool: True if a sync was started
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._syncing or now - self._last_sync_attempt < interval:
+                return False
+            self._last_sync_attempt = now
+            self._syncing = True
+
+        def run():
+            try:
+                added = self.sync(db, backfill=False)
+                if added:
+                    print(f"[Search Index] Indexed {added} new messages")
+            except Exception as e:
+                print(f"[Search Index] Error syncing: {e}")
+            finally:
+                self._syncing = False
+
+        threading.Thread(target=run, name="search-index-sync", daemon=True).start()
+        return True
+
+    def _start_feed(self, db):
+        """
+        Set the watermark to the newest message on the server (see
+        _feed_head): the next sync reads the messages written after it.
+        """
+        updated, path = _feed_head(db)
+        with self._lock, self._conn:
+            self._set_meta('last_sync', updated)
+            self._set_meta('last_sync_ids', path or '')
+
+    def rebuild(self, conversations, db):
+        """
+        Replace the index content with a full set of conversations.
+
+        Args:
+            conversations (iterable): Conversation dictionaries with
+                phone_number and messages, read lazily
+            db (firestore.Client): Firestore database client (the change
+                feed is followed from before the conversations are read)
+
+        Returns:
+            int: Number of indexed messages
+        """
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM messages_fts')
+            self._conn.execute('DELETE FROM messages')
+        self._start_feed(db)
+
+        total = 0
+        for conversation in conversations:
+            total += self.add_messages(conversation['phone_number'], conversation.get('messages', []))
+        return total
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Number of indexed messages and conversations
+        """
+        with self._lock:
+            messages, conversations = self._conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT phone_number) FROM messages'
+            ).fetchone()
+        return {
+            'messages': messages,
+            'conversations': conversations,
+            'path': self.path
+        }
+
+
+@st.cache_resource
+def _create_search_index(path):
+    """
+    Open the process-wide index once per server.
+    """
+    return MessageSearchIndex(path)
+
+
+def get_search_index():
+    """
+    Get the shared message search index, if enabled (SEARCH_INDEX setting).
+
+    Returns:
+        MessageSearchIndex: The shared index, or None if disabled or unavailable
+    """
+    if not get_bool_setting('SEARCH_INDEX', True):
+        return None
+
+    try:
+        return _create_search_index(get_setting('SEARCH_INDEX_PATH', DEFAULT_INDEX_PATH))
+    except Exception as e:
+        print(f"[Search Index] Unavailable: {e}")
+        return None
+
+
+def get_sync_interval():
+    """
+    Returns:
+        int: Seconds between change-feed syncs (SEARCH_INDEX_SYNC_INTERVAL)
+    """
+    return get_int_setting('SEARCH_INDEX_SYNC_INTERVAL', 30)
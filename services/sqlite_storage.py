@@ -0,0 +1,381 @@
+"""
+SQLite Storage
+Local conversation database for on-prem and offline deployments
+(STORAGE_BACKEND = "sqlite"). Conversations and messages live in two
+tables; the sidebar queries are answered from indexes on lastMessage,
+mode and status.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from services.firebase_service import (
+    CONVERSATION_BUCKETS,
+    build_message_preview,
+    normalize_phone_search
+)
+from services.storage import ConversationStorage
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    phone_number TEXT PRIMARY KEY,
+    phone_digits TEXT NOT NULL,
+    mode TEXT NOT NULL DEFAULT 'bot',
+    status TEXT NOT NULL DEFAULT 'active',
+    last_message REAL NOT NULL DEFAULT 0,
+    escalated_at REAL,
+    last_message_preview TEXT NOT NULL DEFAULT '',
+    last_message_from TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    unread INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_last_message
+    ON conversations(last_message DESC, phone_number DESC);
+CREATE INDEX IF NOT EXISTS idx_conversations_status_last_message
+    ON conversations(status, last_message DESC, phone_number DESC);
+CREATE INDEX IF NOT EXISTS idx_conversations_mode_last_message
+    ON conversations(mode, last_message DESC, phone_number DESC);
+CREATE INDEX IF NOT EXISTS idx_conversations_status_mode_last_message
+    ON conversations(status, mode, last_message DESC, phone_number DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    phone_number TEXT NOT NULL REFERENCES conversations(phone_number) ON DELETE CASCADE,
+    message_id TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    text TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    UNIQUE (phone_number, message_id)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_phone_timestamp
+    ON messages(phone_number, timestamp);
+"""
+
+# Firestore field name -> column
+_FIELD_COLUMNS = {
+    'mode': 'mode',
+    'status': 'status',
+    'lastMessage': 'last_message',
+    'escalatedAt': 'escalated_at',
+    'lastMessagePreview': 'last_message_preview',
+    'lastMessageFrom': 'last_message_from',
+    'messageCount': 'message_count',
+    'unread': 'unread'
+}
+
+_TIMESTAMP_FIELDS = {'lastMessage', 'escalatedAt'}
+
+_CONVERSATION_COLUMNS = 'phone_number, ' + ', '.join(_FIELD_COLUMNS.values())
+
+
+def _to_epoch(timestamp):
+    """
+    Convert a datetime to epoch seconds (naive datetimes are UTC, as in
+    Firestore).
+    """
+    if timestamp is None:
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def _from_epoch(seconds):
+    if seconds is None:
+        return None
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+def _phone_digits(phone_number):
+    return ''.join(ch for ch in phone_number if ch.isdigit())
+
+
+def _to_column_value(field, value):
+    if field in _TIMESTAMP_FIELDS:
+        return _to_epoch(value)
+    if field == 'unread':
+        return int(bool(value))
+    return value
+
+
+def _row_to_conversation(row):
+    """
+    Build a conversation dict (Firestore field names) from a row selected
+    with _CONVERSATION_COLUMNS.
+    """
+    conversation = {'phone_number': row[0]}
+    for (field, _), value in zip(_FIELD_COLUMNS.items(), row[1:]):
+        if field in _TIMESTAMP_FIELDS:
+            value = _from_epoch(value)
+        elif field == 'unread':
+            value = bool(value)
+        conversation[field] = value
+    return conversation
+
+
+def _row_to_message(row):
+    sender, text, timestamp, message_id = row
+    return {
+        'from': sender,
+        'text': text,
+        'timestamp': _from_epoch(timestamp),
+        'messageId': message_id
+    }
+
+
+def _bucket_clause(buckets):
+    """
+    SQL condition selecting the given sidebar buckets.
+
+    Returns:
+        tuple: (condition, params), or (None, []) if every bucket is selected
+    """
+    selected = set(buckets)
+    if selected >= set(CONVERSATION_BUCKETS):
+        return None, []
+
+    clauses = []
+    params = []
+    modes = sorted(selected & {'bot', 'human'})
+
+    if len(modes) == 2:
+        clauses.append("status = 'active'")
+    elif modes:
+        clauses.append("(status = 'active' AND mode = ?)")
+        params.append(modes[0])
+
+    if 'resolved' in selected:
+        clauses.append("status = 'resolved'")
+
+    if not clauses:
+        return '0', []
+    return '(' + ' OR '.join(clauses) + ')', params
+
+
+def _where_clause(filters):
+    """
+    Build the WHERE clause for the list filters.
+
+    Returns:
+        tuple: (sql, params); sql is empty when nothing is filtered
+    """
+    clauses = []
+    params = []
+    filters = filters or {}
+
+    if 'buckets' in filters:
+        clause, clause_params = _bucket_clause(filters['buckets'])
+        if clause:
+            clauses.append(clause)
+            params.extend(clause_params)
+
+    if filters.get('mode'):
+        clauses.append('mode = ?')
+        params.append(filters['mode'])
+
+    if filters.get('status'):
+        clauses.append('status = ?')
+        params.append(filters['status'])
+
+    search = normalize_phone_search(filters.get('search'))
+    if search:
+        clauses.append('phone_digits LIKE ?')
+        params.append(f'%{search}%')
+
+    if not clauses:
+        return '', params
+    return ' WHERE ' + ' AND '.join(clauses), params
+
+
+class SQLiteStorage(ConversationStorage):
+    """
+    Conversation storage in a local SQLite file. One connection shared by
+    every Streamlit session, serialized with a lock.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): SQLite database file (":memory:" for a temporary database)
+        """
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._conn.executescript(_SCHEMA)
+
+    def list_conversations(self, filters=None):
+        where, params = _where_clause(filters)
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {_CONVERSATION_COLUMNS} FROM conversations{where} '
+                'ORDER BY last_message DESC, phone_number DESC',
+                params
+            ).fetchall()
+        return [_row_to_conversation(row) for row in rows]
+
+    def list_conversations_page(self, filters=None, page_size=50, cursor=None):
+        """
+        Cursors are (last_message, phone_number) of the previous page's last row.
+        """
+        where, params = _where_clause(filters)
+
+        if cursor is not None:
+            last_message, phone_number = cursor
+            where += ' AND ' if where else ' WHERE '
+            where += '(last_message < ? OR (last_message = ? AND phone_number < ?))'
+            params += [last_message, last_message, phone_number]
+
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {_CONVERSATION_COLUMNS}, last_message FROM conversations{where} '
+                'ORDER BY last_message DESC, phone_number DESC LIMIT ?',
+                params + [page_size + 1]
+            ).fetchall()
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        return {
+            'conversations': [_row_to_conversation(row[:-1]) for row in rows],
+            'next_cursor': (rows[-1][-1], rows[-1][0]) if has_more and rows else None,
+            'has_more': has_more
+        }
+
+    def count_conversations(self, search=None):
+        where, params = _where_clause({'search': search})
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT CASE WHEN status = 'resolved' THEN 'resolved' "
+                "WHEN status = 'active' THEN mode END AS bucket, COUNT(*) "
+                f'FROM conversations{where} GROUP BY bucket',
+                params
+            ).fetchall()
+
+        counts = {bucket: 0 for bucket in CONVERSATION_BUCKETS}
+        for bucket, total in rows:
+            if bucket in counts:
+                counts[bucket] = total
+        return counts
+
+    def get_conversation(self, phone_number, include_messages=True):
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT {_CONVERSATION_COLUMNS} FROM conversations WHERE phone_number = ?',
+                (phone_number,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            conversation = _row_to_conversation(row)
+            if include_messages:
+                rows = self._conn.execute(
+                    'SELECT sender, text, timestamp, message_id FROM messages '
+                    'WHERE phone_number = ? ORDER BY timestamp, id',
+                    (phone_number,)
+                ).fetchall()
+                conversation['messages'] = [_row_to_message(row) for row in rows]
+
+        return conversation
+
+    def get_messages_page(self, phone_number, limit=50, before=None):
+        query = 'SELECT sender, text, timestamp, message_id FROM messages WHERE phone_number = ?'
+        params = [phone_number]
+        if before is not None:
+            query += ' AND timestamp < ?'
+            params.append(_to_epoch(before))
+
+        with self._lock:
+            rows = self._conn.execute(
+                query + ' ORDER BY timestamp DESC, id DESC LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+
+        has_more = len(rows) > limit
+        window = [_row_to_message(row) for row in reversed(rows[:limit])]
+
+        return {
+            'messages': window,
+            'cursor': window[0]['timestamp'] if has_more and window else None,
+            'has_more': has_more
+        }
+
+    def update_conversation(self, phone_number, fields, create=True):
+        columns = [_FIELD_COLUMNS[field] for field in fields]
+        values = [_to_column_value(field, value) for field, value in fields.items()]
+
+        with self._lock, self._conn:
+            if create:
+                assignments = ', '.join(f'{column} = excluded.{column}' for column in columns)
+                self._conn.execute(
+                    f'INSERT INTO conversations (phone_number, phone_digits, {", ".join(columns)}) '
+                    f'VALUES (?, ?, {", ".join("?" for _ in columns)}) '
+                    f'ON CONFLICT(phone_number) DO UPDATE SET {assignments}',
+                    [phone_number, _phone_digits(phone_number)] + values
+                )
+                return True
+
+            assignments = ', '.join(f'{column} = ?' for column in columns)
+            cursor = self._conn.execute(
+                f'UPDATE conversations SET {assignments} WHERE phone_number = ?',
+                values + [phone_number]
+            )
+            return cursor.rowcount > 0
+
+    def append_messages(self, phone_number, messages):
+        if not messages:
+            return []
+
+        written = []
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO conversations (phone_number, phone_digits, last_message) '
+                'VALUES (?, ?, ?)',
+                (phone_number, _phone_digits(phone_number), _to_epoch(messages[0]['timestamp']))
+            )
+
+            for message in messages:
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO messages (phone_number, message_id, sender, text, timestamp) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (phone_number, message['messageId'], message['from'], message.get('text') or '',
+                     _to_epoch(message['timestamp']))
+                )
+                if cursor.rowcount:
+                    written.append(message)
+
+            if written:
+                last = written[-1]
+                self._conn.execute(
+                    'UPDATE conversations SET last_message = ?, last_message_preview = ?, '
+                    'last_message_from = ?, unread = ?, message_count = message_count + ? '
+                    'WHERE phone_number = ?',
+                    (_to_epoch(last['timestamp']), build_message_preview(last.get('text', '')),
+                     last['from'], int(last['from'] == 'user'), len(written), phone_number)
+                )
+
+        return written
+
+    def delete_conversation(self, phone_number):
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM conversations WHERE phone_number = ?', (phone_number,))
+            return cursor.rowcount > 0
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Number of stored conversations and messages
+        """
+        with self._lock:
+            conversations = self._conn.execute('SELECT COUNT(*) FROM conversations').fetchone()[0]
+            messages = self._conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+        return {
+            'conversations': conversations,
+            'messages': messages,
+            'path': self.path
+        }
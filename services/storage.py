@@ -0,0 +1,153 @@
+"""
+Conversation Storage
+Interface for databases other than Firestore behind the firebase_service
+functions, and the accessor that picks the configured one.
+
+Firestore stays the default and is implemented directly in
+firebase_service (get_storage() returns None for it). Other backends
+implement ConversationStorage; the service functions keep validation,
+message building, cache invalidation and search indexing, and delegate
+the reads and writes.
+"""
+
+import os
+from abc import ABC, abstractmethod
+import streamlit as st
+from config.settings import get_setting
+
+
+STORAGE_FIRESTORE = 'firestore'
+STORAGE_SQLITE = 'sqlite'
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'dashboard.db')
+
+
+class ConversationStorage(ABC):
+    """
+    Reads and writes of conversations and messages. Methods raise on
+    errors; the firebase_service functions report them.
+
+    Conversations are returned with the same fields as Firestore documents
+    (mode, status, lastMessage, escalatedAt, lastMessagePreview,
+    lastMessageFrom, messageCount, unread and phone_number) and timestamps
+    as timezone-aware datetimes.
+    """
+
+    @abstractmethod
+    def list_conversations(self, filters=None):
+        """
+        Args:
+            filters (dict, optional): Same options as get_all_conversations
+
+        Returns:
+            list: Conversation summaries, newest first
+        """
+
+    @abstractmethod
+    def list_conversations_page(self, filters=None, page_size=50, cursor=None):
+        """
+        Args:
+            filters (dict, optional): Same options as get_all_conversations
+            page_size (int): Maximum number of conversations
+            cursor: `next_cursor` of the previous page (backend specific)
+
+        Returns:
+            dict: conversations, next_cursor and has_more
+        """
+
+    @abstractmethod
+    def count_conversations(self, search=None):
+        """
+        Args:
+            search (str, optional): Normalized phone number fragment
+
+        Returns:
+            dict: Number of conversations per bucket
+        """
+
+    @abstractmethod
+    def get_conversation(self, phone_number, include_messages=True):
+        """
+        Returns:
+            dict: Conversation (with messages, oldest first, if requested),
+                or None if not found
+        """
+
+    @abstractmethod
+    def get_messages_page(self, phone_number, limit=50, before=None):
+        """
+        Returns:
+            dict: messages (oldest first), cursor and has_more
+        """
+
+    @abstractmethod
+    def update_conversation(self, phone_number, fields, create=True):
+        """
+        Update summary fields of a conversation.
+
+        Args:
+            phone_number (str): Phone number
+            fields (dict): Field values (Firestore field names)
+            create (bool): Create the conversation if it does not exist
+
+        Returns:
+            bool: True if a conversation was updated or created
+        """
+
+    @abstractmethod
+    def append_messages(self, phone_number, messages):
+        """
+        Store new messages (already built, oldest first) and update the
+        conversation summary, creating the conversation if needed. Messages
+        whose messageId is already stored are skipped.
+
+        Returns:
+            list: The messages actually written
+        """
+
+    @abstractmethod
+    def delete_conversation(self, phone_number):
+        """
+        Returns:
+            bool: True if the conversation existed
+        """
+
+
+def get_storage_backend():
+    """
+    Returns:
+        str: Configured storage backend (STORAGE_BACKEND setting)
+    """
+    return str(get_setting('STORAGE_BACKEND', STORAGE_FIRESTORE)).strip().lower()
+
+
+@st.cache_resource(show_spinner=False)
+def _create_storage(backend, path):
+    """
+    Open the process-wide storage once per server.
+    """
+    if backend == STORAGE_SQLITE:
+        from services.sqlite_storage import SQLiteStorage
+
+        print(f"[Storage] Using SQLite database: {path}")
+        return SQLiteStorage(path)
+
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def get_storage():
+    """
+    Get the configured non-Firestore storage.
+    Unlike optional caches this never falls back silently: writes must not
+    go to a different database than the one configured.
+
+    Returns:
+        ConversationStorage: The shared storage, or None for Firestore
+
+    Raises:
+        ValueError: If STORAGE_BACKEND is unknown
+    """
+    backend = get_storage_backend()
+    if backend == STORAGE_FIRESTORE:
+        return None
+    return _create_storage(backend, get_setting('SQLITE_PATH', DEFAULT_SQLITE_PATH))
@@ -0,0 +1,300 @@
+"""
+Firestore Usage
+Counts the documents the service layer reads and writes (what Firestore
+bills) and times each call.
+
+Counters are kept at three levels:
+    - rerun: the collector bound with start_rerun() at the top of a
+      Streamlit rerun (propagated to coroutines with bind())
+    - session: reruns merged by app.py into st.session_state
+    - process: every call, including background threads (write queue,
+      real-time listeners); exported with write_metrics_file()
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+_FIELDS = ('calls', 'errors', 'cache_hits', 'reads', 'writes', 'seconds', 'max_seconds')
+
+_current = contextvars.ContextVar('firestore_usage', default=None)
+
+
+def query_reads(documents):
+    """
+    Reads billed for a query: one per returned document, and one for a
+    query that returns nothing.
+    """
+    return max(1, documents)
+
+
+def count_reads(total):
+    """
+    Reads billed for a count() aggregation: one per 1,000 index entries
+    matched, at least one.
+    """
+    return max(1, -(-total // 1000))
+
+
+class UsageStats:
+    """
+    Thread-safe per-operation counters: calls, errors, cache_hits, reads,
+    writes, seconds (total) and max_seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def record(self, operation, reads=0, writes=0, seconds=0.0, error=False, cache_hit=False):
+        """
+        Add one call to the counters of an operation.
+
+        Args:
+            operation (str): Operation name (service function)
+            reads (int): Documents read
+            writes (int): Documents written
+            seconds (float): Call duration
+            error (bool): The call raised
+            cache_hit (bool): Served from the read cache (no Firestore call)
+        """
+        with self._lock:
+            counters = self._operations.get(operation)
+            if counters is None:
+                counters = self._operations[operation] = dict.fromkeys(_FIELDS, 0)
+            if cache_hit:
+                counters['cache_hits'] += 1
+                return
+
+            counters['calls'] += 1
+            counters['errors'] += int(error)
+            counters['reads'] += reads
+            counters['writes'] += writes
+            counters['seconds'] += seconds
+            counters['max_seconds'] = max(counters['max_seconds'], seconds)
+
+    def merge(self, other):
+        """
+        Add the counters of another UsageStats to these.
+        """
+        for operation, counters in other.snapshot().items():
+            with self._lock:
+                mine = self._operations.get(operation)
+                if mine is None:
+                    mine = self._operations[operation] = dict.fromkeys(_FIELDS, 0)
+                for field in _FIELDS:
+                    if field == 'max_seconds':
+                        mine[field] = max(mine[field], counters[field])
+                    else:
+                        mine[field] += counters[field]
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: operation -> copy of its counters
+        """
+        with self._lock:
+            return {operation: dict(counters) for operation, counters in self._operations.items()}
+
+    def totals(self):
+        """
+        Returns:
+            dict: Counters summed over every operation
+        """
+        totals = dict.fromkeys(_FIELDS, 0)
+        for counters in self.snapshot().values():
+            for field in _FIELDS:
+                if field == 'max_seconds':
+                    totals[field] = max(totals[field], counters[field])
+                else:
+                    totals[field] += counters[field]
+        return totals
+
+
+# Every call made by this process
+_process = UsageStats()
+
+
+def get_process_usage():
+    """
+    Returns:
+        UsageStats: Process-wide counters
+    """
+    return _process
+
+
+def start_rerun():
+    """
+    Start counting a Streamlit rerun: calls made from this thread (and from
+    coroutines bound with bind) are added to the returned collector.
+
+    Returns:
+        UsageStats: Counters of this rerun
+    """
+    usage = UsageStats()
+    _current.set(usage)
+    return usage
+
+
+def current_usage():
+    """
+    Returns:
+        UsageStats: Collector of the running rerun, or None
+    """
+    return _current.get()
+
+
+def bind(usage):
+    """
+    Count the calls of the running coroutine (and the tasks it starts) in
+    a rerun's collector; used when work moves to the async loop thread.
+    """
+    _current.set(usage)
+
+
+def record(operation, **counters):
+    """
+    Add one call to the process counters and to the running rerun's.
+    Accepts the same keyword arguments as UsageStats.record.
+    """
+    _process.record(operation, **counters)
+    usage = _current.get()
+    if usage is not None:
+        usage.record(operation, **counters)
+
+
+class _Call:
+    """
+    Documents counted by the innermost tracked call (see track).
+    """
+
+    __slots__ = ('reads', 'writes')
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+
+
+_call = contextvars.ContextVar('firestore_call', default=None)
+
+
+def add_reads(documents=1):
+    """
+    Count documents read by the running tracked call.
+    """
+    call = _call.get()
+    if call is not None:
+        call.reads += documents
+
+
+def add_writes(documents=1):
+    """
+    Count documents written by the running tracked call.
+    """
+    call = _call.get()
+    if call is not None:
+        call.writes += documents
+
+
+@contextmanager
+def track(operation):
+    """
+    Time a block of Firestore calls and record the documents counted in it
+    with add_reads / add_writes (also from helpers it calls).
+
+    Usage:
+        with track('get_conversation'):
+            doc = doc_ref.get()
+            add_reads()
+
+    Args:
+        operation (str): Operation name (service function)
+    """
+    call = _Call()
+    token = _call.set(call)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _call.reset(token)
+        record(
+            operation,
+            reads=call.reads,
+            writes=call.writes,
+            seconds=time.perf_counter() - start,
+            error=error
+        )
+
+
+def format_prometheus(usage=None):
+    """
+    Render counters in the Prometheus text exposition format.
+
+    Args:
+        usage (UsageStats, optional): Counters to render (default: process)
+
+    Returns:
+        str: Metrics text
+    """
+    snapshot = (usage or _process).snapshot()
+    metrics = [
+        ('firestore_calls_total', 'counter', 'Firestore calls made by the dashboard', 'calls'),
+        ('firestore_call_errors_total', 'counter', 'Firestore calls that raised', 'errors'),
+        ('firestore_cache_hits_total', 'counter', 'Reads served from the read cache', 'cache_hits'),
+        ('firestore_document_reads_total', 'counter', 'Documents read (billed)', 'reads'),
+        ('firestore_document_writes_total', 'counter', 'Documents written (billed)', 'writes'),
+        ('firestore_call_seconds_total', 'counter', 'Time spent in Firestore calls', 'seconds'),
+        ('firestore_call_seconds_max', 'gauge', 'Slowest Firestore call', 'max_seconds'),
+    ]
+
+    lines = []
+    for name, kind, help_text, field in metrics:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for operation in sorted(snapshot):
+            lines.append(f'{name}{{operation="{operation}"}} {snapshot[operation][field]:g}')
+    return '\n'.join(lines) + '\n'
+
+
+_last_export = 0.0
+_export_lock = threading.Lock()
+
+
+def write_metrics_file(path, min_interval=0):
+    """
+    Write the process counters to a Prometheus textfile (node_exporter
+    textfile collector), replacing it atomically.
+
+    Args:
+        path (str): Output file (*.prom)
+        min_interval (float): Skip the write if the last one was more
+            recent than this many seconds
+
+    Returns:
+        bool: True if the file was written
+    """
+    global _last_export
+
+    with _export_lock:
+        now = time.monotonic()
+        if _last_export and now - _last_export < min_interval:
+            return False
+        _last_export = now
+
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(format_prometheus())
+        os.replace(temp_path, path)
+        return True
+    except Exception as e:
+        print(f"[Usage] Error writing metrics file {path}: {e}")
+        return False
@@ -5,8 +5,18 @@ Send messages via WhatsApp Cloud API.
 
 import requests
 import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import streamlit as st
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from config.settings import get_int_setting, get_float_setting
+from services.cache import TTLCache
 
 # Load environment variables
 load_dotenv()
@@ -27,20 +37,534 @@ except (FileNotFoundError, AttributeError):
 # WhatsApp Cloud API endpoint
 WHATSAPP_API_URL = f"https://graph.facebook.com/v18.0/{WHATSAPP_PHONE_ID}/messages"
 
+# HTTP statuses worth retrying: the API rejected the request without sending.
+# Other 5xx responses are treated like a read timeout: the gateway may have
+# failed after the message was accepted, so they are reported as ambiguous.
+RETRYABLE_STATUS_CODES = {429, 503}
+
+# Cloud API throttling error codes. The account-level ones pause every send
+# (see WhatsAppClient.pause); the others only delay the message that hit them.
+ACCOUNT_THROTTLE_CODES = {
+    4,          # API calls per app
+    80007,      # WhatsApp Business Account rate limit
+    130429,     # Cloud API messages per second
+}
+THROTTLE_CODES = ACCOUNT_THROTTLE_CODES | {
+    131048,     # Spam rate limit
+    131056,     # Too many messages to the same recipient
+}
+
+# Results of sends made with an idempotency key: a second send with the
+# same key returns the first result instead of delivering the message again
+_sent_by_key = TTLCache(
+    maxsize=get_int_setting('WHATSAPP_IDEMPOTENCY_SIZE', 10000),
+    ttl=get_float_setting('WHATSAPP_IDEMPOTENCY_TTL', 86400)
+)
+_sending_by_key = {}
+_idempotency_lock = threading.Lock()
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class WhatsAppClient:
+    """
+    WhatsApp Cloud API client on a keep-alive requests.Session.
+
+    Connections to graph.facebook.com are pooled and reused across sends
+    (and across Streamlit sessions, see get_whatsapp_client), so a reply
+    costs one HTTPS request instead of a new TCP + TLS handshake. The
+    session can be shared by several threads.
+    """
+
+    def __init__(self, token, api_url, pool_size=10, connect_timeout=3.05, read_timeout=10):
+        """
+        Args:
+            token (str): WhatsApp API access token
+            api_url (str): Messages endpoint
+            pool_size (int): Connections kept open (concurrent sends beyond
+                it open short-lived extra connections)
+            connect_timeout (float): Seconds to establish a connection
+            read_timeout (float): Seconds to wait for the API response
+        """
+        self.api_url = api_url
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        self._session = requests.Session()
+        self._session.headers.update({
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json'
+        })
+        # One host; retries are decided by the caller, not by urllib3
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount('https://', self._adapter)
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._retries = 0
+        self._seconds = 0.0
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        """
+        Hold every send for a while (account-level throttling).
+
+        Args:
+            seconds (float): Seconds from now
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def count_retry(self):
+        with self._lock:
+            self._retries += 1
+
+    def post_message(self, payload):
+        """
+        POST a message payload to the messages endpoint (after any pause
+        requested with pause()).
+
+        Args:
+            payload (dict): Cloud API message object
+
+        Returns:
+            requests.Response: API response
+
+        Raises:
+            requests.exceptions.RequestException: On timeouts and connection errors
+        """
+        with self._lock:
+            wait = self._paused_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+        start = time.perf_counter()
+        failed = False
+        try:
+            return self._session.post(self.api_url, json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self._requests += 1
+                self._errors += int(failed)
+                self._seconds += time.perf_counter() - start
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: requests, errors, retries, avg_ms, connections_opened,
+                connections_reused, pool_size and paused_s (seconds until
+                sends resume, 0 if not paused)
+        """
+        # urllib3 counts the connections each host pool had to open
+        pools = self._adapter.poolmanager.pools
+        opened = sum(pools[key].num_connections for key in pools.keys())
+
+        with self._lock:
+            requests_sent = self._requests
+            errors = self._errors
+            retries = self._retries
+            seconds = self._seconds
+            paused = max(0.0, self._paused_until - time.monotonic())
+
+        return {
+            'requests': requests_sent,
+            'errors': errors,
+            'retries': retries,
+            'avg_ms': seconds / requests_sent * 1000 if requests_sent else 0.0,
+            'connections_opened': opened,
+            'connections_reused': max(0, requests_sent - opened),
+            'pool_size': self.pool_size,
+            'paused_s': paused
+        }
+
+    def close(self):
+        self._session.close()
+
+
+@st.cache_resource(show_spinner=False)
+def _create_whatsapp_client(token, api_url, pool_size, connect_timeout, read_timeout):
+    """
+    Create the process-wide client once per server (per credentials).
+    """
+    return WhatsAppClient(
+        token,
+        api_url,
+        pool_size=pool_size,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout
+    )
+
+
+def get_whatsapp_client():
+    """
+    Get the shared WhatsApp client (WHATSAPP_POOL_SIZE,
+    WHATSAPP_CONNECT_TIMEOUT and WHATSAPP_READ_TIMEOUT settings).
+
+    Returns:
+        WhatsAppClient: The shared client
+    """
+    return _create_whatsapp_client(
+        WHATSAPP_TOKEN,
+        WHATSAPP_API_URL,
+        get_int_setting('WHATSAPP_POOL_SIZE', 10),
+        get_float_setting('WHATSAPP_CONNECT_TIMEOUT', 3.05),
+        get_float_setting('WHATSAPP_READ_TIMEOUT', 10)
+    )
+
+
+class CircuitBreaker:
+    """
+    Stops calling the WhatsApp API while it is failing, so sends fail at
+    once instead of each waiting out the timeout.
+
+    Closed: requests go through; `failure_threshold` consecutive failures
+    (errors, timeouts, 5xx, or responses slower than `slow_threshold`)
+    open the circuit. Open: requests are refused for `reset_timeout`
+    seconds, then the circuit is half-open: one probe request is let
+    through; it closes the circuit if it succeeds, or opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, slow_threshold=5.0, reset_timeout=30.0):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit
+            slow_threshold (float): Seconds above which a response counts as
+                a failure (0 disables)
+            reset_timeout (float): Seconds open before a probe is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.slow_threshold = slow_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._trips = 0
+        self._rejected = 0
+        self._last_error = None
+
+    def allow(self):
+        """
+        Ask to make a request.
+
+        Returns:
+            bool: False if the circuit is open (or a probe is already running)
+        """
+        with self._lock:
+            if self._state == CIRCUIT_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = CIRCUIT_HALF_OPEN
+                self._probing = False
+                print("[WhatsApp Service] Circuit half-open: probing the API")
+
+            if self._state == CIRCUIT_CLOSED:
+                return True
+            if self._state == CIRCUIT_HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+
+            self._rejected += 1
+            return False
+
+    def record_success(self, seconds):
+        """
+        Record an answered request (any non-5xx response).
+
+        Args:
+            seconds (float): Response time
+        """
+        if self.slow_threshold and seconds > self.slow_threshold:
+            self.record_failure(f'Slow response ({seconds:.1f}s)')
+            return
+
+        with self._lock:
+            if self._state != CIRCUIT_CLOSED:
+                print("[WhatsApp Service] Circuit closed: API recovered")
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, error=None):
+        """
+        Record a failed request; opens the circuit after too many in a row
+        (or when a half-open probe fails).
+
+        Args:
+            error (str, optional): Failure description, shown in get_state
+        """
+        with self._lock:
+            self._failures += 1
+            self._last_error = error
+            if self._state == CIRCUIT_HALF_OPEN or (
+                self._state == CIRCUIT_CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self._trips += 1
+                print(f"[WhatsApp Service] Circuit open after {self._failures} failures: {error}")
+
+    def retry_in(self):
+        """
+        Returns:
+            float: Seconds until a probe is allowed (0 if not open)
+        """
+        with self._lock:
+            if self._state != CIRCUIT_OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def get_state(self):
+        """
+        Returns:
+            dict: state (closed | open | half_open), consecutive_failures,
+                retry_in, trips, rejected and last_error
+        """
+        retry_in = self.retry_in()
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'retry_in': retry_in,
+                'trips': self._trips,
+                'rejected': self._rejected,
+                'last_error': self._last_error
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def _create_circuit_breaker(failure_threshold, slow_threshold, reset_timeout):
+    """
+    Create the process-wide circuit breaker once per server.
+    """
+    return CircuitBreaker(failure_threshold, slow_threshold, reset_timeout)
 
-def send_message(phone_number, text):
+
+def get_circuit_breaker():
+    """
+    Get the shared circuit breaker (WHATSAPP_BREAKER_FAILURES,
+    WHATSAPP_BREAKER_SLOW and WHATSAPP_BREAKER_RESET settings).
+
+    Returns:
+        CircuitBreaker: The shared breaker
+    """
+    return _create_circuit_breaker(
+        get_int_setting('WHATSAPP_BREAKER_FAILURES', 5),
+        get_float_setting('WHATSAPP_BREAKER_SLOW', 5),
+        get_float_setting('WHATSAPP_BREAKER_RESET', 30)
+    )
+
+
+def _retry_after(response):
+    """
+    Seconds requested by a Retry-After header (delta or HTTP date), or None.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number `attempt` (1-based): exponential
+    with full jitter, and never less than the server's Retry-After.
+    """
+    initial = get_float_setting('WHATSAPP_RETRY_INITIAL', 0.5)
+    maximum = get_float_setting('WHATSAPP_RETRY_MAX', 30)
+    delay = random.uniform(0, min(maximum, initial * 2 ** (attempt - 1)))
+    return max(delay, retry_after or 0)
+
+
+def _not_sent(error):
+    """
+    True if a connection error happened before the request was written, so
+    it can be retried without risking a duplicate message.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _post_with_retries(payload):
+    """
+    POST a message, retrying throttled (429 / throttling codes), 503 and
+    unsent requests with jittered exponential backoff.
+
+    Requests that may have reached WhatsApp (read timeouts, connections
+    dropped after sending, other 5xx responses) are never retried: the result is marked
+    `ambiguous`, since the message may have been delivered.
+
+    Nothing is sent while the circuit breaker is open: the result is
+    marked `circuit_open`, with `retry_in` seconds until the next probe.
+
+    Returns:
+        dict: send_message result, plus `attempts`
+    """
+    client = get_whatsapp_client()
+    breaker = get_circuit_breaker()
+    max_attempts = max(1, get_int_setting('WHATSAPP_MAX_ATTEMPTS', 4))
+    max_delay = get_float_setting('WHATSAPP_RETRY_MAX', 30)
+
+    for attempt in range(1, max_attempts + 1):
+        retry_after = None
+
+        if not breaker.allow():
+            return {
+                'success': False,
+                'error': 'WhatsApp API unavailable - circuit breaker open',
+                'circuit_open': True,
+                'retry_in': breaker.retry_in(),
+                'attempts': attempt - 1
+            }
+
+        start = time.perf_counter()
+        try:
+            response = client.post_message(payload)
+
+        except requests.exceptions.ConnectTimeout:
+            result = {'success': False, 'error': 'Connection timeout - Could not reach WhatsApp API'}
+            breaker.record_failure(result['error'])
+
+        except requests.exceptions.Timeout:
+            breaker.record_failure('Request timeout')
+            return {
+                'success': False,
+                'error': 'Request timeout - WhatsApp API did not respond in time (the message may have been delivered)',
+                'ambiguous': True,
+                'attempts': attempt
+            }
+
+        except requests.exceptions.ConnectionError as e:
+            breaker.record_failure('Connection error')
+            if not _not_sent(e):
+                return {
+                    'success': False,
+                    'error': 'Connection lost - WhatsApp API did not respond (the message may have been delivered)',
+                    'ambiguous': True,
+                    'attempts': attempt
+                }
+            result = {'success': False, 'error': 'Connection error - Could not reach WhatsApp API'}
+
+        except Exception as e:
+            # Never leave a half-open probe unanswered
+            breaker.record_failure(str(e))
+            raise
+
+        else:
+            if response.status_code >= 500:
+                breaker.record_failure(f'HTTP {response.status_code}')
+            else:
+                # Errors and throttling are answers: the API is up
+                breaker.record_success(time.perf_counter() - start)
+
+            if response.status_code == 200:
+                response_data = response.json()
+                message_id = response_data.get('messages', [{}])[0].get('id', '')
+                return {
+                    'success': True,
+                    'message_id': message_id,
+                    'phone_number': payload['to'],
+                    'attempts': attempt
+                }
+
+            try:
+                error = response.json().get('error', {})
+            except ValueError:
+                # Gateway errors may come back as HTML
+                error = {}
+
+            result = {
+                'success': False,
+                'error': error.get('message') or f'HTTP {response.status_code}',
+                'status_code': response.status_code,
+                'error_code': error.get('code')
+            }
+            retry_after = _retry_after(response)
+
+            if response.status_code >= 500 and response.status_code not in RETRYABLE_STATUS_CODES:
+                result['error'] += ' (the message may have been delivered)'
+                result['ambiguous'] = True
+                result['attempts'] = attempt
+                return result
+
+            if response.status_code not in RETRYABLE_STATUS_CODES and error.get('code') not in THROTTLE_CODES:
+                result['attempts'] = attempt
+                return result
+
+            # Every other send would be throttled too
+            if response.status_code == 429 or error.get('code') in ACCOUNT_THROTTLE_CODES:
+                client.pause(retry_after or _backoff(attempt))
+
+        result['attempts'] = attempt
+        if attempt == max_attempts:
+            return result
+        if retry_after is not None and retry_after > max_delay:
+            # Not worth holding a worker that long; the caller may resend later
+            result['retry_after'] = retry_after
+            return result
+
+        delay = _backoff(attempt, retry_after)
+        print(f"[WhatsApp Service] {result['error']} - retrying in {delay:.1f}s (attempt {attempt}/{max_attempts})")
+        client.count_retry()
+        time.sleep(delay)
+
+
+def _send_payload(payload):
+    """
+    Send a prepared payload and log the outcome.
+    """
+    # Send request to WhatsApp Cloud API (pooled connection)
+    print(f"[WhatsApp Service] Sending message to {payload['to']}...")
+    result = _post_with_retries(payload)
+
+    if result['success']:
+        print(f"[WhatsApp Service] Message sent successfully. ID: {result['message_id']}")
+    else:
+        print(f"[WhatsApp Service] Error sending message: {result['error']}")
+    return result
+
+
+def send_message(phone_number, text, idempotency_key=None):
     """
     Send a text message via WhatsApp Cloud API.
 
+    Throttled and failed requests are retried (see _post_with_retries).
+    With an idempotency key, a send repeated with the same key (a retried
+    job, a second click) returns the first send's result, marked
+    `duplicate`, instead of delivering the message again; concurrent sends
+    with the same key wait for the first one. The key is also sent as
+    `biz_opaque_callback_data`, so status webhooks can be matched to it.
+
     Args:
         phone_number (str): Recipient phone number (E.164 format, e.g., "+573001234567")
         text (str): Message text to send
+        idempotency_key (str, optional): Client-side key identifying this send
 
     Returns:
         dict: Response with success status and details
             - success (bool): True if message sent successfully
             - message_id (str): WhatsApp message ID if successful
             - error (str): Error message if failed
+            - ambiguous (bool): The request may have been delivered
+              (not retried)
+            - duplicate (bool): Result of an earlier send with the same key
+            - attempts (int): Requests made
     """
     try:
         # Validate inputs
@@ -70,12 +594,6 @@ def send_message(phone_number, text):
         if not clean_phone.startswith('+'):
             clean_phone = '+' + clean_phone
 
-        # Prepare request headers
-        headers = {
-            'Authorization': f'Bearer {WHATSAPP_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-
         # Prepare request payload
         payload = {
             'messaging_product': 'whatsapp',
@@ -88,52 +606,36 @@ def send_message(phone_number, text):
             }
         }
 
-        # Send request to WhatsApp Cloud API
-        print(f"[WhatsApp Service] Sending message to {clean_phone}...")
-        response = requests.post(
-            WHATSAPP_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
-
-        # Check response status
-        if response.status_code == 200:
-            response_data = response.json()
-            message_id = response_data.get('messages', [{}])[0].get('id', '')
-
-            print(f"[WhatsApp Service] Message sent successfully. ID: {message_id}")
-            return {
-                'success': True,
-                'message_id': message_id,
-                'phone_number': clean_phone
-            }
-        else:
-            error_data = response.json()
-            error_message = error_data.get('error', {}).get('message', 'Unknown error')
-
-            print(f"[WhatsApp Service] Error sending message: {error_message}")
-            return {
-                'success': False,
-                'error': error_message,
-                'status_code': response.status_code
-            }
-
-    except requests.exceptions.Timeout:
-        error_msg = 'Request timeout - WhatsApp API did not respond in time'
-        print(f"[WhatsApp Service] {error_msg}")
-        return {
-            'success': False,
-            'error': error_msg
-        }
-
-    except requests.exceptions.ConnectionError:
-        error_msg = 'Connection error - Could not reach WhatsApp API'
-        print(f"[WhatsApp Service] {error_msg}")
-        return {
-            'success': False,
-            'error': error_msg
-        }
+        if idempotency_key is None:
+            return _send_payload(payload)
+
+        payload['biz_opaque_callback_data'] = idempotency_key
+
+        with _idempotency_lock:
+            previous = _sent_by_key.get(idempotency_key)
+            sending = _sending_by_key.get(idempotency_key)
+            if previous is None and sending is None:
+                sending = _sending_by_key[idempotency_key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            print(f"[WhatsApp Service] Duplicate send {idempotency_key} to {clean_phone} not delivered again")
+            return dict(previous or sending.result(), duplicate=True)
+
+        result = None
+        try:
+            result = _send_payload(payload)
+        finally:
+            with _idempotency_lock:
+                # Definite failures are forgotten so the send can be tried again
+                if result is not None and (result['success'] or result.get('ambiguous')):
+                    _sent_by_key.set(idempotency_key, result)
+                del _sending_by_key[idempotency_key]
+            sending.set_result(result or {'success': False, 'error': 'Send interrupted'})
+
+        return result
 
     except Exception as e:
         error_msg = f'Unexpected error: {str(e)}'
@@ -144,6 +646,37 @@ def send_message(phone_number, text):
         }
 
 
+def send_broadcast(text, recipients=None, filters=None, broadcast_id=None, retry_failed=False):
+    """
+    Send a text message to many recipients (see services.broadcast).
+
+    Sends share the outbound dispatcher's rate limit with agent replies,
+    progress is checkpointed so calling again with the same broadcast_id
+    resumes where a crashed run stopped, and sent messages are written to
+    their conversations in batches.
+
+    Args:
+        text (str): Message text to send
+        recipients (list, optional): Recipient phone numbers
+        filters (dict, optional): Send to every conversation matching these
+            filters instead (same options as get_conversations_page)
+        broadcast_id (str, optional): Broadcast to resume
+        retry_failed (bool): On resume, send again to failed recipients
+
+    Returns:
+        dict: broadcast_id, recipients, sent, failed, saved, unsaved and pending counts
+    """
+    from services.broadcast import run_broadcast
+
+    return run_broadcast(
+        text,
+        recipients=recipients,
+        filters=filters,
+        broadcast_id=broadcast_id,
+        retry_failed=retry_failed
+    )
+
+
 def validate_phone_number(phone_number):
     """
     Validate phone number format.
@@ -206,6 +739,8 @@ def get_api_status():
             - configured (bool): True if credentials are set
             - token_set (bool): True if token is configured
             - phone_id_set (bool): True if phone ID is configured
+            - connection (dict): Connection pool stats (WhatsAppClient.get_stats)
+            - circuit (dict): Circuit breaker state (CircuitBreaker.get_state)
     """
     token_set = WHATSAPP_TOKEN and WHATSAPP_TOKEN != 'your_whatsapp_token'
     phone_id_set = WHATSAPP_PHONE_ID and WHATSAPP_PHONE_ID != 'your_phone_id'
@@ -213,5 +748,7 @@ def get_api_status():
     return {
         'configured': token_set and phone_id_set,
         'token_set': token_set,
-        'phone_id_set': phone_id_set
+        'phone_id_set': phone_id_set,
+        'connection': get_whatsapp_client().get_stats(),
+        'circuit': get_circuit_breaker().get_state()
     }
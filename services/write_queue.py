@@ -0,0 +1,520 @@
+"""
+Write-Behind Queue
+Durable local queue for conversation writes made from the dashboard. Agent
+actions are appended to an on-disk journal (SQLite) and return at once; a
+background worker applies them through firebase_service, one at a time and
+in order, retrying with backoff while Firestore is unreachable. Writes still
+in the journal after a restart are replayed when the queue starts.
+
+Only transient errors (Firestore unavailable, timeouts) are retried. A
+write that fails permanently (invalid data, permission denied, deleted
+conversation) or keeps failing past its attempt limit is moved to the
+dead-letter table, so it does not block the writes queued after it.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+import streamlit as st
+from config.settings import get_setting, get_bool_setting, get_float_setting, get_int_setting
+
+
+DEFAULT_QUEUE_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'write_queue.db')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS writes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation TEXT NOT NULL,
+    phone_number TEXT NOT NULL,
+    params TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS writes_phone ON writes (phone_number, operation);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY,
+    operation TEXT NOT NULL,
+    phone_number TEXT NOT NULL,
+    params TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    failed_at REAL NOT NULL
+);
+"""
+
+OP_ADD_MESSAGE = 'add_message'
+OP_UPDATE_MODE = 'update_conversation_mode'
+OP_MARK_READ = 'mark_conversation_read'
+
+# Best-effort writes, given up after fewer transient failures than the
+# WRITE_QUEUE_MAX_ATTEMPTS default
+_MAX_ATTEMPTS = {
+    OP_MARK_READ: 3
+}
+
+
+def _is_transient(error):
+    """
+    True if a failed write may succeed when retried as is.
+    """
+    from google.api_core.exceptions import RetryError
+    from services.firebase_service import RETRYABLE_ERRORS
+
+    return isinstance(error, RETRYABLE_ERRORS + (RetryError, ConnectionError, TimeoutError, sqlite3.OperationalError))
+
+
+def _encode(params):
+    """
+    Serialize operation parameters (datetimes as ISO strings).
+    """
+    return json.dumps({
+        key: {'$datetime': value.isoformat()} if isinstance(value, datetime) else value
+        for key, value in params.items()
+    })
+
+
+def _decode(raw):
+    return {
+        key: datetime.fromisoformat(value['$datetime']) if isinstance(value, dict) and '$datetime' in value else value
+        for key, value in json.loads(raw).items()
+    }
+
+
+def _apply(operation, phone_number, params):
+    """
+    Run one queued write against the database.
+
+    Returns:
+        bool: True if the write was applied
+    """
+    from services import firebase_service
+
+    if operation == OP_ADD_MESSAGE:
+        return firebase_service.add_message(
+            phone_number,
+            params['from'],
+            params['text'],
+            params['messageId'],
+            params['timestamp'],
+            raise_errors=True
+        )
+    if operation == OP_UPDATE_MODE:
+        return firebase_service.update_conversation_mode(phone_number, params['mode'], raise_errors=True)
+    if operation == OP_MARK_READ:
+        return firebase_service.mark_conversation_read(phone_number, raise_errors=True)
+
+    raise ValueError(f"Unknown queued operation: {operation}")
+
+
+class WriteBehindQueue:
+    """
+    Journal of pending writes plus the worker thread that drains it.
+    Writes are applied strictly in enqueue order: a write failing with a
+    transient error is retried (with exponential backoff) before any later
+    one runs, so a conversation never sees its writes reordered.
+    """
+
+    def __init__(self, path, retry_initial=1.0, retry_max=60.0, max_attempts=20):
+        """
+        Args:
+            path (str): SQLite journal file (":memory:" for a non-durable queue)
+            retry_initial (float): Seconds before the first retry of a failed write
+            retry_max (float): Maximum seconds between retries
+            max_attempts (int): Attempts before a write is dead-lettered
+        """
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self._retry_initial = retry_initial
+        self._retry_max = retry_max
+        self._max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # Every enqueue is on disk before the agent sees "sent"
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript(_SCHEMA)
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._applied = 0
+        self._retries = 0
+        self._dead = 0
+
+    def start(self):
+        """
+        Start the worker (replays writes left in the journal).
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+        pending = self.pending_count()
+        if pending:
+            print(f"[Write Queue] Replaying {pending} pending writes")
+
+    def stop(self, timeout=5):
+        """
+        Stop the worker. Pending writes stay in the journal.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def enqueue(self, operation, phone_number, **params):
+        """
+        Append a write to the journal and wake the worker.
+
+        Args:
+            operation (str): OP_* constant
+            phone_number (str): Conversation the write applies to
+            **params: Operation parameters (JSON values or datetimes)
+
+        Returns:
+            int: Journal ID of the write
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO writes (operation, phone_number, params, created_at) VALUES (?, ?, ?, ?)',
+                (operation, phone_number, _encode(params), time.time())
+            )
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def get_pending(self, phone_number=None):
+        """
+        List writes not applied yet, oldest first.
+
+        Args:
+            phone_number (str, optional): Only writes of this conversation
+
+        Returns:
+            list: Dictionaries with id, operation, phone_number, params,
+                attempts and last_error
+        """
+        query = 'SELECT id, operation, phone_number, params, attempts, last_error FROM writes'
+        params = ()
+        if phone_number is not None:
+            query += ' WHERE phone_number = ?'
+            params = (phone_number,)
+
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY id', params).fetchall()
+
+        return [
+            {
+                'id': write_id,
+                'operation': operation,
+                'phone_number': phone,
+                'params': _decode(raw),
+                'attempts': attempts,
+                'last_error': last_error
+            }
+            for write_id, operation, phone, raw, attempts, last_error in rows
+        ]
+
+    def discard(self, phone_number):
+        """
+        Drop the pending writes of a conversation (before deleting it, so
+        queued messages do not recreate it).
+
+        Returns:
+            int: Number of discarded writes
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM writes WHERE phone_number = ?', (phone_number,))
+        return cursor.rowcount
+
+    def has_pending(self, operation, phone_number):
+        """
+        True if a write of this operation for this conversation is queued.
+        """
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM writes WHERE phone_number = ? AND operation = ? LIMIT 1',
+                (phone_number, operation)
+            ).fetchone() is not None
+
+    def get_dead_letters(self):
+        """
+        Writes given up on, oldest first.
+
+        Returns:
+            list: Dictionaries with id, operation, phone_number, params,
+                attempts, last_error and failed_at
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, operation, phone_number, params, attempts, last_error, failed_at '
+                'FROM dead_letters ORDER BY id'
+            ).fetchall()
+
+        return [
+            {
+                'id': write_id,
+                'operation': operation,
+                'phone_number': phone,
+                'params': _decode(raw),
+                'attempts': attempts,
+                'last_error': last_error,
+                'failed_at': failed_at
+            }
+            for write_id, operation, phone, raw, attempts, last_error, failed_at in rows
+        ]
+
+    def requeue_dead_letters(self):
+        """
+        Move every dead-lettered write back to the end of the queue.
+
+        Returns:
+            int: Number of writes requeued
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO writes (operation, phone_number, params, created_at) '
+                'SELECT operation, phone_number, params, created_at FROM dead_letters ORDER BY id'
+            )
+            self._conn.execute('DELETE FROM dead_letters')
+        self._wakeup.set()
+        return cursor.rowcount
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM writes').fetchone()[0]
+
+    def get_status(self):
+        """
+        Returns:
+            dict: pending, applied, retries and dead_letters counters, last
+                error and whether the worker is running
+        """
+        with self._lock:
+            pending, last_error, dead_letters = self._conn.execute(
+                'SELECT COUNT(*), (SELECT last_error FROM writes ORDER BY id LIMIT 1), '
+                '(SELECT COUNT(*) FROM dead_letters) FROM writes'
+            ).fetchone()
+        return {
+            'pending': pending,
+            'dead_letters': dead_letters,
+            'applied': self._applied,
+            'retries': self._retries,
+            'last_error': last_error,
+            'running': self._thread is not None and self._thread.is_alive()
+        }
+
+    def _head(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT id, operation, phone_number, params FROM writes ORDER BY id LIMIT 1'
+            ).fetchone()
+
+    def _run(self):
+        delay = self._retry_initial
+
+        while not self._stop.is_set():
+            head = self._head()
+            if head is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            write_id, operation, phone_number, raw = head
+            try:
+                applied = _apply(operation, phone_number, _decode(raw))
+                error = None if applied else 'write failed'
+                transient = False
+            except Exception as e:
+                applied = False
+                error = f"{type(e).__name__}: {e}"
+                transient = _is_transient(e)
+
+            if applied:
+                with self._lock, self._conn:
+                    self._conn.execute('DELETE FROM writes WHERE id = ?', (write_id,))
+                self._applied += 1
+                delay = self._retry_initial
+                continue
+
+            with self._lock, self._conn:
+                self._conn.execute(
+                    'UPDATE writes SET attempts = attempts + 1, last_error = ? WHERE id = ?',
+                    (error, write_id)
+                )
+                attempts = self._conn.execute('SELECT attempts FROM writes WHERE id = ?', (write_id,)).fetchone()[0]
+
+                if not transient or attempts >= _MAX_ATTEMPTS.get(operation, self._max_attempts):
+                    self._conn.execute(
+                        'INSERT INTO dead_letters (id, operation, phone_number, params, created_at, attempts, last_error, failed_at) '
+                        'SELECT id, operation, phone_number, params, created_at, attempts, last_error, ? FROM writes WHERE id = ?',
+                        (time.time(), write_id)
+                    )
+                    self._conn.execute('DELETE FROM writes WHERE id = ?', (write_id,))
+                    self._dead += 1
+                    print(f"[Write Queue] Gave up on {operation} for {phone_number} after {attempts} attempts: {error}")
+                    delay = self._retry_initial
+                    continue
+
+            self._retries += 1
+            print(f"[Write Queue] {operation} for {phone_number} failed, retrying in {delay:g}s: {error}")
+
+            self._stop.wait(delay)
+            delay = min(delay * 2, self._retry_max)
+
+
+@st.cache_resource(show_spinner=False)
+def _create_write_queue(path):
+    """
+    Open the process-wide queue and start its worker once per server.
+    """
+    queue = WriteBehindQueue(
+        path,
+        retry_initial=get_float_setting('WRITE_QUEUE_RETRY_INITIAL', 1.0),
+        retry_max=get_float_setting('WRITE_QUEUE_RETRY_MAX', 60.0),
+        max_attempts=get_int_setting('WRITE_QUEUE_MAX_ATTEMPTS', 20)
+    )
+    queue.start()
+    return queue
+
+
+def get_write_queue():
+    """
+    Get the shared write-behind queue, if enabled (WRITE_QUEUE setting).
+
+    Returns:
+        WriteBehindQueue: The shared queue, or None if disabled or unavailable
+    """
+    if not get_bool_setting('WRITE_QUEUE', True):
+        return None
+
+    try:
+        return _create_write_queue(get_setting('WRITE_QUEUE_PATH', DEFAULT_QUEUE_PATH))
+    except Exception as e:
+        print(f"[Write Queue] Unavailable: {e}")
+        return None
+
+
+def queue_add_message(phone_number, from_type, text, message_id=None):
+    """
+    Add a message through the write-behind queue (directly if the queue is
+    disabled). The message ID and timestamp are fixed at enqueue time, so a
+    replay after a crash stores the same message once.
+
+    Args:
+        phone_number (str): Phone number (document ID)
+        from_type (str): "user" | "bot" | "human"
+        text (str): Message text
+        message_id (str, optional): WhatsApp message ID (auto-generated if not provided)
+
+    Returns:
+        bool: True if the message was queued or written
+    """
+    from services.firebase_service import add_message
+
+    if from_type not in ['user', 'bot', 'human']:
+        print(f"[Write Queue] Invalid from_type: {from_type}")
+        return False
+
+    message_id = message_id or str(uuid.uuid4())
+    timestamp = datetime.now()
+
+    queue = get_write_queue()
+    if queue is None:
+        return add_message(phone_number, from_type, text, message_id, timestamp)
+
+    queue.enqueue(OP_ADD_MESSAGE, phone_number, **{
+        'from': from_type,
+        'text': text,
+        'messageId': message_id,
+        'timestamp': timestamp
+    })
+    return True
+
+
+def queue_update_conversation_mode(phone_number, mode):
+    """
+    Change the conversation mode through the write-behind queue (directly
+    if the queue is disabled).
+
+    Args:
+        phone_number (str): Phone number (document ID)
+        mode (str): "bot" or "human"
+
+    Returns:
+        bool: True if the change was queued or written
+    """
+    from services.firebase_service import update_conversation_mode
+
+    if mode not in ['bot', 'human']:
+        print(f"[Write Queue] Invalid mode: {mode}. Must be 'bot' or 'human'")
+        return False
+
+    queue = get_write_queue()
+    if queue is None:
+        return update_conversation_mode(phone_number, mode)
+
+    queue.enqueue(OP_UPDATE_MODE, phone_number, mode=mode)
+    return True
+
+
+def queue_mark_conversation_read(phone_number):
+    """
+    Clear the unread flag through the write-behind queue (directly if the
+    queue is disabled).
+
+    Returns:
+        bool: True if the change was queued or written
+    """
+    from services.firebase_service import mark_conversation_read
+
+    queue = get_write_queue()
+    if queue is None:
+        return mark_conversation_read(phone_number)
+
+    # Reruns see the stale unread flag until the queued change is applied
+    if not queue.has_pending(OP_MARK_READ, phone_number):
+        queue.enqueue(OP_MARK_READ, phone_number)
+    return True
+
+
+def get_pending_view(phone_number):
+    """
+    Pending writes of a conversation, shaped for the chat view.
+
+    Args:
+        phone_number (str): Phone number (document ID)
+
+    Returns:
+        dict: messages (queued messages, oldest first) and mode (the
+            latest queued mode change, or None)
+    """
+    queue = get_write_queue()
+    view = {'messages': [], 'mode': None}
+    if queue is None:
+        return view
+
+    for write in queue.get_pending(phone_number):
+        params = write['params']
+        if write['operation'] == OP_ADD_MESSAGE:
+            view['messages'].append({
+                'from': params['from'],
+                'text': params['text'],
+                'timestamp': params['timestamp'],
+                'messageId': params['messageId'],
+                'pending': True
+            })
+        elif write['operation'] == OP_UPDATE_MODE:
+            view['mode'] = params['mode']
+
+    return view
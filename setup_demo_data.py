@@ -4,9 +4,7 @@ Setup Demo Data Script
 Creates sample conversations to test the dashboard.
 """
 
-from services.firebase_service import add_message, update_conversation_mode, mark_resolved
-from datetime import datetime
-import time
+from services.firebase_service import add_messages, update_conversation_mode, mark_resolved
 
 
 def create_demo_conversations():
@@ -27,9 +25,7 @@ def create_demo_conversations():
         ('bot', 'Te recomiendo:\n1. Montañas nevadas - $45.000\n2. Playa tropical - $42.000'),
     ]
 
-    for from_type, text in messages1:
-        add_message(phone1, from_type, text)
-        time.sleep(0.1)
+    add_messages(phone1, [{'from': from_type, 'text': text} for from_type, text in messages1])
 
     print(f"   ✓ Added {len(messages1)} messages")
 
@@ -43,9 +39,7 @@ def create_demo_conversations():
         ('user', 'Ok, gracias'),
     ]
 
-    for from_type, text in messages2:
-        add_message(phone2, from_type, text)
-        time.sleep(0.1)
+    add_messages(phone2, [{'from': from_type, 'text': text} for from_type, text in messages2])
 
     # Escalate to human
     update_conversation_mode(phone2, 'human')
@@ -65,9 +59,7 @@ def create_demo_conversations():
         ('human', 'Hola! El envío a Medellín demora 2-3 días hábiles y tiene un costo de $8.000'),
     ]
 
-    for from_type, text in messages3:
-        add_message(phone3, from_type, text)
-        time.sleep(0.1)
+    add_messages(phone3, [{'from': from_type, 'text': text} for from_type, text in messages3])
 
     update_conversation_mode(phone3, 'human')
     print(f"   ✓ Added {len(messages3)} messages")
@@ -84,9 +76,7 @@ def create_demo_conversations():
         ('bot', 'De nada! Cualquier cosa estamos para ayudarte'),
     ]
 
-    for from_type, text in messages4:
-        add_message(phone4, from_type, text)
-        time.sleep(0.1)
+    add_messages(phone4, [{'from': from_type, 'text': text} for from_type, text in messages4])
 
     mark_resolved(phone4)
     print(f"   ✓ Added {len(messages4)} messages")